@@ -1,11 +1,50 @@
 import json
 from unicodedata import category
-from uuid import uuid1
+import tokens
 
 from config import config_to_trans
 from export_utils import *
-from export_utils_nuscenes import append_json, extend_json, get_quaternion_from_euler
-from data_utils import camera_intrinsic
+from export_utils_nuscenes import get_quaternion_from_euler, SCENE_NAME, CAN_BUS_FILE, can_bus_id
+from table_writer import TableWriter
+from async_writer import AsyncWriter
+from shard_writer import ShardWriter, count_samples
+from columnar_export import ColumnarExporter
+from metrics import metrics
+from rig_calibration import RigCalibration
+
+class AgentStream:
+    """
+    一个 agent 当前场景的记录状态：每个 agent 有各自的 scene、sample、sample_data、sample_annotation 和
+    instance 链，同一时刻的 K 个 agent 生成 K 个 sample
+    """
+    def __init__(self, scene_id, num_sensors):
+        # the tokens of the records follow from the scene id, the sample index and the sensor or actor, see tokens.py
+        self.scene_id = scene_id
+        self.prev_sample_token = ""
+        self.sample_token = tokens.record_token(tokens.SAMPLE, scene_id, 0)
+        self.samples = []
+        self.next_sample_token = tokens.record_token(tokens.SAMPLE, scene_id, 1)
+        self.instances = {}
+        self.annos = []
+        self.sample_datas = []
+        self.ego_pose = None
+        self.ego_poses = []
+        self.can_bus_rows = []
+        # the prev/next chains of samples, sample_datas and annotations are linked inside a scene,
+        # records of the current scene are kept by token and written in save_scene once complete
+        self.records = {}
+        self.last_sample_data_tokens = ["" for _ in range(num_sensors)]
+        self.can_bus_id = can_bus_id(scene_id)
+
+        self.scene = {
+            "token": tokens.record_token(tokens.SCENE, scene_id),
+            "name": SCENE_NAME.format(scene_id),
+            "description": "",
+            "nbr_samples": 0,
+            "first_sample_token": self.sample_token,
+            "last_sample_token": ""
+        }
+
 
 class DataSave:
     def __init__(self, cfg):
@@ -18,12 +57,37 @@ class DataSave:
         # self.CALIBRATION_PATH = None
         self.CAN_BUS_PATH = None
         self.ROOT_PATH = self.cfg["SAVE_CONFIG"]["ROOT_PATH"]
+        self.IMAGE_FORMAT, self.IMAGE_PARAMS = image_codec(self.cfg["SAVE_CONFIG"])
+        # files: nuscenes layout, shards: tar shards only, both: the two layouts
+        self.OUTPUT_MODE = self.cfg["SAVE_CONFIG"]["OUTPUT_MODE"]
+        assert self.OUTPUT_MODE in ("files", "shards", "both"), "Unsupported OUTPUT_MODE {}".format(self.OUTPUT_MODE)
+        # image and lidar files are written by background threads
+        self.writer = AsyncWriter(self.cfg["SAVE_CONFIG"]["WRITER_THREADS"],
+                                  self.cfg["SAVE_CONFIG"]["WRITER_QUEUE_DEPTH"])
+        # a single thread appends the encoded samples to the shards in order
+        self.shard_queue = AsyncWriter(1, self.cfg["SAVE_CONFIG"]["WRITER_QUEUE_DEPTH"])
         self.generate_path(self.ROOT_PATH)
-        self.captured_frame_id = self.current_captured_frame_num()
+        num_existing_data_files = self.current_captured_frame_num()
+        # farm workers record disjoint ranges of frame and scene ids
+        self.captured_frame_id = self.cfg["SAVE_CONFIG"]["FIRST_FRAME_ID"] + num_existing_data_files
+        # (O)verwrite replaces the tables and removes the shards of the previous run, (A)ppend continues them
+        self.tables = TableWriter(self.TABLE_ROOT, [
+            "ego_pose",
+            "scene",
+            "sample",
+            "sample_data",
+            "sample_annotation",
+            "instance",
+        ], append=num_existing_data_files > 0)
+        if self.OUTPUT_MODE != "files":
+            self.shards = ShardWriter(self.SHARD_FOLDER, self.cfg["SAVE_CONFIG"]["SHARD_SIZE_MB"] * 2 ** 20,
+                                      append=num_existing_data_files > 0)
         # Nuscenes
-        self.scene_id = 0
+        self.scene_id = self.cfg["SAVE_CONFIG"]["FIRST_SCENE_ID"]
         self.sample_id = 0
-        self.instances = {}
+        # every agent records its own scenes, see AgentStream
+        self.NUM_AGENTS = self.cfg["AGENT_CONFIG"]["NUM_AGENTS"]
+        self.streams = []
         self.save_calibrated_sensors(cfg)
         self.save_category(cfg)
 
@@ -34,13 +98,12 @@ class DataSave:
         VERSION = "mini"
         self.OUTPUT_FOLDER = os.path.join(root_path, PHASE)
         folders = ['image', 'velodyne', 'can_bus', VERSION]
-        cams = ['CAM_BACK', 'CAM_BACK_RIGHT', 'CAM_FRONT_RIGHT', 'CAM_FRONT', 'CAM_FRONT_LEFT', 'CAM_BACK_LEFT']
 
         for folder in folders:
             directory = os.path.join(self.OUTPUT_FOLDER, folder)
             if not os.path.exists(directory):
                 os.makedirs(directory)
-        for cam in cams:
+        for cam in CAMS:
             directory = os.path.join(self.OUTPUT_FOLDER, 'image', cam)
             if not os.path.exists(directory):
                 os.makedirs(directory)
@@ -48,30 +111,24 @@ class DataSave:
         self.LIDAR_PATH = os.path.join(self.OUTPUT_FOLDER, 'velodyne/{0:06}.bin')
         # self.KITTI_LABEL_PATH = os.path.join(self.OUTPUT_FOLDER, 'kitti_label/{0:06}.txt')
         # self.CARLA_LABEL_PATH = os.path.join(self.OUTPUT_FOLDER, 'carla_label/{0:06}.txt')
-        self.IMAGE_PATH = os.path.join(self.OUTPUT_FOLDER, 'image/{0}/{1:06}.png')
+        self.IMAGE_PATH = os.path.join(self.OUTPUT_FOLDER, 'image/{0}/{1:06}.' + self.IMAGE_FORMAT)
         # self.CALIBRATION_PATH = os.path.join(self.OUTPUT_FOLDER, 'calib/{0:06}.txt')
         # Nuscenes
-        self.CAN_BUS_PATH = os.path.join(self.OUTPUT_FOLDER, 'can_bus/scene_{0:06}.txt')
+        self.CAN_BUS_PATH = os.path.join(self.OUTPUT_FOLDER, 'can_bus', CAN_BUS_FILE)
+        # the shard writer is opened once the dataset is overwritten or appended, see __init__
+        self.SHARD_FOLDER = os.path.join(self.OUTPUT_FOLDER, 'shards')
+        self.shards = None
+        self.columnar = None
+        if self.cfg["SAVE_CONFIG"]["COLUMNAR_EXPORT"]:
+            self.columnar = ColumnarExporter(os.path.join(self.OUTPUT_FOLDER, 'columnar'),
+                                             self.cfg["SAVE_CONFIG"]["COLUMNAR_FORMAT"])
         self.SENSORS_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'sensor.json')
         self.CALIBRATED_SENSORS_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'calibrated_sensor.json')
-        self.EGO_POSE_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'ego_pose.json')
         self.CATE_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'category.json')
-        self.SCENE_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'scene.json')
-        self.SAMPLE_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'sample.json')
-        self.SAMPLE_DATA_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'sample_data.json')
-        self.SAMPLE_ANNO_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'sample_annotation.json')
-        self.INSTANCE_PATH = os.path.join(self.OUTPUT_FOLDER, VERSION, 'instance.json')
-        # create empty jsons
-        for file in [
-            self.EGO_POSE_PATH, 
-            self.SCENE_PATH, 
-            self.SAMPLE_PATH, 
-            self.SAMPLE_DATA_PATH,
-            self.SAMPLE_ANNO_PATH,
-            self.INSTANCE_PATH, 
-        ]:
-            with open(file, "w") as f:
-                json.dump([], f)
+        # tables growing during collection are streamed to append-only logs and materialised as json arrays
+        # in close(), the writer is opened once the dataset is overwritten or appended, see __init__
+        self.TABLE_ROOT = os.path.join(self.OUTPUT_FOLDER, VERSION)
+        self.tables = None
 
     def save_category(self, cfg):
         categorys = []
@@ -91,11 +148,12 @@ class DataSave:
         sensors = []
         calibrations = []
         self.last_sample_data_tokens = []
-        for s in cfg["SENSOR_CONFIG"]:
-            sensor_token = uuid1().hex
-            calib_token = uuid1().hex
-            channel = s
-            modality = cfg["SENSOR_CONFIG"][s]["BLUEPRINT"].split(".")[1]
+        # the calibration used by SynchronyModel and objects_filter
+        for i, s in enumerate(RigCalibration.from_cfg(cfg).recorded):
+            sensor_token = tokens.record_token(tokens.SENSOR, item=i)
+            calib_token = tokens.record_token(tokens.CALIBRATED_SENSOR, item=i)
+            channel = s.name
+            modality = s.modality
             sensor = {
                 "token": sensor_token,
                 "calib_token": calib_token, # TODO for convenience
@@ -103,25 +161,22 @@ class DataSave:
                 "modality": modality
             }
             if modality == "camera":
-                width = cfg["SENSOR_CONFIG"][s]["ATTRIBUTE"]["image_size_x"]
-                height = cfg["SENSOR_CONFIG"][s]["ATTRIBUTE"]["image_size_y"]
-                fov = cfg["SENSOR_CONFIG"][s]["ATTRIBUTE"]["fov"]
                 # TODO automatic extrinsic calculation
                 # rotation = cfg["SENSOR_CONFIG"][s]["TRANSFORM"]["quat"]
                 # euler = cfg["SENSOR_CONFIG"][s]["TRANSFORM"]["rotation"]
                 # rotation = get_quaternion_from_euler(euler[0], euler[1], euler[2], to_rad=True)
-                intrinsic = camera_intrinsic(width, height, fov).tolist()
-                sensor["width"] = width
-                sensor["height"] = height
+                intrinsic = s.intrinsic.tolist()
+                sensor["width"] = s.width
+                sensor["height"] = s.height
             else:
                 intrinsic = []
-            rotation = cfg["SENSOR_CONFIG"][s]["TRANSFORM"]["quat"]
+            rotation = s.rotation
             # euler = cfg["SENSOR_CONFIG"][s]["TRANSFORM"]["rotation"]
             # rotation = get_quaternion_from_euler(*euler, to_rad=True)
             calibration = {
                 "token": calib_token,
                 "sensor_token": sensor_token,
-                "translation": cfg["SENSOR_CONFIG"][s]["TRANSFORM"]["location"],
+                "translation": s.translation,
                 "rotation": rotation,
                 "camera_intrinsic": intrinsic
             }
@@ -141,6 +196,8 @@ class DataSave:
         label_path = os.path.join(self.OUTPUT_FOLDER, 'velodyne/')
         num_existing_data_files = len(
             [name for name in os.listdir(label_path) if name.endswith('.bin')])
+        if self.OUTPUT_MODE != "files":
+            num_existing_data_files = max(num_existing_data_files, count_samples(self.SHARD_FOLDER))
         print("当前存在{}个数据".format(num_existing_data_files))
         if num_existing_data_files == 0:
             return 0
@@ -155,7 +212,7 @@ class DataSave:
             num_existing_data_files))
         return num_existing_data_files
 
-    def save_ego_pose_data(self, filename, pose):
+    def save_ego_pose_data(self, stream, pose):
         x = -pose.location.x
         y = pose.location.y
         z = pose.location.z
@@ -163,15 +220,17 @@ class DataSave:
         yaw = pose.rotation.yaw+180
         roll = pose.rotation.roll
         ego_pose = {
-            "token": uuid1().hex,
+            "token": tokens.record_token(tokens.EGO_POSE, stream.scene_id, len(stream.samples)),
             "translation": [x, y, z],
             "rotation": get_quaternion_from_euler(pitch, yaw, roll, to_rad=True),
             "timestamp": self.timestamp
         }
-        self.ego_pose = ego_pose
-        append_json(filename, ego_pose)
+        stream.ego_pose = ego_pose
+        self.tables.append("ego_pose", ego_pose)
+        if self.columnar is not None:
+            stream.ego_poses.append(dict(ego_pose, sample_token=stream.sample_token))
 
-    def save_can_bus_data(self, filename, pose, imu):
+    def save_can_bus_data(self, stream, filename, pose, imu):
         can_bus = []
         for vec in [pose.location, pose.rotation, imu["acc"], imu["vel"], imu["rot"]]:
             if type(vec) is carla.libcarla.Rotation:
@@ -187,102 +246,155 @@ class DataSave:
         
         with open(filename, 'a') as f:
             f.write(str(can_bus).lstrip("[").rstrip("]")+"\n")
+        if self.columnar is not None:
+            stream.can_bus_rows.append((self.timestamp, can_bus))
 
+    @metrics.timed("save_training_files")
     def save_training_files(self, data):
-
-        lidar_fname = self.LIDAR_PATH.format(self.captured_frame_id)
-        # kitti_label_fname = self.KITTI_LABEL_PATH.format(self.captured_frame_id)
-        # carla_label_fname = self.CARLA_LABEL_PATH.format(self.captured_frame_id)
-        # img_fname = self.IMAGE_PATH.format(self.captured_frame_id)
-        # calib_filename = self.CALIBRATION_PATH.format(self.captured_frame_id)
-        can_bus_fname = self.CAN_BUS_PATH.format(self.scene_id)
-
-        for agent, dt in data["agents_data"].items():
+        assert len(data["agents_data"]) == len(self.streams), \
+            "{} agents for {} streams".format(len(data["agents_data"]), len(self.streams))
+        # agents are in spawn order, every agent sample gets its own frame id and files
+        for stream, (agent, dt) in zip(self.streams, data["agents_data"].items()):
+            lidar_fname = self.LIDAR_PATH.format(self.captured_frame_id)
+            # kitti_label_fname = self.KITTI_LABEL_PATH.format(self.captured_frame_id)
+            # carla_label_fname = self.CARLA_LABEL_PATH.format(self.captured_frame_id)
+            # img_fname = self.IMAGE_PATH.format(self.captured_frame_id)
+            # calib_filename = self.CALIBRATION_PATH.format(self.captured_frame_id)
+            can_bus_fname = self.CAN_BUS_PATH.format(stream.can_bus_id)
             # camera_transform= config_to_trans(self.cfg["SENSOR_CONFIG"]["RGB"]["TRANSFORM"])
             # lidar_transform = config_to_trans(self.cfg["SENSOR_CONFIG"]["LIDAR"]["TRANSFORM"])
-            self.save_can_bus_data(can_bus_fname, dt["pose"], dt["imu"])
-            self.save_ego_pose_data(self.EGO_POSE_PATH, dt["pose"])
+            self.save_can_bus_data(stream, can_bus_fname, dt["pose"], dt["imu"])
+            self.save_ego_pose_data(stream, dt["pose"])
             save_ref_files(self.OUTPUT_FOLDER, self.captured_frame_id)
-            save_image_data(self.IMAGE_PATH, dt["sensor_data"][1:7], self.captured_frame_id)
-            self.save_sample_data(dt)
+            # the queued tasks keep the carla measurements, which own their raw_data buffers
+            if self.shards is None:
+                for cam, image in zip(CAMS, dt["sensor_data"][1:7]):
+                    self.writer.submit(save_camera_image, self.IMAGE_PATH.format(cam, self.captured_frame_id), image,
+                                       self.IMAGE_FORMAT, self.IMAGE_PARAMS)
+            self.save_sample_data(stream, dt)
             # save_label_data(kitti_label_fname, dt["kitti_datapoints"])
             # save_label_data(carla_label_fname, dt['carla_datapoints'])
-            self.post_proc_sample_annotation(dt['nuscenes_datapoints'])
-            self.save_instance()
+            self.post_proc_sample_annotation(stream, dt['nuscenes_datapoints'])
             # save_calibration_matrices([camera_transform, lidar_transform], calib_filename, dt["intrinsic"])
-            save_lidar_data(lidar_fname, dt["sensor_data"][0])
-        self.captured_frame_id += 1
+            if self.shards is None:
+                self.writer.submit(save_lidar_data, lidar_fname, dt["sensor_data"][0])
+            else:
+                self.save_shard_sample(stream, dt)
+            self.captured_frame_id += 1
 
-    def save_sample_annotation(self, filename):
+    def save_shard_sample(self, stream, dt):
+        """ 图片和点云在写盘线程中并行编码（both 模式同时写文件），再按顺序写入 shard """
+        both = self.OUTPUT_MODE == "both"
+        members = {}
+        for cam, image in zip(CAMS, dt["sensor_data"][1:7]):
+            filename = self.IMAGE_PATH.format(cam, self.captured_frame_id) if both else None
+            members["{}.{}".format(cam, self.IMAGE_FORMAT)] = self.writer.submit_result(
+                encode_camera_image, image, self.IMAGE_FORMAT, self.IMAGE_PARAMS, filename)
+        filename = self.LIDAR_PATH.format(self.captured_frame_id) if both else None
+        members["LIDAR_TOP.bin"] = self.writer.submit_result(encode_lidar_data, dt["sensor_data"][0], filename)
+        # prev/next of the annotations are only complete in the nuscenes tables
+        labels = {
+            "sample.json": {"token": stream.sample_token, "scene_token": stream.scene["token"], "timestamp": self.timestamp},
+            "ego_pose.json": stream.ego_pose,
+            "calibration.json": {"sensor": self.sensors, "calibrated_sensor": self.calibrated_sensors},
+            "annotations.json": [dict(anno.to_json(), category_name=anno.category) for anno in dt["nuscenes_datapoints"]],
+        }
+        for name, value in labels.items():
+            members[name] = json.dumps(value).encode()
+        self.shard_queue.submit(write_shard_sample, self.shards, "{0:06}".format(self.captured_frame_id), members)
+
+    def save_sample_annotation(self, stream):
         anno_jsons = []
-        for anno in self.annos:
+        for anno in stream.annos:
             anno_json = anno.to_json()
             anno_jsons.append(anno_json)
-        extend_json(filename, anno_jsons)
+        self.tables.extend("sample_annotation", anno_jsons)
 
-    def post_proc_sample_annotation(self, annos):
+    def post_proc_sample_annotation(self, stream, annos):
         # traverse the annotation for a sample and update instance & sample info
+        sample_index = len(stream.samples)
         for anno in annos:
-            anno.set_sample_token(self.sample_token)
-            if str(anno.carla_id) not in self.instances:
+            anno.set_token(tokens.record_token(tokens.ANNOTATION, stream.scene_id, sample_index, anno.carla_id))
+            anno.set_sample_token(stream.sample_token)
+            if str(anno.carla_id) not in stream.instances:
                 instance = {
                     "carla_id": anno.carla_id,
-                    "token": uuid1().hex,
+                    "token": tokens.record_token(tokens.INSTANCE, stream.scene_id, item=anno.carla_id),
                     "category_token": self.cfg["ANNOTATE_CATEGORIES"][anno.category],
-                    "nbr_annotations": 0,
+                    "nbr_annotations": 1,
                     "first_annotation_token": anno.token,
                     "last_annotation_token": anno.token
                 }
-                self.instances[str(instance["carla_id"])] = instance
+                stream.instances[str(instance["carla_id"])] = instance
             else:
-                # TODO optimze performance
-                for prev_anno in self.annos:
-                    if prev_anno.token == self.instances[str(anno.carla_id)]["last_annotation_token"]:
-                        prev_anno.set_next(anno.token)
-                        anno.set_prev(prev_anno.token)
-                        break
-                self.instances[str(anno.carla_id)]["last_annotation_token"] = anno.token
-                instance = self.instances[str(anno.carla_id)]
+                instance = stream.instances[str(anno.carla_id)]
+                prev_anno = stream.records[instance["last_annotation_token"]]
+                prev_anno.set_next(anno.token)
+                anno.set_prev(prev_anno.token)
+                instance["last_annotation_token"] = anno.token
+                instance["nbr_annotations"] += 1
             anno.set_instance_token(instance["token"])
-            self.annos.append(anno)
+            stream.records[anno.token] = anno
+            stream.annos.append(anno)
     
     def init_scene(self):
+        """ 每个 agent 开始一个新场景，scene_id 依次递增 """
         print("scene: {}".format(self.scene_id))
         self.sample_id = 0
-        self.prev_sample_token = ""
-        self.sample_token = uuid1().hex
-        self.samples = []
-        self.next_sample_token = uuid1().hex
-        self.instances = {}
-        self.annos = []
-
-        self.scene = {
-            "token": uuid1().hex,
-            "name": "scene-{}".format(self.scene_id),
-            "description": "",
-            "nbr_samples": 0,
-            "first_sample_token": self.sample_token,
-            "last_sample_token": ""
-        }
-        self.scene_id += 1
+        self.streams = []
+        for _ in range(self.NUM_AGENTS):
+            self.streams.append(AgentStream(self.scene_id, len(self.sensors)))
+            self.scene_id += 1
 
+    @metrics.timed("save_scene")
     def save_scene(self):
-        self.scene["nbr_samples"] = self.sample_id
-        self.scene["last_sample_token"] = self.prev_sample_token
-        extend_json(self.SAMPLE_PATH, self.samples)
-        append_json(self.SCENE_PATH, self.scene)
+        for stream in self.streams:
+            stream.scene["nbr_samples"] = self.sample_id
+            stream.scene["last_sample_token"] = stream.prev_sample_token
+            self.tables.extend("sample", stream.samples)
+            self.tables.extend("sample_data", stream.sample_datas)
+            self.save_sample_annotation(stream)
+            self.tables.append("scene", stream.scene)
+            # instances are only complete once the scene ends
+            self.save_instance(stream)
+            if self.columnar is not None:
+                self.writer.submit(self.columnar.write_scene, stream.scene["name"], stream.annos, stream.ego_poses,
+                                   stream.can_bus_rows)
+        self.tables.flush()
+
+    def close(self):
+        """ 等待后台写盘完成后生成最终的 json 文件 """
+        try:
+            self.writer.close()
+        finally:
+            # the shard thread is drained even if an encode task failed, before its tar file is closed
+            try:
+                self.shard_queue.close()
+            finally:
+                try:
+                    if self.shards is not None:
+                        self.shards.close()
+                finally:
+                    self.tables.close()
     
     def init_sample(self):
         # TODO decouple init sample
         pass
 
+    @metrics.timed("save_sample")
     def save_sample(self):
+        for stream in self.streams:
+            self.save_stream_sample(stream)
+        self.sample_id += 1
+        print("sample: {}".format(self.sample_id))
+
+    def save_stream_sample(self, stream):
         sample = {
-            "token": self.sample_token,
+            "token": stream.sample_token,
             "timestamp": self.timestamp,
-            "scene_token": self.scene["token"],
+            "scene_token": stream.scene["token"],
             "next": "",
-            "prev": self.prev_sample_token
+            "prev": stream.prev_sample_token
         }
 
         # if self.sample_id == 0:
@@ -290,22 +402,17 @@ class DataSave:
         #     self.next_sample_token = uuid1().hex
         # else:
 
-        for prev_sample in self.samples:
-            if prev_sample["token"] == self.prev_sample_token:
-                prev_sample["next"] = self.sample_token
+        if stream.prev_sample_token != "":
+            stream.records[stream.prev_sample_token]["next"] = stream.sample_token
+        stream.records[stream.sample_token] = sample
 
-        self.prev_sample_token = self.sample_token
-        self.sample_token = self.next_sample_token
-        self.next_sample_token = uuid1().hex
+        stream.prev_sample_token = stream.sample_token
+        stream.sample_token = stream.next_sample_token
+        stream.next_sample_token = tokens.record_token(tokens.SAMPLE, stream.scene_id, len(stream.samples) + 2)
 
-        self.samples.append(sample)
-        self.sample_id += 1
-        self.save_sample_annotation(self.SAMPLE_ANNO_PATH)
-        self.annos = []
-        print("sample: {}".format(self.sample_id))
+        stream.samples.append(sample)
 
-    def save_sample_data(self, data):
-        sample_datas = []
+    def save_sample_data(self, stream, data):
         # TODO save sensor data here
         for i, sensor in enumerate(self.sensors):
             if sensor["modality"] == "lidar":
@@ -314,15 +421,15 @@ class DataSave:
                 width = 0
                 height = 0
             elif sensor["modality"] == "camera":
-                filename = "image/{0}/{1:06}.png".format(sensor["channel"], self.captured_frame_id)
-                fileformat = "jpg"
+                filename = "image/{0}/{1:06}.{2}".format(sensor["channel"], self.captured_frame_id, self.IMAGE_FORMAT)
+                fileformat = self.IMAGE_FORMAT
                 width = sensor["width"]
                 height = sensor["height"]
-            prev_sample_data_token = self.last_sample_data_tokens[i]
+            prev_sample_data_token = stream.last_sample_data_tokens[i]
             sample_data = {
-                "token": uuid1().hex,
-                "sample_token": self.sample_token,
-                "ego_pose_token": self.ego_pose["token"],
+                "token": tokens.record_token(tokens.SAMPLE_DATA, stream.scene_id, len(stream.samples), i),
+                "sample_token": stream.sample_token,
+                "ego_pose_token": stream.ego_pose["token"],
                 "calibrated_sensor_token": sensor["calib_token"],
                 "filename": filename,
                 "fileformat": fileformat,
@@ -333,16 +440,19 @@ class DataSave:
                 "next": "",
                 "prev": prev_sample_data_token
             }
-            sample_datas.append(sample_data)
             if prev_sample_data_token != "":
-                for prev_sample_data in sample_datas:
-                    if prev_sample_data["token"] == prev_sample_data_token:
-                        prev_sample_data["next"] = sample_data["token"]
-                        break
-        extend_json(self.SAMPLE_DATA_PATH, sample_datas)
+                stream.records[prev_sample_data_token]["next"] = sample_data["token"]
+            stream.records[sample_data["token"]] = sample_data
+            stream.last_sample_data_tokens[i] = sample_data["token"]
+            stream.sample_datas.append(sample_data)
 
-    def save_instance(self):
+    def save_instance(self, stream):
         instances = []
-        for k, v in self.instances.items():
+        for k, v in stream.instances.items():
             instances.append(v)
-        extend_json(self.INSTANCE_PATH, instances)
\ No newline at end of file
+        self.tables.extend("instance", instances)
+
+
+def write_shard_sample(shards, key, members):
+    """ 等待编码完成后写入 shard，members 中的值为 bytes 或 PendingResult """
+    shards.write_sample(key, {name: data if isinstance(data, bytes) else data.result() for name, data in members.items()})
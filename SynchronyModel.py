@@ -1,12 +1,17 @@
-import queue
 import sys
 import random
 import logging
+import itertools
 
 import numpy as np
 
 from config import config_to_trans
-from data_utils import camera_intrinsic, filter_by_distance
+from data_utils import filter_by_distance
+from actor_states import ActorStates
+from spatial_index import environment_index
+from frame_assembler import FrameAssembler
+from rig_calibration import RigCalibration
+from metrics import metrics
 
 sys.path.append("/opt/carla-simulator/PythonAPI/carla/dist/carla-0.9.12-py3.7-linux-x86_64.egg")
 
@@ -16,15 +21,21 @@ import carla
 class SynchronyModel:
     def __init__(self, cfg):
         self.cfg = cfg
-        self.client = carla.Client('localhost', 2000)
+        self.client = carla.Client(self.cfg["CARLA_CONFIG"]["HOST"], self.cfg["CARLA_CONFIG"]["PORT"])
         self.client.set_timeout(5.0)
         self.world = self.client.get_world()
-        self.traffic_manager = self.client.get_trafficmanager()
+        self.traffic_manager = self.client.get_trafficmanager(self.cfg["CARLA_CONFIG"]["TM_PORT"])
         self.init_settings = None
         self.frame = None
         self.actors = {"non_agents": [], "walkers": [], "agents": [], "sensors": {}}
         self.data = {"sensor_data": {}, "environment_data": None}  # 记录每一帧的数据
         self.vehicle = None
+        self.assembler = None
+        self.listening = False
+        self.calibration = None
+        # static objects of the map and their grid, read at the first tick
+        self.environment_objects = None
+        self.environment_index = None
 
     def set_synchrony(self):
         self.init_settings = self.world.get_settings()
@@ -56,18 +67,13 @@ class SynchronyModel:
         spawn_points = self.world.get_map().get_spawn_points()
         number_of_spawn_points = len(spawn_points)
 
-        if num_of_vehicles < number_of_spawn_points:
-            random.shuffle(spawn_points)
-            num_of_vehicles = num_of_vehicles
-        elif num_of_vehicles > number_of_spawn_points:
+        random.shuffle(spawn_points)
+        if num_of_vehicles > number_of_spawn_points:
             msg = 'requested %d vehicles, but could only find %d spawn points'
             logging.warning(msg, num_of_vehicles, number_of_spawn_points)
             num_of_vehicles = number_of_spawn_points
 
-        batch = []
-        for n, transform in enumerate(spawn_points):
-            if n >= num_of_vehicles:
-                break
+        def vehicle_command(transform):
             blueprint = random.choice(blueprints)
             if blueprint.has_attribute('color'):
                 color = random.choice(blueprint.get_attribute('color').recommended_values)
@@ -76,46 +82,63 @@ class SynchronyModel:
                 driver_id = random.choice(blueprint.get_attribute('driver_id').recommended_values)
                 blueprint.set_attribute('driver_id', driver_id)
             blueprint.set_attribute('role_name', 'autopilot')
-            batch.append(carla.command.SpawnActor(blueprint, transform))
+            return carla.command.SpawnActor(blueprint, transform)
 
-            for response in self.client.apply_batch_sync(batch):
-                if response.error:
-                    continue
-                else:
-                    self.actors["non_agents"].append(response.actor_id)
+        self.actors["non_agents"] = self.batch_spawn(vehicle_command, iter(spawn_points), num_of_vehicles)
 
         # 生成行人actors
         blueprintsWalkers = self.world.get_blueprint_library().filter("walker.pedestrian.*")
-        spawn_points = []
-        for i in range(num_of_walkers):
-            spawn_point = carla.Transform()
-            loc = self.world.get_random_location_from_navigation()
-            if loc is not None:
-                spawn_point.location = loc
-                spawn_points.append(spawn_point)
 
-        batch = []
-        for spawn_point in spawn_points:
+        def walker_spawn_points():
+            # navigation locations are drawn on demand, so failed walkers are retried at new places
+            for _ in range(num_of_walkers * self.cfg["CARLA_CONFIG"]["SPAWN_RETRIES"]):
+                loc = self.world.get_random_location_from_navigation()
+                if loc is not None:
+                    spawn_point = carla.Transform()
+                    spawn_point.location = loc
+                    yield spawn_point
+
+        def walker_command(spawn_point):
             walker_bp = random.choice(blueprintsWalkers)
             if walker_bp.has_attribute('is_invincible'):
                 walker_bp.set_attribute('is_invincible', 'false')
-            batch.append(carla.command.SpawnActor(walker_bp, spawn_point))
+            return carla.command.SpawnActor(walker_bp, spawn_point)
 
-        for response in self.client.apply_batch_sync(batch, True):
-            if response.error:
-                continue
-            else:
-                self.actors["walkers"].append(response.actor_id)
+        self.actors["walkers"] = self.batch_spawn(walker_command, walker_spawn_points(), num_of_walkers, True)
         print("spawn {} vehicles and {} walkers".format(len(self.actors["non_agents"]),
                                                         len(self.actors["walkers"])))
         self.world.tick()
 
+    def batch_spawn(self, command, spawn_points, num, do_tick=False):
+        """
+        批量生成actor：每轮只提交还缺少数量的 SpawnActor 命令（按 SPAWN_CHUNK_SIZE 分块，0 为不分块），
+        生成失败（如碰撞）的用 spawn_points 中后续的位置重试，直到数量满足或位置用尽
+        :param command: function building a carla.command.SpawnActor from a spawn point
+        :param spawn_points: iterator of candidate spawn points
+        :return: ids of the spawned actors
+        """
+        chunk_size = self.cfg["CARLA_CONFIG"]["SPAWN_CHUNK_SIZE"]
+        actor_ids = []
+        while len(actor_ids) < num:
+            batch = [command(spawn_point) for spawn_point in itertools.islice(spawn_points, num - len(actor_ids))]
+            if not batch:
+                logging.warning("requested %d actors, but could only spawn %d", num, len(actor_ids))
+                break
+            chunk_size = chunk_size or len(batch)
+            for i in range(0, len(batch), chunk_size):
+                for response in self.client.apply_batch_sync(batch[i:i + chunk_size], do_tick):
+                    if response.error:
+                        logging.debug("spawn failed: %s", response.error)
+                    else:
+                        actor_ids.append(response.actor_id)
+        return actor_ids
+
     def set_actors_route(self):
         self.traffic_manager.set_global_distance_to_leading_vehicle(1.0)
         self.traffic_manager.set_synchronous_mode(True)
-        vehicle_actors = self.world.get_actors(self.actors["non_agents"])
-        for vehicle in vehicle_actors:
-            vehicle.set_autopilot(True, self.traffic_manager.get_port())
+        tm_port = self.traffic_manager.get_port()
+        self.client.apply_batch_sync([carla.command.SetAutopilot(actor_id, True, tm_port)
+                                      for actor_id in self.actors["non_agents"]])
 
         walker_controller_bp = self.world.get_blueprint_library().find('controller.ai.walker')
         batch = []
@@ -130,75 +153,104 @@ class SynchronyModel:
                 controllers_id.append(response.actor_id)
         self.world.set_pedestrians_cross_factor(0.2)
 
-        for con_id in controllers_id:
+        # fetch all controllers at once instead of three get_actor calls per walker
+        for controller in self.world.get_actors(controllers_id):
             # start walker
-            self.world.get_actor(con_id).start()
+            controller.start()
             # set walk to random point
             destination = self.world.get_random_location_from_navigation()
-            self.world.get_actor(con_id).go_to_location(destination)
+            controller.go_to_location(destination)
             # max speed
-            self.world.get_actor(con_id).set_max_speed(10)
+            controller.set_max_speed(10)
 
     def spawn_agent(self):
         vehicle_bp = random.choice(self.world.get_blueprint_library().filter(self.cfg["AGENT_CONFIG"]["BLUEPRINT"]))
         trans_cfg = self.cfg["AGENT_CONFIG"]["TRANSFORM"]
         transform = config_to_trans(trans_cfg)
-        transform = random.choice(self.world.get_map().get_spawn_points())
-        agent = self.world.spawn_actor(vehicle_bp, transform)
-        agent.set_autopilot(True, self.traffic_manager.get_port())
-        self.actors["agents"].append(agent)
-
-        self.actors["sensors"][agent] = []
-        for sensor, config in self.cfg["SENSOR_CONFIG"].items():
-            sensor_bp = self.world.get_blueprint_library().find(config["BLUEPRINT"])
-            for attr, val in config["ATTRIBUTE"].items():
-                sensor_bp.set_attribute(attr, str(val))
-            trans_cfg = config["TRANSFORM"]
-            transform = carla.Transform(carla.Location(trans_cfg["location"][0],
-                                                       trans_cfg["location"][1],
-                                                       trans_cfg["location"][2]),
-                                        carla.Rotation(trans_cfg["rotation"][0],
-                                                       trans_cfg["rotation"][1],
-                                                       trans_cfg["rotation"][2]))
-            sensor = self.world.spawn_actor(sensor_bp, transform, attach_to=agent)
-            self.actors["sensors"][agent].append(sensor)
+        # every agent gets its own spawn point and sensor rig
+        num_agents = self.cfg["AGENT_CONFIG"]["NUM_AGENTS"]
+        # the sensor poses of every tick follow from the agent pose, see rig_calibration.py
+        self.calibration = RigCalibration.from_cfg(self.cfg)
+        for transform in random.sample(self.world.get_map().get_spawn_points(), num_agents):
+            agent = self.world.spawn_actor(vehicle_bp, transform)
+            agent.set_autopilot(True, self.traffic_manager.get_port())
+            self.actors["agents"].append(agent)
+
+            self.actors["sensors"][agent] = []
+            for sensor, config in self.cfg["SENSOR_CONFIG"].items():
+                self.actors["sensors"][agent].append(self.spawn_sensor(config["BLUEPRINT"], config, agent))
+            if self.cfg["FILTER_CONFIG"]["DEPTH_OCCLUSION"]:
+                # a depth camera with the same pose and attributes for every rgb camera, appended after all sensors
+                for sensor, config in self.cfg["SENSOR_CONFIG"].items():
+                    if config["BLUEPRINT"] == "sensor.camera.rgb":
+                        self.actors["sensors"][agent].append(self.spawn_sensor("sensor.camera.depth", config, agent))
         self.world.tick()
         return True
 
+    def spawn_sensor(self, blueprint, config, agent):
+        sensor_bp = self.world.get_blueprint_library().find(blueprint)
+        for attr, val in config["ATTRIBUTE"].items():
+            sensor_bp.set_attribute(attr, str(val))
+        transform = config_to_trans(config["TRANSFORM"])
+        return self.world.spawn_actor(sensor_bp, transform, attach_to=agent)
+
     def sensor_listen(self):
+        # slot names in the order of spawn_agent, the depth cameras come after all sensors
+        names = [sensor.name for sensor in self.calibration.sensors]
+        slot_names = []
+        for i, (agent, sensors) in enumerate(self.actors["sensors"].items()):
+            # tick() takes the measurements of the agent as a slice of the assembled frame
+            self.data["sensor_data"][agent] = slice(len(slot_names), len(slot_names) + len(sensors))
+            slot_names += ["agent {} {}".format(i, name) for name in names]
+        self.assembler = FrameAssembler(slot_names, self.cfg["CARLA_CONFIG"]["MAX_PENDING_FRAMES"])
+        self.set_listening(True)
+
+    def set_listening(self, listening):
+        """ 开始或停止所有传感器的数据流（CaptureScheduler 的 SENSOR_GATING） """
+        if listening == self.listening:
+            return
         for agent, sensors in self.actors["sensors"].items():
-            self.data["sensor_data"][agent] = []
-            for sensor in sensors:
-                q = queue.Queue()
-                self.data["sensor_data"][agent].append(q)
-                sensor.listen(q.put)
+            for slot, sensor in enumerate(sensors, self.data["sensor_data"][agent].start):
+                if listening:
+                    sensor.listen(self.assembler.callback(slot))
+                else:
+                    sensor.stop()
+        self.listening = listening
 
+    def skip_tick(self):
+        """ 不采集的 tick，这一帧的传感器数据被丢弃 """
+        with metrics.timer("world_tick"):
+            frame = self.world.tick()
+        self.assembler.skip(frame)
+
+    @metrics.timed("tick")
     def tick(self):
         ret = {"environment_objects": None, "actors": None, "agents_data": {}}
-        self.frame = self.world.tick()
+        with metrics.timer("world_tick"):
+            self.frame = self.world.tick()
 
-        ret["environment_objects"] = self.world.get_environment_objects(carla.CityObjectLabel.Any)
+        if self.environment_objects is None:
+            self.environment_objects = self.world.get_environment_objects(carla.CityObjectLabel.Any)
+            self.environment_index = environment_index(self.environment_objects,
+                                                       self.cfg["FILTER_CONFIG"]["PRELIMINARY_FILTER_DISTANCE"])
+        ret["environment_objects"] = self.environment_objects
+        ret["environment_index"] = self.environment_index
         ret["actors"] = self.world.get_actors()
         ret["snapshot"] = self.world.get_snapshot()
         ret["timestamp"] = ret["snapshot"].platform_timestamp
-        image_width = self.cfg["SENSOR_CONFIG"]["CAM_BACK"]["ATTRIBUTE"]["image_size_x"]
-        image_height = self.cfg["SENSOR_CONFIG"]["CAM_BACK"]["ATTRIBUTE"]["image_size_y"]
-        fov = self.cfg["SENSOR_CONFIG"]["CAM_BACK"]["ATTRIBUTE"]["fov"]
+        # every actor state of the tick is read from the snapshot, no getter is called per actor
+        ret["actor_states"] = ActorStates(ret["actors"], ret["snapshot"])
         
-        for agent, dataQue in self.data["sensor_data"].items():
-            data = [self._retrieve_data(q) for q in dataQue]
+        with metrics.timer("sensor_wait"):
+            measurements = self.assembler.wait(self.frame, self.cfg["CARLA_CONFIG"]["SENSOR_TIMEOUT"])
+        for agent, slots in self.data["sensor_data"].items():
+            data = measurements[slots]
             assert all(x.frame == self.frame for x in data)
+            state = ret["snapshot"].find(agent.id)
             ret["agents_data"][agent] = {}
-            ret["agents_data"][agent]["pose"] = agent.get_transform()
-            ret["agents_data"][agent]["imu"] = {"acc": agent.get_acceleration(), "vel": agent.get_velocity(), "rot": agent.get_angular_velocity()}
+            ret["agents_data"][agent]["pose"] = state.get_transform()
+            ret["agents_data"][agent]["imu"] = {"acc": state.get_acceleration(), "vel": state.get_velocity(), "rot": state.get_angular_velocity()}
             ret["agents_data"][agent]["sensor_data"] = data
-            ret["agents_data"][agent]["intrinsic"] = camera_intrinsic(image_width, image_height, fov)
-            ret["agents_data"][agent]["extrinsic"] = self.actors["sensors"][agent][0].get_transform()
+            ret["agents_data"][agent]["calibration"] = self.calibration
         filter_by_distance(ret, self.cfg["FILTER_CONFIG"]["PRELIMINARY_FILTER_DISTANCE"])
         return ret
-
-    def _retrieve_data(self, q):
-        while True:
-            data = q.get()
-            if data.frame == self.frame:
-                return data
@@ -0,0 +1,49 @@
+"""
+State of the vehicles and walkers of a tick, copied once from the world snapshot.
+
+SynchronyModel.tick reads world.get_actors() and world.get_snapshot() once and keeps the transforms, velocities
+and bounding boxes of all actors as rows of contiguous arrays. filter_by_distance and objects_filter only index
+these arrays, no getter is called on the actor handles, whose every call has to go through the client.
+"""
+
+import numpy as np
+
+from data_utils import obj_type, bbox_to_world_matrix
+
+
+def is_annotated(actor):
+    """ 标注的 actor：车辆和行人 """
+    return actor.type_id.find("vehicle") != -1 or actor.type_id.find("pedestrian") != -1
+
+
+class ActorStates:
+    def __init__(self, actors, snapshot):
+        """
+        :param actors: world.get_actors() of the tick, only the vehicles and walkers in the snapshot are kept
+        :param snapshot: world.get_snapshot() of the same tick
+        """
+        actor_snapshots = [(actor, snapshot.find(actor.id)) for actor in actors if is_annotated(actor)]
+        actor_snapshots = [(actor, state) for actor, state in actor_snapshots if state is not None]
+        num = len(actor_snapshots)
+        self.actors = [actor for actor, _ in actor_snapshots]
+        self.ids = np.array([actor.id for actor in self.actors], dtype=np.int64)
+        # row of every actor id
+        self.rows = {actor.id: row for row, actor in enumerate(self.actors)}
+        self.types = [obj_type(actor) for actor in self.actors]
+        self.is_car = np.array([tp == "Car" for tp in self.types], dtype=bool)
+        # x y z pitch yaw roll
+        self.transforms = np.empty((num, 6))
+        # velocity, acceleration, angular velocity
+        self.velocities = np.empty((num, 3, 3))
+        self.extents = np.empty((num, 3))
+        self.bbox_to_world = np.empty((num, 4, 4))
+        for row, (actor, state) in enumerate(actor_snapshots):
+            transform = state.get_transform()
+            loc, rot = transform.location, transform.rotation
+            self.transforms[row] = [loc.x, loc.y, loc.z, rot.pitch, rot.yaw, rot.roll]
+            for i, vec in enumerate([state.get_velocity(), state.get_acceleration(), state.get_angular_velocity()]):
+                self.velocities[row, i] = [vec.x, vec.y, vec.z]
+            bbox = actor.bounding_box
+            self.extents[row] = [bbox.extent.x, bbox.extent.y, bbox.extent.z]
+            self.bbox_to_world[row] = bbox_to_world_matrix(bbox, transform, 1)
+
@@ -0,0 +1,98 @@
+"""
+Background writer used by DataSave to keep file I/O off the simulation loop.
+
+"""
+
+import queue
+import logging
+import threading
+
+
+class PendingResult:
+    """ submit_result 返回的结果，result() 等待任务完成 """
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class AsyncWriter:
+    """
+    后台写盘线程池：submit 的任务由工作线程执行，队列满时 submit 阻塞（back-pressure）
+    With num_workers == 0 every task runs synchronously inside submit.
+    """
+    def __init__(self, num_workers, queue_depth):
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.errors = []
+        self.workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._work, name="writer-{}".format(i), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, func, *args):
+        """ The task must own everything it touches, the caller may not modify args afterwards """
+        self._raise_errors()
+        if not self.workers:
+            func(*args)
+            return
+        self.queue.put((func, args))
+
+    def submit_result(self, func, *args):
+        """ Like submit, the returned PendingResult gives the return value of func """
+        pending = PendingResult()
+        self.submit(self._run_pending, pending, func, *args)
+        return pending
+
+    @staticmethod
+    def _run_pending(pending, func, *args):
+        try:
+            pending.value = func(*args)
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            pending.event.set()
+
+    def flush(self):
+        """ 等待队列中所有任务写完 """
+        self.queue.join()
+        self._raise_errors()
+
+    def close(self):
+        """ 等待所有任务完成后结束工作线程，任务的异常在线程结束后抛出 """
+        try:
+            self.flush()
+        finally:
+            for _ in self.workers:
+                self.queue.put(None)
+            for worker in self.workers:
+                worker.join()
+            self.workers = []
+
+    def _work(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                return
+            func, args = task
+            try:
+                func(*args)
+            except Exception as e:
+                logging.exception("Writer task %s failed", getattr(func, "__name__", func))
+                self.errors.append(e)
+            finally:
+                self.queue.task_done()
+
+    def _raise_errors(self):
+        if self.errors:
+            error = self.errors[0]
+            self.errors = []
+            raise error
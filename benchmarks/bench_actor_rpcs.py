@@ -0,0 +1,290 @@
+"""
+Client calls per captured frame of SynchronyModel.tick -> objects_filter against a counting stub client. Every
+call on the world or on an actor handle (get_transform, get_location, get_velocity, ...) goes through the
+client and is counted by name, the reads of the world snapshot are local and counted separately. The world
+holds the vehicles and walkers of a synthetic frame plus the agents and their sensors, like world.get_actors().
+Compared with the former implementation, which called get_environment_objects every tick, read the pose and IMU
+of every agent with its getters and called get_location on every actor in filter_by_distance.
+
+    python benchmarks/bench_actor_rpcs.py --frames 20 --actors 60 --agents 2
+"""
+
+import io
+import os
+import sys
+import copy
+import time
+import argparse
+import contextlib
+import collections
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+carla = fake_carla.install()
+
+from SynchronyModel import SynchronyModel
+from config import cfg_from_yaml_file
+from actor_states import ActorStates
+from data_utils import objects_filter, distance_between_locations
+
+CALLS = collections.Counter()
+SNAPSHOT_READS = collections.Counter()
+
+
+def counted(counter, name, method):
+    def call(*args, **kwargs):
+        counter[name] += 1
+        return method(*args, **kwargs)
+    return call
+
+
+class RemoteActor(fake_carla.Actor):
+    """ actor handle of the client, every getter is a call through the client """
+    def __getattribute__(self, name):
+        attribute = super().__getattribute__(name)
+        if name.startswith("get_"):
+            return counted(CALLS, "actor." + name, attribute)
+        return attribute
+
+    def set_autopilot(self, enabled, port):
+        pass
+
+    def destroy(self):
+        pass
+
+    def state(self):
+        """ the ActorSnapshot of this actor, whose getters are local """
+        return SnapshotActor(self.id, self.type_id, self._transform, self.bounding_box, self._velocity,
+                             self._acceleration, self._angular_velocity)
+
+
+class SnapshotActor(fake_carla.Actor):
+    def __getattribute__(self, name):
+        attribute = super().__getattribute__(name)
+        if name.startswith("get_"):
+            return counted(SNAPSHOT_READS, "snapshot." + name, attribute)
+        return attribute
+
+
+class StubSensor(RemoteActor):
+    def __init__(self, actor_id, sensor, transform):
+        super().__init__(actor_id, sensor["blueprint"], transform, carla.BoundingBox(carla.Location(), carla.Vector3D()))
+        self.sensor = sensor
+        self.callback = None
+
+    def listen(self, callback):
+        self.callback = callback
+
+    def stop(self):
+        self.callback = None
+
+    def send(self, frame):
+        if self.callback is not None:
+            sensor = self.sensor
+            self.callback(carla.SensorData(frame, fake_carla._transform(sensor["transform"]), sensor["raw_data"],
+                                           sensor["width"], sensor["height"]))
+
+
+class StubBlueprint:
+    def __init__(self, blueprint_id):
+        self.id = blueprint_id
+
+    def set_attribute(self, name, value):
+        pass
+
+
+class StubLibrary:
+    def filter(self, pattern):
+        return [StubBlueprint(pattern)]
+
+    def find(self, blueprint_id):
+        return StubBlueprint(blueprint_id)
+
+
+class StubMap:
+    def __init__(self, transform):
+        self.transform = transform
+
+    def get_spawn_points(self):
+        return [self.transform] * 16
+
+
+class StubWorld:
+    """ 所有调用经过客户端计数，传感器数据在 tick 中同步发送 """
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.frame = 0
+        self.actors = []
+        self.sensors = []
+        for i, actor_id in enumerate(fixture["actor_ids"]):
+            velocity, acceleration, angular_velocity = [carla.Vector3D(*v) for v in fixture["actor_velocities"][i]]
+            bbox = carla.BoundingBox(carla.Location(*fixture["actor_bbox_locations"][i]),
+                                     carla.Vector3D(*fixture["actor_extents"][i]))
+            self.actors.append(RemoteActor(int(actor_id), fixture["actor_type_ids"][i],
+                                           fake_carla._transform(fixture["actor_transforms"][i]), bbox,
+                                           velocity, acceleration, angular_velocity))
+
+    def __getattribute__(self, name):
+        attribute = super().__getattribute__(name)
+        if callable(attribute) and not name.startswith("_"):
+            return counted(CALLS, "world." + name, attribute)
+        return attribute
+
+    def get_settings(self):
+        return carla.libcarla
+
+    def apply_settings(self, settings):
+        pass
+
+    def get_blueprint_library(self):
+        return StubLibrary()
+
+    def get_map(self):
+        return StubMap(fake_carla._transform(self.fixture["agent_transform"]))
+
+    def spawn_actor(self, blueprint, transform, attach_to=None):
+        actor_id = 1000000 + len(self.actors)
+        if attach_to is None:
+            actor = RemoteActor(actor_id, blueprint.id, transform,
+                                carla.BoundingBox(carla.Location(), carla.Vector3D(2.4, 1.0, 0.75)))
+        else:
+            # the sensors of every agent are spawned in the order of the fixture sensors
+            actor = StubSensor(actor_id, self.fixture["sensors"][len(self.sensors) % len(self.fixture["sensors"])],
+                               transform)
+            self.sensors.append(actor)
+        self.actors.append(actor)
+        return actor
+
+    def tick(self):
+        self.frame += 1
+        for sensor in self.sensors:
+            sensor.send(self.frame)
+        return self.frame
+
+    def get_environment_objects(self, label):
+        return []
+
+    def get_actors(self):
+        return list(self.actors)
+
+    def get_snapshot(self):
+        return carla.Snapshot([actor.state() for actor in self.actors], self.frame * 0.05)
+
+
+class StubClient:
+    world = None
+
+    def __init__(self, host, port):
+        pass
+
+    def set_timeout(self, timeout):
+        pass
+
+    def get_world(self):
+        return StubClient.world
+
+    def get_trafficmanager(self, port):
+        return self
+
+    def get_port(self):
+        return 8000
+
+    def apply_batch_sync(self, batch):
+        pass
+
+
+carla.Client = StubClient
+
+
+def former_filter_by_distance(data_dict, dis):
+    """ the former filter_by_distance: get_location of every actor for every agent """
+    environment_objects = data_dict["environment_objects"]
+    states = data_dict["actor_states"]
+    near_objects, near_actors = {}, {}
+    for agent, agent_data in data_dict["agents_data"].items():
+        agent_location = agent.get_location()
+        agent_data["environment_objects"] = [obj for obj in environment_objects if
+                                             distance_between_locations(obj.transform.location, agent_location) < dis]
+        actors = [act for act in data_dict["actors"] if act.id != agent.id and
+                  distance_between_locations(act.get_location(), agent_location) < dis]
+        # objects_filter reads the rows of actor_states, the sensors have none
+        agent_data["actor_rows"] = np.array([states.rows[act.id] for act in actors if act.id in states.rows],
+                                            dtype=np.int64)
+        agent_data["actors"] = [states.actors[row] for row in agent_data["actor_rows"]]
+        near_objects.update((obj.id, obj) for obj in agent_data["environment_objects"])
+        near_actors.update((act.id, act) for act in agent_data["actors"])
+    data_dict["environment_objects"] = list(near_objects.values())
+    data_dict["actors"] = list(near_actors.values())
+
+
+def former_tick(model):
+    """ SynchronyModel.tick before the snapshot arrays """
+    ret = {"environment_objects": None, "actors": None, "agents_data": {}}
+    model.frame = model.world.tick()
+    ret["environment_objects"] = model.world.get_environment_objects(carla.CityObjectLabel.Any)
+    ret["actors"] = model.world.get_actors()
+    ret["snapshot"] = model.world.get_snapshot()
+    ret["timestamp"] = ret["snapshot"].platform_timestamp
+    ret["actor_states"] = ActorStates(ret["actors"], ret["snapshot"])
+    measurements = model.assembler.wait(model.frame, model.cfg["CARLA_CONFIG"]["SENSOR_TIMEOUT"])
+    for agent, slots in model.data["sensor_data"].items():
+        ret["agents_data"][agent] = {}
+        ret["agents_data"][agent]["pose"] = agent.get_transform()
+        ret["agents_data"][agent]["imu"] = {"acc": agent.get_acceleration(), "vel": agent.get_velocity(),
+                                            "rot": agent.get_angular_velocity()}
+        ret["agents_data"][agent]["sensor_data"] = measurements[slots]
+        ret["agents_data"][agent]["calibration"] = model.calibration
+    former_filter_by_distance(ret, model.cfg["FILTER_CONFIG"]["PRELIMINARY_FILTER_DISTANCE"])
+    return ret
+
+
+def run(cfg, args, former):
+    fixture = fake_carla.synthetic_fixture(cfg, args.actors, args.points)
+    StubClient.world = StubWorld(fixture)
+    model = SynchronyModel(cfg)
+    model.spawn_agent()
+    model.sensor_listen()
+    CALLS.clear()
+    SNAPSHOT_READS.clear()
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        data = former_tick(model) if former else model.tick()
+        objects_filter(data)
+    elapsed = time.perf_counter() - start
+    calls, reads = CALLS.copy(), SNAPSHOT_READS.copy()
+    model.setting_recover()
+    return calls, reads, elapsed / args.frames * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--actors", type=int, default=60, help="vehicles and walkers besides the agents")
+    parser.add_argument("--agents", type=int, default=1, help="AGENT_CONFIG.NUM_AGENTS")
+    parser.add_argument("--points", type=int, default=30000, help="lidar points per frame")
+    args = parser.parse_args()
+
+    cfg = copy.deepcopy(cfg_from_yaml_file("configs_bev.yaml"))
+    cfg["AGENT_CONFIG"]["NUM_AGENTS"] = args.agents
+    cfg["FILTER_CONFIG"]["DEPTH_OCCLUSION"] = False
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = {"before": run(cfg, args, True), "after": run(cfg, args, False)}
+    (before_calls, before_reads, before_ms), (after_calls, after_reads, after_ms) = results["before"], results["after"]
+    print("{:<36} {:>10} {:>10}".format("per frame", "before", "after"))
+    for name in sorted(set(before_calls) | set(after_calls)):
+        print("{:<36} {:>10.1f} {:>10.1f}".format(name, before_calls[name] / args.frames, after_calls[name] / args.frames))
+    print("{:<36} {:>10.1f} {:>10.1f}".format("total client calls", sum(before_calls.values()) / args.frames,
+                                              sum(after_calls.values()) / args.frames))
+    print("{:<36} {:>10.1f} {:>10.1f}".format("local snapshot reads", sum(before_reads.values()) / args.frames,
+                                              sum(after_reads.values()) / args.frames))
+    print("{:<36} {:>10.2f} {:>10.2f}".format("tick + objects_filter ms", before_ms, after_ms))
+
+
+if __name__ == '__main__':
+    main()
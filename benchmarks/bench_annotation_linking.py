@@ -0,0 +1,171 @@
+"""
+Linking of the nuScenes chains in DataSave over long scenes with thousands of actors: every sample annotates a
+random share of --actors actors, so the instances appear in a scattered subset of the samples. The samples go
+through save_ego_pose_data, save_sample_data, post_proc_sample_annotation and save_stream_sample like
+save_training_files does, and the tables written by close() are checked: every instance chain runs from
+first_annotation_token to last_annotation_token over exactly the samples its actor appeared in, nbr_annotations
+is that number, and the sample and sample_data chains of every scene are complete. Reports the time per sample
+as the scene grows, which stays flat with the token index of the scene.
+
+    python benchmarks/bench_annotation_linking.py --actors 2000 --samples 100 --scenes 2
+"""
+
+import io
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import collections
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+carla = fake_carla.install()
+
+from DataSave import DataSave
+from config import cfg_from_yaml_file
+from data_descriptor import NuscenesDescriptor
+
+
+def annotations(actor_ids, categories):
+    annos = []
+    for actor_id in actor_ids:
+        anno = NuscenesDescriptor()
+        anno.set_carla_id(int(actor_id))
+        anno.set_category(categories[actor_id])
+        # the carla id is recovered from the translation when the tables are checked
+        anno.set_translation([float(actor_id), 0.0, 0.0])
+        anno.set_size([1.8, 4.6, 1.5])
+        anno.set_rotation([1.0, 0.0, 0.0, 0.0])
+        annos.append(anno)
+    return annos
+
+
+def record(cfg, args):
+    """ 记录 args.scenes 个场景，返回每个 (scene, carla_id) 出现的 sample 下标和每个 sample 的耗时 """
+    rng = np.random.default_rng(0)
+    actor_ids = np.arange(1, args.actors + 1)
+    categories = dict(zip(actor_ids, rng.choice(list(cfg["ANNOTATE_CATEGORIES"]), args.actors)))
+    appearances = collections.defaultdict(list)
+    sample_ms = np.zeros((args.scenes, args.samples))
+    sample_annos = np.zeros((args.scenes, args.samples), dtype=np.int64)
+    with contextlib.redirect_stdout(io.StringIO()):
+        dtsave = DataSave(cfg)
+        for scene in range(args.scenes):
+            dtsave.init_scene()
+            stream = dtsave.streams[0]
+            for sample in range(args.samples):
+                visible = actor_ids[rng.random(args.actors) < args.visible]
+                annos = annotations(visible, categories)
+                for actor_id in visible:
+                    appearances[stream.scene["name"], int(actor_id)].append(sample)
+                dtsave.timestamp = (scene * args.samples + sample) * 0.5
+                start = time.perf_counter()
+                dtsave.save_ego_pose_data(stream, carla.Transform())
+                dtsave.save_sample_data(stream, None)
+                dtsave.post_proc_sample_annotation(stream, annos)
+                dtsave.save_stream_sample(stream)
+                sample_ms[scene, sample] = (time.perf_counter() - start) * 1e3
+                sample_annos[scene, sample] = len(annos)
+                dtsave.sample_id += 1
+            dtsave.save_scene()
+        dtsave.close()
+    return appearances, sample_ms, sample_annos
+
+
+def chain(records, first, last=None):
+    """ 沿 next 遍历链表并检查 prev（和最后一个 token），返回链上的记录 """
+    result = []
+    token, prev = first, ""
+    while token != "":
+        rec = records[token]
+        assert rec["prev"] == prev, "broken prev link at {}".format(token)
+        result.append(rec)
+        prev, token = token, rec["next"]
+    assert last is None or prev == last, "chain ends at {} instead of {}".format(prev, last)
+    return result
+
+
+def check(table_root, appearances, args):
+    tables = {}
+    for name in ["scene", "sample", "sample_data", "sample_annotation", "instance"]:
+        with open(os.path.join(table_root, name + ".json")) as f:
+            tables[name] = json.load(f)
+    samples = {rec["token"]: rec for rec in tables["sample"]}
+    annos = {rec["token"]: rec for rec in tables["sample_annotation"]}
+    scene_of_sample = {}
+    sample_index = {}
+    assert len(tables["scene"]) == args.scenes
+    for scene in tables["scene"]:
+        scene_samples = chain(samples, scene["first_sample_token"], scene["last_sample_token"])
+        assert len(scene_samples) == scene["nbr_samples"] == args.samples
+        for i, sample in enumerate(scene_samples):
+            scene_of_sample[sample["token"]] = scene["name"]
+            sample_index[sample["token"]] = i
+
+    # one chain of args.samples records per sensor and scene
+    sample_datas = {rec["token"]: rec for rec in tables["sample_data"]}
+    firsts = [rec for rec in tables["sample_data"] if rec["prev"] == ""]
+    assert len(firsts) == args.scenes * len(set(rec["calibrated_sensor_token"] for rec in firsts))
+    for first in firsts:
+        records = chain(sample_datas, first["token"])
+        assert [sample_index[rec["sample_token"]] for rec in records] == list(range(args.samples))
+        assert len(set(rec["calibrated_sensor_token"] for rec in records)) == 1
+
+    assert len(tables["instance"]) == len(appearances)
+    linked = 0
+    for instance in tables["instance"]:
+        instance_annos = chain(annos, instance["first_annotation_token"], instance["last_annotation_token"])
+        assert all(anno["instance_token"] == instance["token"] for anno in instance_annos)
+        scene = scene_of_sample[instance_annos[0]["sample_token"]]
+        carla_id = int(instance_annos[0]["translation"][0])
+        expected = appearances[scene, carla_id]
+        assert [sample_index[anno["sample_token"]] for anno in instance_annos] == expected
+        assert instance["nbr_annotations"] == len(expected)
+        linked += len(expected) - 1
+    assert sum(len(samples) for samples in appearances.values()) == len(annos)
+    return len(tables["instance"]), linked
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actors", type=int, default=2000, help="annotated actors of the map")
+    parser.add_argument("--visible", type=float, default=0.5, help="share of the actors annotated per sample")
+    parser.add_argument("--samples", type=int, default=100, help="samples per scene")
+    parser.add_argument("--scenes", type=int, default=2)
+    parser.add_argument("--windows", type=int, default=5, help="rows of the time per sample report")
+    args = parser.parse_args()
+
+    cfg = copy.deepcopy(cfg_from_yaml_file("configs_bev.yaml"))
+    cfg["AGENT_CONFIG"]["NUM_AGENTS"] = 1
+    cfg["SAVE_CONFIG"]["OUTPUT_MODE"] = "files"
+    cfg["SAVE_CONFIG"]["COLUMNAR_EXPORT"] = False
+    root = tempfile.mkdtemp(prefix="bench_linking_")
+    cfg["SAVE_CONFIG"]["ROOT_PATH"] = root
+    try:
+        appearances, sample_ms, sample_annos = record(cfg, args)
+        instances, linked = check(os.path.join(root, "training", "mini"), appearances, args)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    # annotations of the scene after the window, averaged over the scenes
+    scene_annos = sample_annos.cumsum(axis=1).mean(axis=0)
+    print("{:>14} {:>20} {:>14}".format("samples", "scene annotations", "ms/sample"))
+    for window in np.array_split(np.arange(args.samples), args.windows):
+        print("{:>14} {:>20.0f} {:>14.2f}".format("{}-{}".format(window[0] + 1, window[-1] + 1),
+                                                  scene_annos[window[-1]], sample_ms[:, window].mean()))
+    print("{} instances, {} annotation links checked".format(instances, linked))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Memory of the annotation records of a scene: every sample annotates all actors of a synthetic frame with
+lidar_visible and links them with DataSave.post_proc_sample_annotation, like objects_filter and
+save_training_files do for the visible actors. Reports the traced memory allocated per frame by lidar_visible,
+the memory the stream keeps alive for the whole scene (per scene and per annotation) and the time of the
+conversion to the sample_annotation records at the end of the scene.
+
+    python benchmarks/bench_annotation_memory.py --samples 1000 --actors 60
+"""
+
+import io
+import os
+import sys
+import copy
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+fake_carla.install()
+
+from DataSave import DataSave, AgentStream
+from config import cfg_from_yaml_file
+from data_utils import lidar_visible
+from rig_calibration import RigCalibration
+
+
+def run(cfg, args):
+    calibration = RigCalibration.from_cfg(cfg)
+    data = fake_carla.fixture_to_frame(fake_carla.synthetic_fixture(cfg, args.actors, 1000), calibration)
+    states = data["actor_states"]
+    pose = next(iter(data["agents_data"].values()))["pose"]
+    world_to_lidar = calibration.world_to_sensors(pose, [0])[0]
+    rows = np.arange(len(states.actors))
+    allocated = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        dtsave = DataSave(cfg)
+        tracemalloc.start()
+        start, _ = tracemalloc.get_traced_memory()
+        stream = AgentStream(0, len(dtsave.sensors))
+        for sample in range(args.samples):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            annos = [lidar_visible(pose, states, row, None, 100, calibration.intrinsic, world_to_lidar)[2] for row in rows]
+            _, peak = tracemalloc.get_traced_memory()
+            allocated.append(peak - before)
+            dtsave.post_proc_sample_annotation(stream, annos)
+            dtsave.timestamp = sample * 0.05
+            dtsave.save_stream_sample(stream)
+        del annos
+        retained = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.stop()
+        export_start = time.perf_counter()
+        records = [anno.to_json() for anno in stream.annos]
+        export_ms = (time.perf_counter() - export_start) * 1e3
+        dtsave.close()
+    return np.mean(allocated) / 1024, retained / 2 ** 20, retained / len(records), export_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=1000, help="samples of the scene")
+    parser.add_argument("--actors", type=int, default=60, help="annotated actors per sample")
+    args = parser.parse_args()
+
+    cfg = copy.deepcopy(cfg_from_yaml_file("configs_bev.yaml"))
+    root = tempfile.mkdtemp(prefix="bench_annotation_")
+    cfg["SAVE_CONFIG"]["ROOT_PATH"] = root
+    try:
+        allocated_kb, retained_mb, bytes_per_anno, export_ms = run(cfg, args)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    print("lidar_visible allocated per frame  {:10.1f} KB".format(allocated_kb))
+    print("scene of {} samples retained     {:10.2f} MB ({:.0f} bytes per annotation)".format(
+        args.samples, retained_mb, bytes_per_anno))
+    print("sample_annotation records         {:10.1f} ms".format(export_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+SynchronyModel driven by CaptureScheduler against a stub CARLA client, for every SENSOR_GATING mode. The stub
+server spends --tick-ms per world tick plus --render-ms for every sensor with a subscriber, and sends each
+measurement (the size of the configured image or lidar sweep) after a random delay from the sensor's own
+thread. A stream sends --subscribe-ms after listen() at the earliest, like the streaming session of a real client.
+Reports the simulation time per tick (all ticks and skipped ones), the captured ticks/s and the peak traced
+memory of the run.
+
+    python benchmarks/bench_capture_gating.py --captures 20 --step 10
+"""
+
+import os
+import sys
+import copy
+import time
+import queue
+import random
+import argparse
+import threading
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+carla = fake_carla.install()
+
+from SynchronyModel import SynchronyModel
+from capture_scheduler import CaptureScheduler, GATINGS
+from config import cfg_from_yaml_file
+
+
+class StubBlueprint:
+    def __init__(self, blueprint_id):
+        self.id = blueprint_id
+        self.attributes = {}
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+
+class StubLibrary:
+    def filter(self, pattern):
+        return [StubBlueprint(pattern)]
+
+    def find(self, blueprint_id):
+        return StubBlueprint(blueprint_id)
+
+
+class StubMap:
+    def get_spawn_points(self):
+        return [carla.Transform(carla.Location(10.0 * i, 0, 0), carla.Rotation()) for i in range(16)]
+
+
+class StubVehicle(fake_carla.Actor):
+    def set_autopilot(self, enabled, port):
+        pass
+
+    def destroy(self):
+        pass
+
+
+class StubSensor(threading.Thread):
+    """ 有订阅时服务器才渲染，数据在 sensor 自己的线程中经过随机延迟发送 """
+    def __init__(self, world, blueprint, transform):
+        super().__init__(daemon=True)
+        self.world = world
+        self.transform = transform
+        attributes = blueprint.attributes
+        if blueprint.id.startswith("sensor.camera"):
+            self.payload = int(attributes["image_size_x"]) * int(attributes["image_size_y"]) * 4
+        else:
+            self.payload = int(float(attributes["points_per_second"]) * world.delta_s) * 16
+        self.random = random.Random(len(world.sensors))
+        self.callback = None
+        self.subscribed_at = None
+        self.frames = queue.Queue()
+        self.start()
+
+    def listen(self, callback):
+        self.callback = callback
+        self.subscribed_at = time.perf_counter() + self.world.subscribe_s
+
+    def stop(self):
+        self.subscribed_at = None
+
+    def destroy(self):
+        self.frames.put((None, None))
+
+    def get_transform(self):
+        return self.transform
+
+    def streaming(self, now):
+        return self.subscribed_at is not None and now >= self.subscribed_at
+
+    def render(self, frame, now):
+        self.frames.put((frame, now + self.random.expovariate(1 / self.world.jitter_s)))
+
+    def run(self):
+        while True:
+            frame, due = self.frames.get()
+            if frame is None:
+                return
+            time.sleep(max(0.0, due - time.perf_counter()))
+            self.callback(carla.SensorData(frame, self.transform, bytearray(self.payload)))
+
+
+class StubWorld:
+    def __init__(self, args):
+        self.tick_s = args.tick_ms / 1000.0
+        self.render_s = args.render_ms / 1000.0
+        self.jitter_s = args.jitter_ms / 1000.0
+        self.subscribe_s = args.subscribe_ms / 1000.0
+        self.delta_s = 0.05
+        self.frame = 0
+        self.sensors = []
+        self.vehicles = []
+        self.tick_times = []
+
+    def get_settings(self):
+        return carla.libcarla
+
+    def apply_settings(self, settings):
+        pass
+
+    def get_blueprint_library(self):
+        return StubLibrary()
+
+    def get_map(self):
+        return StubMap()
+
+    def spawn_actor(self, blueprint, transform, attach_to=None):
+        if attach_to is None:
+            vehicle = StubVehicle(len(self.sensors), blueprint.id, transform,
+                                  carla.BoundingBox(carla.Location(), carla.Vector3D(2.4, 1.0, 0.75)))
+            self.vehicles.append(vehicle)
+            return vehicle
+        sensor = StubSensor(self, blueprint, transform)
+        self.sensors.append(sensor)
+        return sensor
+
+    def tick(self):
+        start = time.perf_counter()
+        self.frame += 1
+        # subscribed sensors are rendered, the measurement is sent if the stream is in place by then
+        subscribed = [sensor for sensor in self.sensors if sensor.subscribed_at is not None]
+        time.sleep(self.tick_s + self.render_s * len(subscribed))
+        now = time.perf_counter()
+        for sensor in subscribed:
+            if sensor.streaming(now):
+                sensor.render(self.frame, now)
+        self.tick_times.append(now - start)
+        return self.frame
+
+    def get_environment_objects(self, label):
+        return []
+
+    def get_actors(self):
+        return list(self.vehicles)
+
+    def get_snapshot(self):
+        return carla.Snapshot(self.vehicles, self.frame * self.delta_s)
+
+
+class StubClient:
+    world = None
+
+    def __init__(self, host, port):
+        pass
+
+    def set_timeout(self, timeout):
+        pass
+
+    def get_world(self):
+        return StubClient.world
+
+    def get_trafficmanager(self, port):
+        return self
+
+    def get_port(self):
+        return 8000
+
+    def apply_batch_sync(self, batch):
+        pass
+
+
+carla.Client = StubClient
+carla.CityObjectLabel.Any = 0
+
+
+def run(cfg, args):
+    StubClient.world = world = StubWorld(args)
+    model = SynchronyModel(cfg)
+    scheduler = CaptureScheduler.from_cfg(cfg)
+    model.spawn_agent()
+    model.sensor_listen()
+    world.tick_times.clear()
+    skipped = []
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        for step in range(args.captures * args.step):
+            model.set_listening(scheduler.listening(step))
+            if scheduler.is_capture(step):
+                data = model.tick()
+                assert sum(len(agent_data["sensor_data"]) for agent_data in data["agents_data"].values()) == len(world.sensors)
+            else:
+                model.skip_tick()
+                skipped.append(world.tick_times[-1])
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        model.setting_recover()
+    tick_ms, skipped_ms = np.array(world.tick_times) * 1e3, np.array(skipped) * 1e3
+    return {"tick_ms": tick_ms.mean(), "skipped_tick_ms": skipped_ms.mean(), "captures_per_s": args.captures / elapsed,
+            "peak_mb": peak / 2 ** 20, "dropped": model.assembler.dropped_stale}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--captures", type=int, default=20)
+    parser.add_argument("--step", type=int, default=10, help="SAVE_CONFIG.STEP")
+    parser.add_argument("--agents", type=int, default=1, help="AGENT_CONFIG.NUM_AGENTS")
+    parser.add_argument("--tick-ms", type=float, default=2, help="simulated server time per world tick")
+    parser.add_argument("--render-ms", type=float, default=1, help="simulated render time per streaming sensor")
+    parser.add_argument("--jitter-ms", type=float, default=3, help="mean arrival delay of a measurement")
+    parser.add_argument("--subscribe-ms", type=float, default=1, help="delay until a stream sends after listen()")
+    parser.add_argument("--lead", type=int, default=1, help="CARLA_CONFIG.SENSOR_GATING_LEAD")
+    args = parser.parse_args()
+
+    cfg = copy.deepcopy(cfg_from_yaml_file("configs_bev.yaml"))
+    cfg["SAVE_CONFIG"]["STEP"] = args.step
+    cfg["AGENT_CONFIG"]["NUM_AGENTS"] = args.agents
+    cfg["CARLA_CONFIG"]["SENSOR_GATING_LEAD"] = args.lead
+    print("{:<8} {:>9} {:>16} {:>11} {:>9} {:>16}".format("gating", "tick ms", "skipped tick ms", "captures/s",
+                                                          "peak MB", "dropped payloads"))
+    for gating in GATINGS:
+        cfg["CARLA_CONFIG"]["SENSOR_GATING"] = gating
+        result = run(cfg, args)
+        print("{:<8} {:>9.2f} {:>16.2f} {:>11.2f} {:>9.1f} {:>16}".format(
+            gating, result["tick_ms"], result["skipped_tick_ms"], result["captures_per_s"], result["peak_mb"],
+            result["dropped"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Query time and size of the nuscenes json tables against the columnar export (columnar_export.py), on a
+synthetic dataset (see bench_nuscenes_tables.synthetic_dataset). The query selects all cars within
+--radius m of the ego pose of their sample. Needs pyarrow.
+
+    python benchmarks/bench_columnar.py --annotations 200000 --radius 30
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+import columnar_export
+from bench_nuscenes_tables import synthetic_dataset, VERSION
+
+CATEGORY = "vehicle.car"
+
+
+def read_json(table_root, table_name):
+    with open(os.path.join(table_root, "{}.json".format(table_name))) as f:
+        return json.load(f)
+
+
+def query_json(dataroot, radius):
+    table_root = os.path.join(dataroot, VERSION)
+    category = [c["token"] for c in read_json(table_root, "category") if c["name"] == CATEGORY][0]
+    instances = {i["token"] for i in read_json(table_root, "instance") if i["category_token"] == category}
+    lidar = {s["token"] for s in read_json(table_root, "sensor") if s["modality"] == "lidar"}
+    calibrations = {c["token"] for c in read_json(table_root, "calibrated_sensor") if c["sensor_token"] in lidar}
+    poses = {p["token"]: p["translation"] for p in read_json(table_root, "ego_pose")}
+    ego = {sd["sample_token"]: poses[sd["ego_pose_token"]] for sd in read_json(table_root, "sample_data")
+           if sd["calibrated_sensor_token"] in calibrations}
+    cars = [a for a in read_json(table_root, "sample_annotation") if a["instance_token"] in instances]
+    translation = np.array([a["translation"] for a in cars])
+    ego_translation = np.array([ego[a["sample_token"]] for a in cars])
+    near = np.linalg.norm(translation[:, :2] - ego_translation[:, :2], axis=1) <= radius
+    return sorted(a["token"] for a, keep in zip(cars, near) if keep)
+
+
+def query_columnar(folder, radius, file_format):
+    cars = columnar_export.load(folder, "sample_annotation", ["token", "sample_token", "translation"],
+                                ds.field("category_name") == CATEGORY, file_format)
+    poses = columnar_export.load(folder, "ego_pose", ["sample_token", "translation"], file_format=file_format)
+    index = pc.index_in(cars["sample_token"], value_set=poses["sample_token"].combine_chunks()).to_numpy()
+    translation = columnar_export.vectors(cars["translation"], 3)
+    ego_translation = columnar_export.vectors(poses["translation"], 3)[index]
+    near = np.linalg.norm(translation[:, :2] - ego_translation[:, :2], axis=1) <= radius
+    return sorted(np.asarray(cars["token"].to_pylist())[near].tolist())
+
+
+def folder_mb(paths):
+    size = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, files in os.walk(path):
+                size += sum(os.path.getsize(os.path.join(folder, name)) for name in files)
+        else:
+            size += os.path.getsize(path)
+    return size / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--annotations", type=int, default=200000)
+    parser.add_argument("--radius", type=float, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dataroot = tempfile.mkdtemp(prefix="bench_columnar_")
+    try:
+        synthetic_dataset(dataroot, args.annotations)
+        table_root = os.path.join(dataroot, VERSION)
+        json_mb = folder_mb([os.path.join(table_root, "{}.json".format(name)) for name in
+                             ["sample_annotation", "ego_pose", "instance", "category", "sensor", "calibrated_sensor",
+                              "sample_data"]])
+        print("{:<9} {:>10} {:>9} {:>9}".format("layout", "query s", "MB", "matches"))
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            expected = query_json(dataroot, args.radius)
+            timings.append(time.perf_counter() - start)
+        print("{:<9} {:>10.3f} {:>9.1f} {:>9}".format("json", min(timings), json_mb, len(expected)))
+
+        for file_format in columnar_export.FORMATS:
+            folder = columnar_export.convert(dataroot, file_format)
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = query_columnar(folder, args.radius, file_format)
+                timings.append(time.perf_counter() - start)
+            assert result == expected, "{} query differs from the json one".format(file_format)
+            columnar_mb = folder_mb([os.path.join(folder, name) for name in ["sample_annotation", "ego_pose"]])
+            print("{:<9} {:>10.3f} {:>9.1f} {:>9}".format(file_format, min(timings), columnar_mb, len(result)))
+            shutil.rmtree(folder)
+    finally:
+        shutil.rmtree(dataroot, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+filter_by_distance on Town-sized maps: the static environment objects are spread over a map of --map-size
+meters and the vehicles and walkers over the same area, every agent is placed at a random actor location.
+Compares the former per-object Python loop (every object and actor tested for every agent) with the grid of
+spatial_index and the bulk actor test, the results are checked to be identical. The grid is built once per map,
+its build time is listed separately.
+
+    python benchmarks/bench_distance_filter.py --objects 2000 10000 40000 --actors 300 --agents 4
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+carla = fake_carla.install()
+
+from config import cfg_from_yaml_file
+from data_utils import filter_by_distance, distance_between_locations
+from rig_calibration import RigCalibration
+from spatial_index import environment_index
+
+
+def town(cfg, num_objects, num_actors, num_agents, map_size, seed=0):
+    """ fixture frame with num_agents agents at random actor locations, and the environment objects of the map """
+    rng = np.random.default_rng(seed)
+    objects = [carla.EnvironmentObject(i, carla.Transform(carla.Location(x, y, 0.0)))
+               for i, (x, y) in enumerate(rng.uniform(-map_size / 2, map_size / 2, (num_objects, 2)))]
+    fixture = fake_carla.synthetic_fixture(cfg, num_actors, 1000, seed)
+    fixture["actor_transforms"][:, :2] = rng.uniform(-map_size / 2, map_size / 2, (num_actors, 2))
+    data = fake_carla.fixture_to_frame(fixture, RigCalibration.from_cfg(cfg), num_agents=num_agents)
+    for agent_data in data["agents_data"].values():
+        x, y = fixture["actor_transforms"][rng.integers(num_actors), :2]
+        agent_data["pose"] = carla.Transform(carla.Location(x, y, 0.0))
+    return objects, data
+
+
+def per_object_filter(objects, data, dis):
+    """ the former filter_by_distance: every object and actor is tested for every agent in Python """
+    result = {}
+    for agent, agent_data in data["agents_data"].items():
+        agent_location = agent_data["pose"].location
+        near_objects = [obj for obj in objects if distance_between_locations(obj.transform.location, agent_location) < dis]
+        near_actors = [act for act in data["actors"] if act.id != agent.id and
+                       distance_between_locations(act.get_location(), agent_location) < dis]
+        result[agent] = near_objects, near_actors
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", type=int, nargs="+", default=[2000, 10000, 40000])
+    parser.add_argument("--actors", type=int, default=300, help="vehicles and walkers of the map")
+    parser.add_argument("--agents", type=int, default=4, help="AGENT_CONFIG.NUM_AGENTS")
+    parser.add_argument("--map-size", type=float, default=800, help="edge of the square map in meters")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cfg = copy.deepcopy(cfg_from_yaml_file("configs_bev.yaml"))
+    dis = cfg["FILTER_CONFIG"]["PRELIMINARY_FILTER_DISTANCE"]
+    print("{:>8} {:>12} {:>14} {:>14} {:>10}".format("objects", "near/agent", "per-object ms", "grid ms", "build ms"))
+    for num_objects in args.objects:
+        objects, data = town(cfg, num_objects, args.actors, args.agents, args.map_size)
+        start = time.perf_counter()
+        index = environment_index(objects, dis)
+        build_ms = (time.perf_counter() - start) * 1e3
+        old_ms = new_ms = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            expected = per_object_filter(objects, data, dis)
+            old_ms = min(old_ms, (time.perf_counter() - start) * 1e3)
+            frame = dict(data, environment_objects=objects, environment_index=index)
+            start = time.perf_counter()
+            filter_by_distance(frame, dis)
+            new_ms = min(new_ms, (time.perf_counter() - start) * 1e3)
+        for agent, agent_data in frame["agents_data"].items():
+            near_objects, near_actors = expected[agent]
+            assert agent_data["environment_objects"] == near_objects
+            assert agent_data["actors"] == near_actors
+        near = np.mean([len(objects) for objects, _ in expected.values()])
+        print("{:>8} {:>12.1f} {:>14.2f} {:>14.2f} {:>10.2f}".format(num_objects, near, old_ms, new_ms, build_ms))
+
+
+if __name__ == '__main__':
+    main()
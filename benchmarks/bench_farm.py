@@ -0,0 +1,154 @@
+"""
+farm.run_farm with fake in-process CARLA servers: every worker drives a FakeSynchronyModel which replays
+synthetic frames (see fake_carla.synthetic_fixture) and sleeps --tick-ms per world tick like a simulator on its
+own GPU. Reports the samples/s of each worker and of the farm for every number of servers and of agents per
+server (AGENT_CONFIG.NUM_AGENTS), and checks that the merged dataset is one consistent nuScenes dataset (unique tokens, linked scenes, existing files).
+
+    python benchmarks/bench_farm.py --servers 1 2 4 --scenes 8 --tick-ms 20
+    python benchmarks/bench_farm.py --servers 1 --agents 1 2 4 --scenes 4 --tick-ms 100
+"""
+
+import io
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import functools
+import itertools
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+fake_carla.install()
+
+import farm
+from config import cfg_from_yaml_file
+from data_utils import filter_by_distance
+from rig_calibration import RigCalibration
+
+
+class FakeWorld:
+    def __init__(self, tick_s):
+        self.tick_s = tick_s
+        self.frame = 0
+
+    def tick(self):
+        time.sleep(self.tick_s)
+        self.frame += 1
+        return self.frame
+
+
+class FakeSynchronyModel:
+    """ SynchronyModel 的替代，tick() 返回合成帧，每次 world.tick() 等待 tick_ms """
+    def __init__(self, cfg, tick_ms=20, variants=2):
+        self.cfg = cfg
+        self.world = FakeWorld(tick_ms / 1000.0)
+        self.calibration = RigCalibration.from_cfg(cfg)
+        # every server records its own traffic
+        self.fixtures = [fake_carla.synthetic_fixture(cfg, seed=cfg["CARLA_CONFIG"]["PORT"] * 10 + seed)
+                         for seed in range(variants)]
+
+    def set_synchrony(self):
+        pass
+
+    def spawn_actors(self):
+        pass
+
+    def set_actors_route(self):
+        pass
+
+    def spawn_agent(self):
+        pass
+
+    def sensor_listen(self):
+        pass
+
+    def set_listening(self, listening):
+        pass
+
+    def setting_recover(self):
+        pass
+
+    def skip_tick(self):
+        self.world.tick()
+
+    def tick(self):
+        frame = self.world.tick()
+        data = fake_carla.fixture_to_frame(self.fixtures[frame % len(self.fixtures)], self.calibration, frame,
+                                           frame * 0.05, self.cfg["AGENT_CONFIG"]["NUM_AGENTS"])
+        filter_by_distance(data, self.cfg["FILTER_CONFIG"]["PRELIMINARY_FILTER_DISTANCE"])
+        return data
+
+
+def check_merged(output_folder, num_scenes, sample_per_scene):
+    """ 合并后的数据集：token 唯一，场景编号连续，prev/next 链完整，文件存在 """
+    tables = {}
+    for name in farm.GROWING_TABLES + farm.STATIC_TABLES:
+        with open(os.path.join(output_folder, farm.VERSION, "{}.json".format(name))) as f:
+            tables[name] = json.load(f)
+    tokens = [record["token"] for records in tables.values() for record in records]
+    assert len(tokens) == len(set(tokens)), "duplicate tokens"
+    assert [scene["name"] for scene in tables["scene"]] == ["scene-{}".format(i) for i in range(num_scenes)]
+    samples = {sample["token"]: sample for sample in tables["sample"]}
+    assert len(samples) == num_scenes * sample_per_scene
+    for scene in tables["scene"]:
+        token, count = scene["first_sample_token"], 0
+        while token:
+            assert samples[token]["scene_token"] == scene["token"]
+            token, count = samples[token]["next"], count + 1
+        assert count == scene["nbr_samples"] == sample_per_scene
+    calibrations = {calibration["token"] for calibration in tables["calibrated_sensor"]}
+    for sample_data in tables["sample_data"]:
+        assert sample_data["calibrated_sensor_token"] in calibrations
+        assert sample_data["sample_token"] in samples
+        assert os.path.exists(os.path.join(output_folder, sample_data["filename"])), sample_data["filename"]
+    annotation_samples = {annotation["sample_token"] for annotation in tables["sample_annotation"]}
+    assert annotation_samples <= set(samples)
+    # with several agents the chains of every agent stay inside its own scenes
+    for table_name in ["sample_data", "sample_annotation"]:
+        records = {record["token"]: record for record in tables[table_name]}
+        for record in records.values():
+            if record["next"]:
+                assert samples[records[record["next"]]["sample_token"]]["scene_token"] == \
+                    samples[record["sample_token"]]["scene_token"], table_name
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--servers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--tick-ms", type=float, default=20, help="simulated server time per world tick")
+    parser.add_argument("--agents", type=int, nargs="+", default=[1], help="AGENT_CONFIG.NUM_AGENTS of every server")
+    args = parser.parse_args()
+
+    base_cfg = cfg_from_yaml_file("configs_bev.yaml")
+    print("{:>7} {:>6} {:>8} {:>10} {:>10} {:>10}".format("servers", "agents", "samples", "collect s", "merge s",
+                                                          "samples/s"))
+    for num_servers, num_agents in itertools.product(args.servers, args.agents):
+        cfg = copy.deepcopy(base_cfg)
+        root = tempfile.mkdtemp(prefix="bench_farm_")
+        cfg["SAVE_CONFIG"]["ROOT_PATH"] = root
+        cfg["SAVE_CONFIG"]["SCENE_NUM"] = args.scenes
+        cfg["AGENT_CONFIG"]["NUM_AGENTS"] = num_agents
+        endpoints = ["fake{}:{}:{}".format(i, 2000 + 2 * i, 8000 + 2 * i) for i in range(num_servers)]
+        try:
+            # DataSave prints every sample
+            with contextlib.redirect_stdout(io.StringIO()):
+                report = farm.run_farm(cfg, endpoints, functools.partial(FakeSynchronyModel, tick_ms=args.tick_ms))
+            check_merged(os.path.join(root, farm.PHASE), args.scenes * num_agents, cfg["SAVE_CONFIG"]["SAMPLE_PER_SCENE"])
+            print("{:>7} {:>6} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                num_servers, num_agents, report["samples"], report["collect_s"], report["merge_s"], report["samples_per_s"]))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Looking up the annotations of every instance and the samples of every scene with NuScenes.field2token,
+the former linear scan against the secondary index, for the eager and the lazy backend. Results are
+checked to be identical. Needs the nuscenes-devkit.
+
+    python benchmarks/bench_field2token.py --annotations 20000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "nuscenes_api"))
+
+from bench_nuscenes_tables import synthetic_dataset, VERSION
+from nuscenes_dev import NuScenes, ColumnarTable
+
+
+def linear_field2token(nusc, table_name, field, query):
+    """ field2token before the secondary index, a column scan for the lazy backend """
+    table = getattr(nusc, table_name)
+    if isinstance(table, ColumnarTable):
+        return table.field2token(field, query)
+    return [member['token'] for member in table if member[field] == query]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--annotations", type=int, default=20000)
+    parser.add_argument("--linear-queries", type=int, default=200, help="queries timed with the scan")
+    args = parser.parse_args()
+
+    dataroot = tempfile.mkdtemp(prefix="bench_field2token_")
+    try:
+        synthetic_dataset(dataroot, args.annotations)
+        print("{:<6} {:<36} {:>8} {:>14} {:>12} {:>12}".format("mode", "query", "queries", "scan ms/q",
+                                                               "first ms", "indexed us/q"))
+        for lazy in [False, True]:
+            nusc = NuScenes(version=VERSION, dataroot=dataroot, verbose=False, lazy=lazy)
+            for table_name, field, queries in [
+                ("sample_annotation", "instance_token", [record["token"] for record in nusc.instance]),
+                ("sample", "scene_token", [record["token"] for record in nusc.scene]),
+            ]:
+                linear = queries[:args.linear_queries]
+                start = time.perf_counter()
+                expected = [linear_field2token(nusc, table_name, field, query) for query in linear]
+                linear_ms = (time.perf_counter() - start) / len(linear) * 1e3
+
+                nusc.clear_field_indexes()
+                start = time.perf_counter()
+                nusc.field2token(table_name, field, queries[0])
+                first_ms = (time.perf_counter() - start) * 1e3
+                start = time.perf_counter()
+                results = nusc.field2tokens(table_name, field, queries)
+                indexed_us = (time.perf_counter() - start) / len(queries) * 1e6
+                assert results[:len(linear)] == expected
+
+                print("{:<6} {:<36} {:>8} {:>14.2f} {:>12.1f} {:>12.2f}".format(
+                    "lazy" if lazy else "eager", "{}.{}".format(table_name, field), len(queries), linear_ms,
+                    first_ms, indexed_us))
+    finally:
+        shutil.rmtree(dataroot, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Sensor data collection of SynchronyModel.tick with simulated jittered arrivals: every sensor delivers its
+measurement of a world tick on its own thread after a random delay (like the CARLA streaming threads), and
+only every --step-th tick is captured as in generator.run. Compares the former per-sensor queues drained by
+_retrieve_data with FrameAssembler and reports the tick latency (world tick to all measurements), the delay
+after the last arrival of the frame and the peak traced memory of the measurements.
+
+    python benchmarks/bench_frame_assembler.py --sensors 7 --step 10 --jitter-ms 5
+"""
+
+import os
+import sys
+import time
+import queue
+import random
+import argparse
+import threading
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from frame_assembler import FrameAssembler
+
+
+class Measurement:
+    __slots__ = ["frame", "raw_data", "arrival"]
+
+    def __init__(self, frame, size):
+        self.frame = frame
+        self.raw_data = bytearray(size)
+        self.arrival = time.perf_counter()
+
+
+class FakeSensor(threading.Thread):
+    """ 每个传感器一个线程，world tick 后经过随机延迟回调 listen 的函数 """
+    def __init__(self, payload, jitter_s, seed):
+        super().__init__(daemon=True)
+        self.payload = payload
+        self.jitter_s = jitter_s
+        self.random = random.Random(seed)
+        self.ticks = queue.Queue()
+        self.callback = None
+
+    def listen(self, callback):
+        self.callback = callback
+        self.start()
+
+    def on_tick(self, frame, issued):
+        self.ticks.put((frame, issued + self.random.expovariate(1 / self.jitter_s)))
+
+    def run(self):
+        while True:
+            frame, due = self.ticks.get()
+            if frame is None:
+                return
+            time.sleep(max(0.0, due - time.perf_counter()))
+            self.callback(Measurement(frame, self.payload))
+
+
+class FakeWorld:
+    def __init__(self, sensors, tick_s):
+        self.sensors = sensors
+        self.tick_s = tick_s
+        self.frame = 0
+
+    def tick(self):
+        time.sleep(self.tick_s)
+        self.frame += 1
+        issued = time.perf_counter()
+        for sensor in self.sensors:
+            sensor.on_tick(self.frame, issued)
+        return self.frame
+
+
+class QueueCollector:
+    """ 原来的实现：每个传感器一个 queue，依次取出直到 frame 相同 """
+    def __init__(self, sensors):
+        self.queues = []
+        for sensor in sensors:
+            q = queue.Queue()
+            self.queues.append(q)
+            sensor.listen(q.put)
+
+    def wait(self, frame, timeout):
+        return [self._retrieve_data(q, frame) for q in self.queues]
+
+    @staticmethod
+    def _retrieve_data(q, frame):
+        while True:
+            data = q.get()
+            if data.frame == frame:
+                return data
+
+
+class AssemblerCollector(FrameAssembler):
+    def __init__(self, sensors, max_pending):
+        super().__init__(["sensor {}".format(i) for i in range(len(sensors))], max_pending)
+        for slot, sensor in enumerate(sensors):
+            sensor.listen(self.callback(slot))
+
+
+def run(mode, args):
+    sensors = [FakeSensor(args.payload_kb * 1024, args.jitter_ms / 1000.0, seed) for seed in range(args.sensors)]
+    world = FakeWorld(sensors, args.tick_ms / 1000.0)
+    if mode == "queue":
+        collector = QueueCollector(sensors)
+    else:
+        collector = AssemblerCollector(sensors, args.max_pending)
+    latencies, delays = [], []
+    tracemalloc.start()
+    try:
+        for step in range(args.captures * args.step):
+            frame = world.tick()
+            if step % args.step:
+                continue
+            issued = time.perf_counter()
+            data = collector.wait(frame, args.timeout)
+            done = time.perf_counter()
+            assert all(x.frame == frame for x in data)
+            latencies.append(done - issued)
+            delays.append(done - max(x.arrival for x in data))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        for sensor in sensors:
+            sensor.ticks.put((None, None))
+    latencies, delays = np.array(latencies) * 1e3, np.array(delays) * 1e3
+    return {"tick_p50_ms": np.percentile(latencies, 50), "tick_p95_ms": np.percentile(latencies, 95),
+            "delay_p50_ms": np.percentile(delays, 50), "delay_p95_ms": np.percentile(delays, 95),
+            "peak_mb": peak / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sensors", type=int, default=7)
+    parser.add_argument("--step", type=int, default=10, help="SAVE_CONFIG.STEP, one captured tick every step ticks")
+    parser.add_argument("--captures", type=int, default=50)
+    parser.add_argument("--tick-ms", type=float, default=5, help="simulated server time per world tick")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="mean arrival delay of a measurement")
+    parser.add_argument("--payload-kb", type=int, default=1024, help="size of a measurement")
+    parser.add_argument("--max-pending", type=int, default=4, help="CARLA_CONFIG.MAX_PENDING_FRAMES")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print("{:<10} {:>12} {:>12} {:>13} {:>13} {:>10}".format("mode", "tick p50 ms", "tick p95 ms", "delay p50 ms",
+                                                            "delay p95 ms", "peak MB"))
+    for mode in ["queue", "assembler"]:
+        result = run(mode, args)
+        print("{:<10} {:>12.2f} {:>12.2f} {:>13.3f} {:>13.3f} {:>10.1f}".format(
+            mode, result["tick_p50_ms"], result["tick_p95_ms"], result["delay_p50_ms"], result["delay_p95_ms"],
+            result["peak_mb"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Throughput of export_utils.save_camera_image for each image codec, encoding the six cameras of a frame
+with a pool of writer threads like DataSave does. Images are gradients with noise, see
+fake_carla.synthetic_fixture.
+
+    python benchmarks/bench_image_codecs.py --sizes 300x300 1600x900 --threads 1 4
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_carla
+fake_carla.install()
+
+from async_writer import AsyncWriter
+from export_utils import CAMS, save_camera_image, image_codec
+
+CODECS = [
+    ("png", {"IMAGE_FORMAT": "png", "PNG_COMPRESS_LEVEL": 1}),
+    ("png", {"IMAGE_FORMAT": "png", "PNG_COMPRESS_LEVEL": 6}),
+    ("jpg", {"IMAGE_FORMAT": "jpg", "IMAGE_QUALITY": 90}),
+    ("webp", {"IMAGE_FORMAT": "webp", "IMAGE_QUALITY": 90}),
+]
+
+
+def synthetic_images(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in CAMS:
+        bgra = np.empty((height, width, 4), dtype=np.uint8)
+        gradient = np.add.outer(np.arange(height), np.arange(width)) * (255.0 / (height + width))
+        for channel in range(3):
+            bgra[:, :, channel] = np.clip(gradient + rng.normal(0, 4, (height, width)), 0, 255)
+        bgra[:, :, 3] = 255
+        images.append(fake_carla.SensorData(0, fake_carla.Transform(), bgra.tobytes(), width, height))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", default=["300x300", "1600x900"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--frames", type=int, default=10)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench_image_codecs_")
+    try:
+        print("{:>9} {:<12} {:>7} {:>10} {:>9}".format("size", "codec", "threads", "images/s", "KB/image"))
+        for size in args.sizes:
+            width, height = [int(x) for x in size.split("x")]
+            images = synthetic_images(width, height)
+            for name, config in CODECS:
+                image_format, params = image_codec(config)
+                label = "{} {}".format(name, list(params.values())[0])
+                for threads in args.threads:
+                    writer = AsyncWriter(threads, 28)
+                    start = time.perf_counter()
+                    for frame in range(args.frames):
+                        for cam, image in zip(CAMS, images):
+                            filename = os.path.join(folder, "{}_{:06}.{}".format(cam, frame, image_format))
+                            writer.submit(save_camera_image, filename, image, image_format, params)
+                    writer.close()
+                    elapsed = time.perf_counter() - start
+                    num_images = args.frames * len(CAMS)
+                    size_kb = np.mean([os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder)]) / 1024
+                    print("{:>9} {:<12} {:>7} {:>10.1f} {:>9.1f}".format(size, label, threads, num_images / elapsed, size_kb))
+                    for filename in os.listdir(folder):
+                        os.remove(os.path.join(folder, filename))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Lidar conversion: the former per-point list based lidar_to_array/save_lidar_data
+against the array based lidar_to_array/lidar_to_nuscenes_array, on synthetic
+CARLA lidar buffers.
+
+    python benchmarks/bench_lidar.py --points 100000 300000 1000000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeLidarMeasurement:
+    def __init__(self, num_points):
+        points = np.random.uniform(-60, 60, (num_points, 4)).astype(np.float32)
+        points[:, 3] = np.random.uniform(0, 1, num_points)
+        self.raw_data = points.tobytes()
+
+
+def legacy_lidar_to_array(point_cloud):
+    point_cloud = np.copy(np.frombuffer(point_cloud.raw_data, dtype=np.dtype('f4')))
+    point_cloud = np.reshape(point_cloud, (int(point_cloud.shape[0] / 4), 4))
+    point_cloud = point_cloud[:, :-1]
+    lidar_array = [[point[0], point[1], point[2], 1.0] for point in point_cloud]
+    return np.array(lidar_array).astype(np.float32)
+
+
+def legacy_save_array(point_cloud):
+    point_cloud = np.copy(np.frombuffer(point_cloud.raw_data, dtype=np.dtype('f4')))
+    point_cloud = np.reshape(point_cloud, (int(point_cloud.shape[0] / 4), 4))
+    point_cloud = point_cloud[:, :-1]
+    rot_matrix = np.asmatrix([[0, 1, 0], [-1, 0, 0], [0, 0, 1]])
+    lidar_array = [[-point[0], point[1], point[2]] for point in point_cloud]
+    lidar_array = np.array(lidar_array).astype(np.float32)
+    lidar_array = np.array(np.dot(rot_matrix, lidar_array.T).T)
+    lidar_array = [[point[0], point[1], point[2], 1.0, 0] for point in lidar_array]
+    return np.array(lidar_array).astype(np.float32)
+
+
+def timeit(func, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3, result
+
+
+def main():
+    from export_utils import lidar_to_array, lidar_to_nuscenes_array
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, nargs="+", default=[100000, 300000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>9} {:>14} {:>14} {:>14} {:>14}".format(
+        "points", "old array ms", "new array ms", "old save ms", "new save ms"))
+    for num_points in args.points:
+        measurement = FakeLidarMeasurement(num_points)
+        old_array_ms, old_array = timeit(legacy_lidar_to_array, measurement, args.repeat)
+        new_array_ms, new_array = timeit(lidar_to_array, measurement, args.repeat)
+        old_save_ms, old_save = timeit(legacy_save_array, measurement, args.repeat)
+        new_save_ms, new_save = timeit(lambda m: lidar_to_nuscenes_array(lidar_to_array(m)),
+                                       measurement, args.repeat)
+        # the new path keeps the real intensity instead of 1.0
+        assert np.array_equal(old_array[:, :3], new_array[:, :3])
+        assert np.array_equal(old_save[:, :3], new_save[:, :3])
+        print("{:>9} {:>14.1f} {:>14.3f} {:>14.1f} {:>14.1f}".format(
+            num_points, old_array_ms, new_array_ms, old_save_ms, new_save_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Lidar point counting for all actors of a frame: one Open3D OrientedBoundingBox query per
+actor (the former lidar_visible path) against the batched count_points_in_boxes.
+Counts are checked to be identical. Without open3d the per-actor reference is a numpy
+re-implementation of the same box test.
+
+    python benchmarks/bench_lidar_visible.py --actors 10 30 60 120 240
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from pyquaternion import Quaternion
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from data_utils import count_points_in_boxes
+from export_utils_nuscenes import get_quaternion_from_euler
+
+try:
+    import open3d as o3d
+except ImportError:
+    o3d = None
+
+
+def synthetic_frame(num_points, num_actors, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(-50, 50, num_actors), rng.uniform(-50, 50, num_actors),
+                               rng.uniform(-1.5, 0, num_actors)])
+    sizes = np.column_stack([rng.uniform(0.5, 5, num_actors), rng.uniform(0.5, 2.2, num_actors),
+                             rng.uniform(1.4, 2, num_actors)])
+    rotation_y = rng.uniform(0, np.pi, num_actors)
+    # half of the sweep is ground/background, half is sampled around the actors
+    background = rng.uniform([-60, -60, -2], [60, 60, 3], (num_points // 2, 3))
+    owners = rng.integers(0, num_actors, num_points - num_points // 2)
+    around = centers[owners] + rng.normal(0, 1, (owners.shape[0], 3)) * sizes[owners] / 2
+    points = np.vstack([background, around]).astype(np.float32)
+    return points, centers, rotation_y, sizes
+
+
+def per_actor_counts(points, centers, rotation_y, sizes):
+    counts = []
+    for center, rot, size in zip(centers, rotation_y, sizes):
+        R = Quaternion(get_quaternion_from_euler(0, rot, 0)).rotation_matrix
+        if o3d is not None:
+            bbox_3d = o3d.geometry.OrientedBoundingBox(center=center, R=R, extent=size)
+            counts.append(len(bbox_3d.get_point_indices_within_bounding_box(o3d.utility.Vector3dVector(points))))
+        else:
+            local = np.dot(points.astype(np.float64) - center, R)
+            counts.append(int(np.all(np.abs(local) <= size / 2, axis=1).sum()))
+    return np.array(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=30000, help="points per sweep (600k pts/s at 20 Hz)")
+    parser.add_argument("--actors", type=int, nargs="+", default=[10, 30, 60, 120, 240])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    reference = "open3d" if o3d is not None else "numpy"
+    print("{:>7} {:>18} {:>14}".format("actors", reference + " ms", "batched ms"))
+    for num_actors in args.actors:
+        points, centers, rotation_y, sizes = synthetic_frame(args.points, num_actors)
+        old_ms = new_ms = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            expected = per_actor_counts(points, centers, rotation_y, sizes)
+            old_ms = min(old_ms, (time.perf_counter() - start) * 1e3)
+            start = time.perf_counter()
+            counts = count_points_in_boxes(points, centers, -rotation_y, sizes)
+            new_ms = min(new_ms, (time.perf_counter() - start) * 1e3)
+        assert np.array_equal(expected, counts), (expected, counts)
+        print("{:>7} {:>18.2f} {:>14.2f}".format(num_actors, old_ms, new_ms))
+
+
+if __name__ == '__main__':
+    main()
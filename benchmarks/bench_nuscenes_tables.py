@@ -0,0 +1,192 @@
+"""
+Opening a generated dataset with nuscenes_api.NuScenes, eager (json dicts and reverse index) against
+lazy=True (ColumnarTable), on a synthetic dataset with the tables written by DataSave. Each mode runs
+in its own process to measure the peak RSS. lazy-cold builds the .columnar cache, lazy-warm maps it.
+Needs the nuscenes-devkit.
+
+    python benchmarks/bench_nuscenes_tables.py --annotations 100000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from uuid import uuid1
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "nuscenes_api"))
+
+VERSION = "mini"
+CHANNELS = ["LIDAR_TOP", "CAM_BACK", "CAM_BACK_RIGHT", "CAM_FRONT_RIGHT", "CAM_FRONT", "CAM_FRONT_LEFT", "CAM_BACK_LEFT"]
+CATEGORIES = {"human.pedestrian.adult": uuid1().hex, "vehicle.car": uuid1().hex}
+
+
+def chain(records):
+    for prev, record in zip(records, records[1:]):
+        prev["next"] = record["token"]
+        record["prev"] = prev["token"]
+
+
+def synthetic_dataset(dataroot, num_annotations, annotations_per_sample=50, samples_per_scene=40, seed=0):
+    rng = random.Random(seed)
+    tables = {name: [] for name in ["category", "sensor", "calibrated_sensor", "ego_pose", "scene", "sample",
+                                    "sample_data", "sample_annotation", "instance"]}
+    tables["category"] = [{"token": token, "name": name, "description": ""} for name, token in CATEGORIES.items()]
+    for channel in CHANNELS:
+        sensor = {"token": uuid1().hex, "calib_token": uuid1().hex, "channel": channel,
+                  "modality": "lidar" if channel.startswith("LIDAR") else "camera"}
+        tables["sensor"].append(sensor)
+        tables["calibrated_sensor"].append({"token": sensor["calib_token"], "sensor_token": sensor["token"],
+                                            "translation": [0, 0, 1.6], "rotation": [1, 0, 0, 0],
+                                            "camera_intrinsic": []})
+
+    num_samples = num_annotations // annotations_per_sample
+    for first in range(0, num_samples, samples_per_scene):
+        scene = {"token": uuid1().hex, "name": "scene-{}".format(len(tables["scene"])), "description": ""}
+        samples, sample_datas, instances = [], [[] for _ in CHANNELS], []
+        for i in range(first, min(first + samples_per_scene, num_samples)):
+            timestamp = i * 0.5
+            ego_pose = {"token": uuid1().hex, "translation": [rng.uniform(-100, 100), rng.uniform(-100, 100), 0],
+                        "rotation": [1, 0, 0, 0], "timestamp": timestamp}
+            tables["ego_pose"].append(ego_pose)
+            sample = {"token": uuid1().hex, "timestamp": timestamp, "scene_token": scene["token"], "next": "", "prev": ""}
+            samples.append(sample)
+            for channel, sensor, history in zip(CHANNELS, tables["sensor"], sample_datas):
+                history.append({"token": uuid1().hex, "sample_token": sample["token"], "ego_pose_token": ego_pose["token"],
+                                "calibrated_sensor_token": sensor["calib_token"],
+                                "filename": "image/{}/{:06}.png".format(channel, i), "fileformat": "jpg",
+                                "width": 300, "height": 300, "timestamp": timestamp, "is_key_frame": True,
+                                "next": "", "prev": ""})
+            while len(instances) < annotations_per_sample:
+                instances.append({"token": uuid1().hex, "category_token": rng.choice(list(CATEGORIES.values())),
+                                  "annotations": []})
+            for instance in rng.sample(instances, annotations_per_sample):
+                annotation = {"token": uuid1().hex, "sample_token": sample["token"], "instance_token": instance["token"],
+                              "attribute_tokens": [], "visibility_token": "",
+                              "translation": [rng.uniform(-50, 50), rng.uniform(-50, 50), rng.uniform(0, 2)],
+                              "size": [rng.uniform(0.5, 2), rng.uniform(0.5, 5), rng.uniform(1, 2)],
+                              "rotation": [rng.uniform(-1, 1) for _ in range(4)], "num_lidar_pts": rng.randint(10, 500),
+                              "num_radar_pts": 0, "next": "", "prev": ""}
+                instance["annotations"].append(annotation)
+                tables["sample_annotation"].append(annotation)
+        chain(samples)
+        for history in sample_datas:
+            chain(history)
+            tables["sample_data"].extend(history)
+        for instance in instances:
+            annotations = instance.pop("annotations")
+            if annotations:
+                chain(annotations)
+                instance.update(nbr_annotations=len(annotations), first_annotation_token=annotations[0]["token"],
+                                last_annotation_token=annotations[-1]["token"])
+                tables["instance"].append(instance)
+        scene.update(nbr_samples=len(samples), first_sample_token=samples[0]["token"],
+                     last_sample_token=samples[-1]["token"])
+        tables["scene"].append(scene)
+        tables["sample"].extend(samples)
+
+    os.makedirs(os.path.join(dataroot, VERSION))
+    for name, records in tables.items():
+        with open(os.path.join(dataroot, VERSION, "{}.json".format(name)), "w") as f:
+            json.dump(records, f, indent=2)
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def measure(dataroot, lazy, lookups):
+    """ runs in a child process, prints one json line """
+    from nuscenes_dev import NuScenes
+    start = time.perf_counter()
+    nusc = NuScenes(version=VERSION, dataroot=dataroot, verbose=False, lazy=lazy)
+    init_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sample = nusc.get("sample", nusc.scene[0]["first_sample_token"])
+    first_s = time.perf_counter() - start
+    # before the token list below is read
+    rss_mb = peak_rss_mb()
+
+    with open(os.path.join(dataroot, VERSION, "sample_annotation.json")) as f:
+        tokens = [record["token"] for record in json.load(f)]
+    tokens = random.Random(0).sample(tokens, min(lookups, len(tokens)))
+    start = time.perf_counter()
+    for token in tokens:
+        nusc.get("sample_annotation", token)["category_name"]
+    get_us = (time.perf_counter() - start) / len(tokens) * 1e6
+
+    start = time.perf_counter()
+    annotations = nusc.field2token("sample_annotation", "sample_token", sample["token"])
+    field2token_ms = (time.perf_counter() - start) * 1e3
+    assert sorted(annotations) == sorted(sample["anns"])
+    print(json.dumps({"init_s": init_s, "first_get_s": first_s, "get_us": get_us,
+                      "field2token_ms": field2token_ms, "peak_rss_mb": rss_mb}))
+
+
+def check_equal(dataroot, count=2000):
+    """ every field of the lazy records, including the reverse index shortcuts, matches the eager ones """
+    from nuscenes_dev import NuScenes
+    eager = NuScenes(version=VERSION, dataroot=dataroot, verbose=False)
+    lazy = NuScenes(version=VERSION, dataroot=dataroot, verbose=False, lazy=True)
+    rng = random.Random(1)
+    for table in eager.table_names:
+        records = getattr(eager, table)
+        for record in rng.sample(records, min(count, len(records))):
+            assert lazy.get(table, record["token"]) == record, (table, record["token"])
+            assert lazy.getind(table, record["token"]) == eager.getind(table, record["token"])
+    for record in rng.sample(eager.instance, min(100, len(eager.instance))):
+        assert lazy.field2token("sample_annotation", "instance_token", record["token"]) == \
+            eager.field2token("sample_annotation", "instance_token", record["token"])
+    try:
+        lazy.get("sample", "missing")
+        raise AssertionError("missing token did not raise")
+    except KeyError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--annotations", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--measure", choices=["eager", "lazy"], help=argparse.SUPPRESS)
+    parser.add_argument("--dataroot", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.dataroot, args.measure == "lazy", args.lookups)
+        return
+
+    dataroot = tempfile.mkdtemp(prefix="bench_nuscenes_")
+    try:
+        start = time.perf_counter()
+        synthetic_dataset(dataroot, args.annotations)
+        print("generated {} annotations in {:.1f} s".format(args.annotations, time.perf_counter() - start))
+        check_equal(dataroot)
+
+        print("{:<11} {:>8} {:>13} {:>8} {:>16} {:>13}".format("mode", "init s", "first get s", "get us",
+                                                               "field2token ms", "peak RSS MB"))
+        for name, mode in [("eager", "eager"), ("lazy-cold", "lazy"), ("lazy-warm", "lazy")]:
+            if name == "lazy-cold":
+                shutil.rmtree(os.path.join(dataroot, VERSION, ".columnar"), ignore_errors=True)
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--measure", mode,
+                                              "--dataroot", dataroot, "--lookups", str(args.lookups)])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            print("{:<11} {:>8.2f} {:>13.2f} {:>8.1f} {:>16.2f} {:>13.0f}".format(
+                name, result["init_s"], result["first_get_s"], result["get_us"], result["field2token_ms"],
+                result["peak_rss_mb"]))
+    finally:
+        shutil.rmtree(dataroot, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
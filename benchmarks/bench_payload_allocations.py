@@ -0,0 +1,105 @@
+"""
+Memory traffic of the sensor payloads per frame: runs objects_filter and DataSave.save_training_files on fake
+carla frames with the writer tasks executed inline (WRITER_THREADS 0), and reports per stage the traced
+memory allocated on top of the frame (tracemalloc peak above the start of the stage) and the number of
+traced blocks of at least --block-kb that are still alive after the stage (encoded shard members waiting
+for the shard writer). The payload of the frame itself (six BGRA images and the lidar sweep, plus the
+depth images with --depth) is listed for comparison.
+
+    python benchmarks/bench_payload_allocations.py --frames 20 --output-mode files
+    python benchmarks/bench_payload_allocations.py --output-mode shards --depth
+"""
+
+import io
+import os
+import sys
+import copy
+import shutil
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+fake_carla.install()
+
+from DataSave import DataSave
+from config import cfg_from_yaml_file
+from data_utils import objects_filter, filter_by_distance
+from rig_calibration import RigCalibration
+
+STAGES = ["objects_filter", "save_training_files"]
+
+
+def large_blocks(snapshot, block_bytes):
+    return sum(1 for trace in snapshot.traces if trace.size >= block_bytes)
+
+
+def run(args):
+    cfg = copy.deepcopy(cfg_from_yaml_file("configs_bev.yaml"))
+    root = tempfile.mkdtemp(prefix="bench_payload_")
+    cfg["SAVE_CONFIG"]["ROOT_PATH"] = root
+    cfg["SAVE_CONFIG"]["WRITER_THREADS"] = 0
+    cfg["SAVE_CONFIG"]["OUTPUT_MODE"] = args.output_mode
+    cfg["FILTER_CONFIG"]["DEPTH_OCCLUSION"] = args.depth
+    calibration = RigCalibration.from_cfg(cfg)
+    fixtures = [fake_carla.synthetic_fixture(cfg, args.actors, args.points, seed) for seed in range(2)]
+    payload = sum(len(sensor["raw_data"]) for sensor in fixtures[0]["sensors"])
+    allocated = {name: [] for name in STAGES}
+    blocks = {name: [] for name in STAGES}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            dtsave = DataSave(cfg)
+            dtsave.init_scene()
+            tracemalloc.start()
+            for frame in range(args.frames):
+                data = fake_carla.fixture_to_frame(fixtures[frame % len(fixtures)], calibration, frame, frame * 0.05)
+                filter_by_distance(data, cfg["FILTER_CONFIG"]["PRELIMINARY_FILTER_DISTANCE"])
+                dtsave.timestamp = data["timestamp"]
+                for name in STAGES:
+                    start, _ = tracemalloc.get_traced_memory()
+                    tracemalloc.reset_peak()
+                    if name == "objects_filter":
+                        data = objects_filter(data)
+                    else:
+                        dtsave.save_training_files(data)
+                    _, peak = tracemalloc.get_traced_memory()
+                    allocated[name].append(peak - start)
+                    blocks[name].append(large_blocks(tracemalloc.take_snapshot(), args.block_kb * 1024))
+                dtsave.save_sample()
+                if dtsave.sample_id % cfg["SAVE_CONFIG"]["SAMPLE_PER_SCENE"] == 0:
+                    dtsave.save_scene()
+                    dtsave.init_scene()
+            tracemalloc.stop()
+            dtsave.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return payload, {name: (np.mean(allocated[name][1:]) / 2 ** 20, np.mean(blocks[name][1:])) for name in STAGES}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--actors", type=int, default=60)
+    parser.add_argument("--points", type=int, default=30000, help="lidar points per frame")
+    parser.add_argument("--output-mode", choices=["files", "shards", "both"], default="files")
+    parser.add_argument("--depth", action="store_true", help="FILTER_CONFIG.DEPTH_OCCLUSION")
+    parser.add_argument("--block-kb", type=int, default=64, help="size of the blocks counted as retained copies")
+    args = parser.parse_args()
+
+    payload, result = run(args)
+    print("frame payload {:.2f} MB".format(payload / 2 ** 20))
+    print("{:<22} {:>14} {:>16}".format("stage", "allocated MB", "retained blocks"))
+    for name, (allocated_mb, num_blocks) in result.items():
+        print("{:<22} {:>14.2f} {:>16.1f}".format(name, allocated_mb, num_blocks))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+The per-frame pipeline of generator.main without a CARLA server: every frame runs
+filter_by_distance -> objects_filter -> DataSave.save_training_files -> save_sample
+(-> save_scene every SAMPLE_PER_SCENE samples) on fake carla objects, writing the dataset
+to a temporary folder. Reports p50/p95 latency of each stage and the samples/s of the
+whole run including the final close().
+
+    python benchmarks/bench_pipeline.py --frames 100 --actors 60
+    python benchmarks/bench_pipeline.py --fixture frame_000.npz frame_001.npz
+    python benchmarks/bench_pipeline.py --out base.json
+    python benchmarks/bench_pipeline.py --baseline base.json --tolerance 0.2
+
+Recorded frames come from a real run (see fake_carla.frame_to_fixture):
+
+    save_fixture(frame_to_fixture(model.tick()), "frame_000.npz")
+
+With --baseline the exit code is 1 if samples/s or the p95 of a stage got worse than the
+tolerance allows.
+"""
+
+import io
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import functools
+import contextlib
+import collections
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+fake_carla.install()
+
+import DataSave as data_save_module
+import data_utils
+from DataSave import DataSave
+from config import cfg_from_yaml_file
+from data_utils import objects_filter, filter_by_distance
+from rig_calibration import RigCalibration
+
+STAGES = ["filter_by_distance", "objects_filter", "lidar_points_in_actors", "lidar_visible",
+          "save_training_files", "save_sample", "save_scene", "save_camera_image", "save_lidar_data", "close"]
+
+
+class StageTimer:
+    """ 记录每个阶段的耗时，被包装的函数按调用记录（可能在写盘线程中执行） """
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+
+    def wrap(self, module, name):
+        func = getattr(module, name)
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        setattr(module, name, timed)
+
+    def summary(self):
+        result = {}
+        for name in STAGES + sorted(set(self.samples) - set(STAGES)):
+            values = np.array(self.samples.get(name, [])) * 1e3
+            if values.size:
+                result[name] = {"calls": int(values.size), "p50_ms": float(np.percentile(values, 50)),
+                                "p95_ms": float(np.percentile(values, 95)), "total_ms": float(values.sum())}
+        return result
+
+
+def load_fixtures(args, cfg):
+    if args.fixture:
+        return [fake_carla.load_fixture(path) for path in args.fixture]
+    return [fake_carla.synthetic_fixture(cfg, args.actors, args.points, seed) for seed in range(args.variants)]
+
+
+def run(args):
+    cfg = copy.deepcopy(cfg_from_yaml_file("configs_bev.yaml"))
+    root = tempfile.mkdtemp(prefix="bench_pipeline_")
+    cfg["SAVE_CONFIG"]["ROOT_PATH"] = root
+    if args.writer_threads is not None:
+        cfg["SAVE_CONFIG"]["WRITER_THREADS"] = args.writer_threads
+    if args.output_mode is not None:
+        cfg["SAVE_CONFIG"]["OUTPUT_MODE"] = args.output_mode
+    cfg["AGENT_CONFIG"]["NUM_AGENTS"] = args.agents
+    if args.columnar_export is not None:
+        cfg["SAVE_CONFIG"]["COLUMNAR_EXPORT"] = True
+        cfg["SAVE_CONFIG"]["COLUMNAR_FORMAT"] = args.columnar_export
+    calibration = RigCalibration.from_cfg(cfg)
+    fixtures = load_fixtures(args, cfg)
+    sample_per_scene = cfg["SAVE_CONFIG"]["SAMPLE_PER_SCENE"]
+
+    timer = StageTimer()
+    for name in ["lidar_points_in_actors", "lidar_visible"]:
+        timer.wrap(data_utils, name)
+    for name in ["save_camera_image", "save_lidar_data"]:
+        timer.wrap(data_save_module, name)
+
+    frame_times = []
+    try:
+        # DataSave prints every sample
+        with contextlib.redirect_stdout(io.StringIO()):
+            dtsave = DataSave(cfg)
+            dtsave.init_scene()
+            start = time.perf_counter()
+            for frame in range(args.frames):
+                data = fake_carla.fixture_to_frame(fixtures[frame % len(fixtures)], calibration, frame, frame * 0.05,
+                                                   args.agents)
+                frame_start = time.perf_counter()
+                with timer.stage("filter_by_distance"):
+                    filter_by_distance(data, cfg["FILTER_CONFIG"]["PRELIMINARY_FILTER_DISTANCE"])
+                with timer.stage("objects_filter"):
+                    data = objects_filter(data)
+                dtsave.timestamp = data["timestamp"]
+                with timer.stage("save_training_files"):
+                    dtsave.save_training_files(data)
+                with timer.stage("save_sample"):
+                    dtsave.save_sample()
+                if dtsave.sample_id % sample_per_scene == 0:
+                    with timer.stage("save_scene"):
+                        dtsave.save_scene()
+                    dtsave.init_scene()
+                frame_times.append(time.perf_counter() - frame_start)
+            with timer.stage("close"):
+                dtsave.close()
+            elapsed = time.perf_counter() - start
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    frame_ms = np.array(frame_times) * 1e3
+    return {
+        "frames": args.frames,
+        "samples_per_s": args.frames * args.agents / elapsed,
+        "frame_p50_ms": float(np.percentile(frame_ms, 50)),
+        "frame_p95_ms": float(np.percentile(frame_ms, 95)),
+        "writer_threads": cfg["SAVE_CONFIG"]["WRITER_THREADS"],
+        "stages": timer.summary(),
+        "output": root if args.keep else None,
+    }
+
+
+def report(result):
+    print("{:<24} {:>7} {:>10} {:>10} {:>11}".format("stage", "calls", "p50 ms", "p95 ms", "total ms"))
+    for name, stats in result["stages"].items():
+        print("{:<24} {:>7} {:>10.2f} {:>10.2f} {:>11.1f}".format(name, stats["calls"], stats["p50_ms"],
+                                                                 stats["p95_ms"], stats["total_ms"]))
+    print("frame p50 {:.2f} ms, p95 {:.2f} ms, {:.2f} samples/s ({} frames, {} writer threads)".format(
+        result["frame_p50_ms"], result["frame_p95_ms"], result["samples_per_s"], result["frames"],
+        result["writer_threads"]))
+    if result["output"]:
+        print("dataset kept in {}".format(result["output"]))
+
+
+def regressions(result, baseline, tolerance):
+    found = []
+    if result["samples_per_s"] < baseline["samples_per_s"] * (1 - tolerance):
+        found.append("samples/s {:.2f} < {:.2f}".format(result["samples_per_s"], baseline["samples_per_s"]))
+    for name, stats in baseline["stages"].items():
+        current = result["stages"].get(name)
+        if current is not None and current["p95_ms"] > stats["p95_ms"] * (1 + tolerance):
+            found.append("{} p95 {:.2f} ms > {:.2f} ms".format(name, current["p95_ms"], stats["p95_ms"]))
+    return found
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--actors", type=int, default=60, help="actors per synthetic frame")
+    parser.add_argument("--agents", type=int, default=1, help="AGENT_CONFIG.NUM_AGENTS, copies of the recorded agent")
+    parser.add_argument("--points", type=int, default=30000, help="lidar points per synthetic frame")
+    parser.add_argument("--variants", type=int, default=4, help="number of distinct synthetic frames")
+    parser.add_argument("--fixture", nargs="+", help="recorded frames (.npz) used instead of synthetic ones")
+    parser.add_argument("--writer-threads", type=int, help="override SAVE_CONFIG.WRITER_THREADS")
+    parser.add_argument("--output-mode", choices=["files", "shards", "both"], help="override SAVE_CONFIG.OUTPUT_MODE")
+    parser.add_argument("--columnar-export", choices=["parquet", "arrow"], help="enable SAVE_CONFIG.COLUMNAR_EXPORT")
+    parser.add_argument("--keep", action="store_true", help="keep the generated dataset")
+    parser.add_argument("--out", help="write the result as json")
+    parser.add_argument("--baseline", help="json written by --out to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    result = run(args)
+    report(result)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(result, json.load(f), args.tolerance)
+        for line in found:
+            print("REGRESSION: " + line)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
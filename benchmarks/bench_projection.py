@@ -0,0 +1,103 @@
+"""
+Projection of all object boxes into the six cameras: the former per-vertex np.mat path
+(one inv(extrinsic) per vertex) against projection_utils.project_to_cameras.
+The outputs are checked to be numerically equivalent.
+
+    python benchmarks/bench_projection.py --objects 10 60 200
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from numpy.linalg import inv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from projection_utils import world_to_sensor_matrices, vertices_from_extents, transform_points, project_to_cameras
+
+WIDTH, HEIGHT, FOV = 300, 300, 60
+CAMERA_YAWS = [180, 120, 60, 0, 300, 240]
+
+
+class FakeTransform:
+    def __init__(self, x, y, z, yaw):
+        c, s = np.cos(np.radians(yaw)), np.sin(np.radians(yaw))
+        self.matrix = [[c, -s, 0, x], [s, c, 0, y], [0, 0, 1, z], [0, 0, 0, 1]]
+
+    def get_matrix(self):
+        return self.matrix
+
+
+def camera_intrinsic(width, height, fov):
+    k = np.identity(3)
+    k[0, 2] = width / 2.0
+    k[1, 2] = height / 2.0
+    k[0, 0] = k[1, 1] = width / (2.0 * np.tan(fov * np.pi / 360.0))
+    return k
+
+
+def legacy_vertices_to_2d_coords(bbox, intrinsic_mat, extrinsic_mat):
+    vertices_pos2d = []
+    for vertex in bbox:
+        pos_vector = np.array([[vertex[0, 0]], [vertex[0, 1]], [vertex[0, 2]], [1.0]])
+        transformed_3d_pos = np.dot(inv(extrinsic_mat), pos_vector)
+        cords_x_y_z = transformed_3d_pos[:3, :]
+        cords_y_minus_z_x = np.concatenate([cords_x_y_z[1, :], -cords_x_y_z[2, :], cords_x_y_z[0, :]])
+        pos2d = np.dot(intrinsic_mat, cords_y_minus_z_x)
+        pos2d = np.array([pos2d[0] / pos2d[2], pos2d[1] / pos2d[2], pos2d[2]])
+        vertices_pos2d.append((pos2d[1], pos2d[0], pos2d[2]))
+    return vertices_pos2d
+
+
+def legacy_project(corners, intrinsic, cameras):
+    result = []
+    for camera in cameras:
+        extrinsic_mat = np.asmatrix(camera.get_matrix())
+        result.append([legacy_vertices_to_2d_coords(np.asmatrix(bbox), intrinsic, extrinsic_mat) for bbox in corners])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", type=int, nargs="+", default=[10, 60, 200])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    intrinsic = camera_intrinsic(WIDTH, HEIGHT, FOV)
+    cameras = [FakeTransform(10, 20, 1.6, yaw) for yaw in CAMERA_YAWS]
+
+    print("{:>8} {:>14} {:>14}".format("objects", "per-vertex ms", "batched ms"))
+    for num_objects in args.objects:
+        extents = rng.uniform(0.3, 2.5, (num_objects, 3))
+        poses = [FakeTransform(*rng.uniform(-40, 60, 3), rng.uniform(0, 360)) for _ in range(num_objects)]
+        matrices = np.array([p.get_matrix() for p in poses])
+        corners = transform_points(matrices, vertices_from_extents(extents))
+
+        old_ms = new_ms = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            expected = legacy_project(corners, intrinsic, cameras)
+            old_ms = min(old_ms, (time.perf_counter() - start) * 1e3)
+            start = time.perf_counter()
+            pos2d, depth, in_canvas, bbox_2d = project_to_cameras(
+                corners, intrinsic, world_to_sensor_matrices(cameras), WIDTH, HEIGHT)
+            new_ms = min(new_ms, (time.perf_counter() - start) * 1e3)
+
+        expected = np.array(expected, dtype=np.float64).reshape(len(cameras), num_objects, 8, 3)
+        assert np.allclose(expected[..., 0], pos2d[..., 1], rtol=1e-9, atol=1e-6)
+        assert np.allclose(expected[..., 1], pos2d[..., 0], rtol=1e-9, atol=1e-6)
+        assert np.allclose(expected[..., 2], depth, rtol=1e-9, atol=1e-9)
+        # 2d boxes as calc_projected_2d_bbox, away from the truncation boundaries
+        legacy_bbox = np.concatenate([np.trunc(expected[..., [1, 0]]).min(axis=2),
+                                      np.trunc(expected[..., [1, 0]]).max(axis=2)], axis=-1)
+        stable = np.all(np.abs(expected[..., :2] - np.round(expected[..., :2])) > 1e-6, axis=(2, 3))
+        assert np.array_equal(legacy_bbox[stable], bbox_2d[stable])
+        print("{:>8} {:>14.2f} {:>14.3f}".format(num_objects, old_ms, new_ms))
+
+
+if __name__ == '__main__':
+    main()
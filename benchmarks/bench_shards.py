@@ -0,0 +1,82 @@
+"""
+Read throughput of the loose nuScenes file layout against the tar shards (SAVE_CONFIG.OUTPUT_MODE).
+A dataset is generated in "both" mode with bench_pipeline, then every sample (six images and the
+lidar sweep) is read back from the loose files and streamed from the shards. The page cache is
+dropped before each pass when possible (needs root), otherwise the numbers are for warm reads.
+
+    python benchmarks/bench_shards.py --frames 200
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_pipeline
+from export_utils import CAMS
+from shard_writer import ShardReader
+
+
+def drop_page_cache():
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def read_loose(folder, keys, image_format):
+    total = 0
+    for key in keys:
+        paths = [os.path.join(folder, "image", cam, "{}.{}".format(key, image_format)) for cam in CAMS]
+        paths.append(os.path.join(folder, "velodyne", "{}.bin".format(key)))
+        for path in paths:
+            with open(path, "rb") as f:
+                total += len(f.read())
+    return total
+
+
+def read_shards(folder):
+    total = 0
+    for sample in ShardReader(folder):
+        total += sum(len(data) for name, data in sample.items() if not name.startswith("__"))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = bench_pipeline.run(bench_pipeline.parse_args(["--frames", str(args.frames), "--variants", "2",
+                                                           "--output-mode", "both", "--keep"]))
+    folder = os.path.join(result["output"], "training")
+    try:
+        reader = ShardReader(os.path.join(folder, "shards"))
+        keys = reader.keys()
+        image_format = [name for name in reader.get(keys[0]) if name.startswith(CAMS[0] + ".")][0].rsplit(".", 1)[-1]
+        cold = drop_page_cache()
+        print("{} samples in {} shards, {} reads".format(len(keys), len(reader.shards), "cold" if cold else "warm"))
+        print("{:<8} {:>10} {:>10} {:>10}".format("layout", "files", "samples/s", "MB/s"))
+        for name, read, files in [("loose", lambda: read_loose(folder, keys, image_format), len(keys) * (len(CAMS) + 1)),
+                                  ("shards", lambda: read_shards(os.path.join(folder, "shards")), len(reader.shards))]:
+            best = float("inf")
+            for _ in range(args.repeat):
+                drop_page_cache()
+                start = time.perf_counter()
+                total = read()
+                best = min(best, time.perf_counter() - start)
+            print("{:<8} {:>10} {:>10.1f} {:>10.1f}".format(name, files, len(keys) / best, total / best / 2 ** 20))
+    finally:
+        shutil.rmtree(result["output"], ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Startup of the background traffic: SynchronyModel.spawn_actors and set_actors_route against a counting stub
+client, compared with the former implementation (apply_batch_sync inside the spawn point loop, one
+set_autopilot per vehicle and three get_actor calls per walker controller). Every SpawnActor command of a
+vehicle or walker fails with --fail-rate, and a spawn point that is already taken fails as a collision, so the
+retry path of batch_spawn is exercised. Counts the apply_batch_sync calls, the commands they carry and the
+per-actor calls of the client.
+
+    python benchmarks/bench_spawn.py --vehicles 200 --walkers 200 --fail-rate 0.05
+"""
+
+import io
+import os
+import sys
+import copy
+import types
+import random
+import logging
+import argparse
+import contextlib
+import collections
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import fake_carla
+carla = fake_carla.install()
+
+from SynchronyModel import SynchronyModel
+from config import cfg_from_yaml_file
+
+CALLS = collections.Counter()
+
+
+def counted(name, method):
+    def call(*args, **kwargs):
+        CALLS[name] += 1
+        return method(*args, **kwargs)
+    return call
+
+
+class Counted:
+    """ 公开方法的调用都经过客户端，按 prefix.name 计数 """
+    prefix = None
+
+    def __getattribute__(self, name):
+        attribute = super().__getattribute__(name)
+        if callable(attribute) and not name.startswith("_"):
+            return counted(type(self).prefix + "." + name, attribute)
+        return attribute
+
+
+class StubAttribute:
+    recommended_values = ["0", "1", "2"]
+
+
+class StubBlueprint:
+    def __init__(self, blueprint_id):
+        self.id = blueprint_id
+
+    def has_attribute(self, name):
+        return name in ("color", "driver_id", "is_invincible")
+
+    def get_attribute(self, name):
+        return StubAttribute()
+
+    def set_attribute(self, name, value):
+        pass
+
+
+class StubLibrary:
+    def filter(self, pattern):
+        return [StubBlueprint(pattern.replace("*", str(i))) for i in range(4)]
+
+    def find(self, blueprint_id):
+        return StubBlueprint(blueprint_id)
+
+
+class StubMap:
+    def __init__(self, num_spawn_points):
+        self.spawn_points = [carla.Transform(carla.Location(10.0 * i, 0.0, 0.5)) for i in range(num_spawn_points)]
+
+    def get_spawn_points(self):
+        return list(self.spawn_points)
+
+
+class StubActor(Counted):
+    prefix = "actor"
+
+    def __init__(self, actor_id):
+        self.id = actor_id
+
+    def set_autopilot(self, enabled, port):
+        pass
+
+    def start(self):
+        pass
+
+    def go_to_location(self, destination):
+        pass
+
+    def set_max_speed(self, speed):
+        pass
+
+
+class StubWorld(Counted):
+    prefix = "world"
+
+    def __init__(self, num_spawn_points):
+        self.map = StubMap(num_spawn_points)
+        self.actors = {}
+
+    def get_blueprint_library(self):
+        return StubLibrary()
+
+    def get_map(self):
+        return self.map
+
+    def get_random_location_from_navigation(self):
+        return carla.Location(random.uniform(-500, 500), random.uniform(-500, 500), 1.0)
+
+    def set_pedestrians_cross_factor(self, factor):
+        pass
+
+    def get_actor(self, actor_id):
+        return self.actors[actor_id]
+
+    def get_actors(self, actor_ids=None):
+        return [self.actors[actor_id] for actor_id in actor_ids]
+
+    def tick(self):
+        return 0
+
+
+class StubClient(Counted):
+    prefix = "client"
+    world = None
+    fail_rate = 0.0
+    commands = 0
+
+    def __init__(self, host, port):
+        self.rng = random.Random(0)
+        self.taken = set()
+
+    def set_timeout(self, timeout):
+        pass
+
+    def get_world(self):
+        return StubClient.world
+
+    def get_trafficmanager(self, port):
+        return types.SimpleNamespace(set_global_distance_to_leading_vehicle=lambda distance: None,
+                                     set_synchronous_mode=lambda enabled: None, get_port=lambda: port)
+
+    def apply_batch_sync(self, batch, do_tick=False):
+        StubClient.commands += len(batch)
+        responses = []
+        for command in batch:
+            error, actor_id = "", 0
+            if isinstance(command, carla.command.SpawnActor):
+                location = command.transform.location
+                key = (location.x, location.y, location.z)
+                if command.parent is not None:
+                    # walker controllers
+                    pass
+                elif key in self.taken:
+                    error = "Spawn failed because of collision at spawn position"
+                elif self.rng.random() < StubClient.fail_rate:
+                    error = "Spawn failed"
+                else:
+                    self.taken.add(key)
+                if not error:
+                    actor_id = len(self.world.actors) + 1
+                    self.world.actors[actor_id] = StubActor(actor_id)
+            responses.append(types.SimpleNamespace(error=error, actor_id=actor_id))
+        return responses
+
+
+carla.Client = StubClient
+
+
+def former_spawn_actors(model):
+    """ spawn_actors before the batched spawn: the growing batch is submitted for every spawn point """
+    num_of_vehicles = model.cfg["CARLA_CONFIG"]["NUM_OF_VEHICLES"]
+    num_of_walkers = model.cfg["CARLA_CONFIG"]["NUM_OF_WALKERS"]
+    blueprints = model.world.get_blueprint_library().filter("vehicle.*")
+    spawn_points = model.world.get_map().get_spawn_points()
+    random.shuffle(spawn_points)
+    num_of_vehicles = min(num_of_vehicles, len(spawn_points))
+    batch = []
+    for n, transform in enumerate(spawn_points):
+        if n >= num_of_vehicles:
+            break
+        batch.append(carla.command.SpawnActor(random.choice(blueprints), transform))
+        for response in model.client.apply_batch_sync(batch):
+            if not response.error:
+                model.actors["non_agents"].append(response.actor_id)
+
+    blueprintsWalkers = model.world.get_blueprint_library().filter("walker.pedestrian.*")
+    batch = []
+    for i in range(num_of_walkers):
+        spawn_point = carla.Transform()
+        spawn_point.location = model.world.get_random_location_from_navigation()
+        batch.append(carla.command.SpawnActor(random.choice(blueprintsWalkers), spawn_point))
+    for response in model.client.apply_batch_sync(batch, True):
+        if not response.error:
+            model.actors["walkers"].append(response.actor_id)
+    model.world.tick()
+
+
+def former_set_actors_route(model):
+    """ set_actors_route before the batched commands """
+    for vehicle in model.world.get_actors(model.actors["non_agents"]):
+        vehicle.set_autopilot(True, model.traffic_manager.get_port())
+    walker_controller_bp = model.world.get_blueprint_library().find('controller.ai.walker')
+    batch = [carla.command.SpawnActor(walker_controller_bp, carla.Transform(), walker)
+             for walker in model.actors["walkers"]]
+    controllers_id = [response.actor_id for response in model.client.apply_batch_sync(batch, True)
+                      if not response.error]
+    model.world.set_pedestrians_cross_factor(0.2)
+    for con_id in controllers_id:
+        model.world.get_actor(con_id).start()
+        model.world.get_actor(con_id).go_to_location(model.world.get_random_location_from_navigation())
+        model.world.get_actor(con_id).set_max_speed(10)
+
+
+def run(cfg, args, former):
+    random.seed(0)
+    StubClient.world = StubWorld(args.spawn_points)
+    StubClient.fail_rate = args.fail_rate
+    StubClient.commands = 0
+    model = SynchronyModel(cfg)
+    CALLS.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if former:
+            former_spawn_actors(model)
+            former_set_actors_route(model)
+        else:
+            model.spawn_actors()
+            model.set_actors_route()
+    return {
+        "apply_batch_sync": CALLS["client.apply_batch_sync"],
+        "commands": StubClient.commands,
+        "set_autopilot": CALLS["actor.set_autopilot"],
+        "get_actor(s)": CALLS["world.get_actor"] + CALLS["world.get_actors"],
+        "vehicles": len(model.actors["non_agents"]),
+        "walkers": len(model.actors["walkers"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=200, help="CARLA_CONFIG.NUM_OF_VEHICLES")
+    parser.add_argument("--walkers", type=int, default=200, help="CARLA_CONFIG.NUM_OF_WALKERS")
+    parser.add_argument("--spawn-points", type=int, default=265, help="spawn points of the map")
+    parser.add_argument("--fail-rate", type=float, default=0.05, help="share of failing SpawnActor commands")
+    parser.add_argument("--chunk-size", type=int, default=0, help="CARLA_CONFIG.SPAWN_CHUNK_SIZE")
+    args = parser.parse_args()
+
+    cfg = copy.deepcopy(cfg_from_yaml_file("configs_bev.yaml"))
+    cfg["CARLA_CONFIG"]["NUM_OF_VEHICLES"] = args.vehicles
+    cfg["CARLA_CONFIG"]["NUM_OF_WALKERS"] = args.walkers
+    cfg["CARLA_CONFIG"]["SPAWN_CHUNK_SIZE"] = args.chunk_size
+    logging.disable(logging.WARNING)
+    results = {"before": run(cfg, args, True), "after": run(cfg, args, False)}
+    columns = list(results["after"])
+    print("{:<8}".format("") + "".join("{:>18}".format(column) for column in columns))
+    for name, result in results.items():
+        print("{:<8}".format(name) + "".join("{:>18}".format(result[column]) for column in columns))
+    assert results["after"]["vehicles"] == args.vehicles and results["after"]["walkers"] == args.walkers
+
+
+if __name__ == '__main__':
+    main()
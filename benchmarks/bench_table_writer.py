@@ -0,0 +1,92 @@
+"""
+Per-sample write cost of the nuScenes tables: rewriting the json arrays with
+append_json/extend_json versus streaming them with TableWriter.
+
+    python benchmarks/bench_table_writer.py --sizes 100 1000 10000 50000
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+from uuid import uuid1
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export_utils_nuscenes import append_json, extend_json
+from table_writer import TableWriter
+
+TABLES = ["ego_pose", "sample_data", "sample_annotation"]
+SENSORS_PER_SAMPLE = 7
+ANNOS_PER_SAMPLE = 20
+
+
+def fake_sample():
+    ego_pose = {"token": uuid1().hex, "translation": [1.0, 2.0, 3.0],
+                "rotation": [1.0, 0.0, 0.0, 0.0], "timestamp": 1.0}
+    sample_datas = [{"token": uuid1().hex, "sample_token": uuid1().hex, "ego_pose_token": ego_pose["token"],
+                     "calibrated_sensor_token": uuid1().hex, "filename": "image/CAM_FRONT/000000.png",
+                     "fileformat": "png", "width": 300, "height": 300, "timestamp": 1.0,
+                     "is_key_frame": True, "next": "", "prev": ""} for _ in range(SENSORS_PER_SAMPLE)]
+    annos = [{"token": uuid1().hex, "sample_token": uuid1().hex, "instance_token": uuid1().hex,
+              "attribute_tokens": [], "visibility_token": "", "translation": [1.0, 2.0, 3.0],
+              "size": [1.0, 2.0, 3.0], "rotation": [1.0, 0.0, 0.0, 0.0], "num_lidar_pts": 100,
+              "num_radar_pts": 0, "next": "", "prev": ""} for _ in range(ANNOS_PER_SAMPLE)]
+    return ego_pose, sample_datas, annos
+
+
+def run_legacy(root, num_samples, window):
+    for table in TABLES:
+        with open(os.path.join(root, table + ".json"), "w") as f:
+            json.dump([], f)
+    start = None
+    for i in range(num_samples):
+        if i == num_samples - window:
+            start = time.perf_counter()
+        ego_pose, sample_datas, annos = fake_sample()
+        append_json(os.path.join(root, "ego_pose.json"), ego_pose)
+        extend_json(os.path.join(root, "sample_data.json"), sample_datas)
+        extend_json(os.path.join(root, "sample_annotation.json"), annos)
+    return (time.perf_counter() - start) / window
+
+
+def run_streaming(root, num_samples, window):
+    tables = TableWriter(root, TABLES)
+    start = None
+    for i in range(num_samples):
+        if i == num_samples - window:
+            start = time.perf_counter()
+        ego_pose, sample_datas, annos = fake_sample()
+        tables.append("ego_pose", ego_pose)
+        tables.extend("sample_data", sample_datas)
+        tables.extend("sample_annotation", annos)
+    per_sample = (time.perf_counter() - start) / window
+    start = time.perf_counter()
+    tables.close()
+    return per_sample, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--window", type=int, default=50, help="samples timed at the end of each run")
+    parser.add_argument("--legacy-max", type=int, default=300, help="largest size run with append_json")
+    args = parser.parse_args()
+
+    print("{:>8} {:>18} {:>18} {:>12}".format("samples", "append_json ms", "TableWriter ms", "close s"))
+    for size in args.sizes:
+        window = min(args.window, size)
+        root = tempfile.mkdtemp()
+        try:
+            legacy = run_legacy(root, size, window) * 1e3 if size <= args.legacy_max else float("nan")
+            streaming, close = run_streaming(root, size, window)
+        finally:
+            shutil.rmtree(root)
+        print("{:>8} {:>18.3f} {:>18.3f} {:>12.2f}".format(size, legacy, streaming * 1e3, close))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Token generation: throughput of uuid1().hex (the former tokens) against record_token, new_token and new_tokens,
+and a collision check over --count tokens of --workers farm workers. Every worker gets the namespace of its
+index (tokens.worker_namespace) and generates the tokens of its records as DataSave does: scenes of
+--samples samples with a sample, an ego pose, a sample_data per sensor and an annotation and instance per actor,
+plus counter tokens in batches. The 128-bit values of all tokens are checked to be distinct.
+
+    python benchmarks/bench_tokens.py --count 10000000 --workers 8
+"""
+
+import os
+import sys
+import time
+import argparse
+from uuid import uuid1
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import tokens
+
+NUM_SENSORS = 7
+
+
+def throughput(args):
+    tokens.set_namespace(tokens.worker_namespace(args.seed, 0))
+    n = args.throughput
+    generators = {
+        "uuid1().hex": lambda: [uuid1().hex for _ in range(n)],
+        "new_token()": lambda: [tokens.new_token() for _ in range(n)],
+        "new_tokens({})".format(args.batch): lambda: [token for _ in range(n // args.batch)
+                                                      for token in tokens.new_tokens(args.batch)],
+        "record_token()": lambda: [tokens.record_token(tokens.ANNOTATION, i >> 16, i >> 8 & 0xff, i & 0xff)
+                                   for i in range(n)],
+    }
+    result = {}
+    for name, generate in generators.items():
+        start = time.perf_counter()
+        generate()
+        result[name] = n / (time.perf_counter() - start)
+    return result
+
+
+def worker_tokens(num, actors, samples):
+    """ num 个 token：按 DataSave 的记录依次生成，每个场景之后一批计数 token """
+    scene = 0
+    while num > 0:
+        scene_tokens = [tokens.record_token(tokens.SCENE, scene)]
+        for sample in range(samples):
+            scene_tokens.append(tokens.record_token(tokens.SAMPLE, scene, sample))
+            scene_tokens.append(tokens.record_token(tokens.EGO_POSE, scene, sample))
+            scene_tokens += [tokens.record_token(tokens.SAMPLE_DATA, scene, sample, i) for i in range(NUM_SENSORS)]
+            scene_tokens += [tokens.record_token(tokens.ANNOTATION, scene, sample, actor) for actor in actors]
+        scene_tokens += [tokens.record_token(tokens.INSTANCE, scene, item=actor) for actor in actors]
+        scene_tokens += tokens.new_tokens(len(scene_tokens) // 4)
+        yield scene_tokens[:num]
+        num -= len(scene_tokens)
+        scene += 1
+
+
+def collisions(args):
+    """ 所有 worker 的 token 转换为两个 uint64 后检查是否重复 """
+    rng = np.random.default_rng(args.seed)
+    per_worker = args.count // args.workers
+    high = np.empty(per_worker * args.workers, dtype=np.uint64)
+    low = np.empty_like(high)
+    filled = 0
+    start = time.perf_counter()
+    for worker in range(args.workers):
+        tokens.set_namespace(tokens.worker_namespace(args.seed, worker))
+        # carla ids of the annotated actors, ids grow over a long run
+        actors = np.sort(rng.choice(1 << 20, args.actors, replace=False)).tolist()
+        for chunk in worker_tokens(per_worker, actors, args.samples):
+            assert all(len(token) == 32 for token in chunk)
+            high[filled:filled + len(chunk)] = [int(token[:16], 16) for token in chunk]
+            low[filled:filled + len(chunk)] = [int(token[16:], 16) for token in chunk]
+            filled += len(chunk)
+    elapsed = time.perf_counter() - start
+    values = np.empty(filled, dtype=[("high", np.uint64), ("low", np.uint64)])
+    values["high"], values["low"] = high[:filled], low[:filled]
+    values.sort()
+    duplicates = int(np.count_nonzero(values[1:] == values[:-1]))
+    return filled, duplicates, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10000000, help="tokens of the collision check")
+    parser.add_argument("--workers", type=int, default=8, help="farm workers sharing the seed")
+    parser.add_argument("--actors", type=int, default=60, help="annotated actors per sample")
+    parser.add_argument("--samples", type=int, default=40, help="samples per scene")
+    parser.add_argument("--throughput", type=int, default=200000, help="tokens per throughput run")
+    parser.add_argument("--batch", type=int, default=1000, help="batch size of new_tokens")
+    parser.add_argument("--seed", type=int, default=12345, help="SAVE_CONFIG.TOKEN_SEED")
+    args = parser.parse_args()
+
+    print("{:<18} {:>14}".format("generator", "tokens/s"))
+    for name, rate in throughput(args).items():
+        print("{:<18} {:>14,.0f}".format(name, rate))
+    count, duplicates, elapsed = collisions(args)
+    print("{:,} tokens of {} workers in {:.1f} s, {} duplicates".format(count, args.workers, elapsed, duplicates))
+    assert duplicates == 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+A minimal stand-in for the carla client module and the frame fixtures used by the benchmarks.
+
+Only the parts of the API touched by the per-frame pipeline (objects_filter, DataSave and the
+export functions) are provided, so the pipeline can be timed without a running CARLA server.
+install() has to be called before any module of the repository is imported.
+
+A frame fixture is a plain dict of numpy arrays and lists. It is either synthesised with
+synthetic_fixture, or recorded from a real run with frame_to_fixture(model.tick()) and
+save_fixture, and turned back into a tick() result with fixture_to_frame.
+"""
+
+import sys
+import json
+import types
+
+import numpy as np
+from PIL import Image
+
+
+class Vector3D:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+
+class Location(Vector3D):
+    pass
+
+
+class Rotation:
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch, self.yaw, self.roll = float(pitch), float(yaw), float(roll)
+
+
+class Transform:
+    def __init__(self, location=None, rotation=None):
+        self.location = location if location is not None else Location()
+        self.rotation = rotation if rotation is not None else Rotation()
+
+    def get_matrix(self):
+        """ same convention as carla.Transform.get_matrix """
+        cy, sy = np.cos(np.radians(self.rotation.yaw)), np.sin(np.radians(self.rotation.yaw))
+        cr, sr = np.cos(np.radians(self.rotation.roll)), np.sin(np.radians(self.rotation.roll))
+        cp, sp = np.cos(np.radians(self.rotation.pitch)), np.sin(np.radians(self.rotation.pitch))
+        loc = self.location
+        return [[cp * cy, cy * sp * sr - sy * cr, -cy * sp * cr - sy * sr, loc.x],
+                [cp * sy, sy * sp * sr + cy * cr, -sy * sp * cr + cy * sr, loc.y],
+                [sp, -cp * sr, cp * cr, loc.z],
+                [0.0, 0.0, 0.0, 1.0]]
+
+
+class BoundingBox:
+    def __init__(self, location, extent):
+        self.location = location
+        self.extent = extent
+        self.rotation = Rotation()
+
+
+class EnvironmentObject:
+    def __init__(self, object_id=0, transform=None, bounding_box=None, object_type=None):
+        self.id = object_id
+        self.transform = transform if transform is not None else Transform()
+        self.bounding_box = bounding_box
+        self.type = object_type
+
+
+class CityObjectLabel:
+    Any = 255
+
+
+class Actor:
+    """ also used as the actor snapshot returned by Snapshot.find """
+    def __init__(self, actor_id, type_id, transform, bounding_box, velocity=None, acceleration=None,
+                 angular_velocity=None):
+        self.id = actor_id
+        self.type_id = type_id
+        self.bounding_box = bounding_box
+        self._transform = transform
+        self._velocity = velocity or Vector3D()
+        self._acceleration = acceleration or Vector3D()
+        self._angular_velocity = angular_velocity or Vector3D()
+
+    def get_transform(self):
+        return self._transform
+
+    def get_location(self):
+        return self._transform.location
+
+    def get_velocity(self):
+        return self._velocity
+
+    def get_acceleration(self):
+        return self._acceleration
+
+    def get_angular_velocity(self):
+        return self._angular_velocity
+
+
+class Snapshot:
+    def __init__(self, actors, timestamp):
+        self.actors = {actor.id: actor for actor in actors}
+        self.platform_timestamp = timestamp
+
+    def find(self, actor_id):
+        return self.actors.get(actor_id)
+
+
+class SpawnActor:
+    def __init__(self, blueprint, transform, parent=None):
+        self.blueprint = blueprint
+        self.transform = transform
+        self.parent = parent
+
+
+class SetAutopilot:
+    def __init__(self, actor_id, enabled, tm_port=8000):
+        self.actor_id = actor_id
+        self.enabled = enabled
+        self.tm_port = tm_port
+
+
+class DestroyActor:
+    def __init__(self, actor_id):
+        self.actor_id = actor_id
+
+
+class SensorData:
+    def __init__(self, frame, transform, raw_data, width=0, height=0):
+        self.frame = frame
+        self.transform = transform
+        self.raw_data = raw_data
+        self.width = width
+        self.height = height
+
+    def save_to_disk(self, filename):
+        """ png encoding of the BGRA buffer, like carla.Image.save_to_disk """
+        bgra = np.frombuffer(self.raw_data, dtype=np.uint8).reshape(self.height, self.width, 4)
+        Image.fromarray(bgra[:, :, 2::-1]).save(filename)
+
+
+def install():
+    """ 注册假的 carla 模块，必须在导入仓库中的模块之前调用 """
+    module = types.ModuleType("carla")
+    for cls in [Vector3D, Location, Rotation, Transform, BoundingBox, EnvironmentObject, CityObjectLabel,
+                Actor, Snapshot, SensorData]:
+        setattr(module, cls.__name__, cls)
+    module.libcarla = types.SimpleNamespace(Rotation=Rotation, Location=Location, Transform=Transform)
+    # commands of client.apply_batch_sync, executed by the stub clients of the benchmarks
+    module.command = types.SimpleNamespace(SpawnActor=SpawnActor, SetAutopilot=SetAutopilot, DestroyActor=DestroyActor)
+    sys.modules["carla"] = module
+    return module
+
+
+def _transform(values):
+    return Transform(Location(*values[:3]), Rotation(*values[3:]))
+
+
+def _transform_values(transform):
+    loc, rot = transform.location, transform.rotation
+    return [loc.x, loc.y, loc.z, rot.pitch, rot.yaw, rot.roll]
+
+
+def _vector_values(vec):
+    return [vec.x, vec.y, vec.z]
+
+
+def sensor_layout(cfg):
+    """ (name, blueprint, attribute, transform) of the sensors in the order spawned by SynchronyModel.spawn_agent """
+    sensors = [(name, config["BLUEPRINT"], config["ATTRIBUTE"], config["TRANSFORM"])
+               for name, config in cfg["SENSOR_CONFIG"].items()]
+    if cfg["FILTER_CONFIG"].get("DEPTH_OCCLUSION"):
+        sensors += [(name + "_DEPTH", "sensor.camera.depth", attribute, transform)
+                    for name, blueprint, attribute, transform in list(sensors) if blueprint == "sensor.camera.rgb"]
+    return sensors
+
+
+def synthetic_fixture(cfg, num_actors=60, num_points=30000, seed=0):
+    """
+    随机生成一帧数据：agent 周围 num_actors 个车辆和行人，一半的激光点落在 actor 周围，
+    rgb images are smooth gradients with noise so png encoding costs about as much as a rendered frame.
+    """
+    rng = np.random.default_rng(seed)
+    agent_transform = np.array([70.0, 13.0, 0.5, 0.0, rng.uniform(-180, 180), 0.0])
+    agent_yaw = np.radians(agent_transform[4])
+    rot_z = np.array([[np.cos(agent_yaw), -np.sin(agent_yaw), 0],
+                      [np.sin(agent_yaw), np.cos(agent_yaw), 0],
+                      [0, 0, 1]])
+
+    is_car = rng.random(num_actors) < 0.7
+    distance = rng.uniform(3, 45, num_actors)
+    angle = rng.uniform(-np.pi, np.pi, num_actors)
+    actor_transforms = np.zeros((num_actors, 6))
+    actor_transforms[:, 0] = agent_transform[0] + distance * np.cos(angle)
+    actor_transforms[:, 1] = agent_transform[1] + distance * np.sin(angle)
+    actor_transforms[:, 2] = np.where(is_car, 0.0, 0.9)
+    actor_transforms[:, 4] = rng.uniform(-180, 180, num_actors)
+    actor_extents = np.where(is_car[:, None], [2.4, 1.0, 0.75], [0.2, 0.2, 0.9]) * rng.uniform(0.9, 1.1, (num_actors, 1))
+    actor_bbox_locations = np.zeros((num_actors, 3))
+    actor_bbox_locations[:, 2] = np.where(is_car, actor_extents[:, 2], 0.0)
+
+    sensors = []
+    for name, blueprint, attribute, transform in sensor_layout(cfg):
+        location = agent_transform[:3] + rot_z.dot(transform["location"])
+        rotation = np.array(transform["rotation"], dtype=np.float64) + [0, agent_transform[4], 0]
+        sensor = {"name": name, "blueprint": blueprint, "transform": np.concatenate([location, rotation]),
+                  "width": 0, "height": 0}
+        if blueprint == "sensor.lidar.ray_cast":
+            world_to_lidar = np.linalg.inv(np.array(_transform(sensor["transform"]).get_matrix()))
+            centers = actor_transforms[:, :3] + actor_bbox_locations
+            background = rng.uniform([-60, -60, -1.6], [60, 60, 3], (num_points // 2, 3))
+            owners = rng.integers(0, num_actors, num_points - num_points // 2)
+            around = centers[owners] + rng.uniform(-1, 1, (owners.shape[0], 3)) * actor_extents[owners]
+            around = np.dot(np.column_stack([around, np.ones(len(around))]), world_to_lidar.T)[:, :3]
+            points = np.empty((num_points, 4), dtype=np.float32)
+            points[:, :3] = np.vstack([background, around])
+            points[:, 3] = rng.uniform(0, 1, num_points)
+            sensor["raw_data"] = points.tobytes()
+        else:
+            width, height = attribute["image_size_x"], attribute["image_size_y"]
+            sensor["width"], sensor["height"] = width, height
+            bgra = np.empty((height, width, 4), dtype=np.uint8)
+            if blueprint == "sensor.camera.depth":
+                # everything on the far plane, no vertex is occluded
+                bgra[...] = 255
+            else:
+                gradient = np.add.outer(np.arange(height), np.arange(width)) * (255.0 / (height + width))
+                for channel in range(3):
+                    bgra[:, :, channel] = np.clip(gradient + rng.normal(0, 4, (height, width)), 0, 255)
+                bgra[:, :, 3] = 255
+            sensor["raw_data"] = bgra.tobytes()
+        sensors.append(sensor)
+
+    return {
+        "timestamp": 0.0,
+        "frame": 0,
+        "agent_id": 0,
+        "agent_type_id": cfg["AGENT_CONFIG"]["BLUEPRINT"],
+        "agent_transform": agent_transform,
+        "agent_imu": np.zeros((3, 3)),
+        "sensors": sensors,
+        "actor_ids": np.arange(1, num_actors + 1),
+        "actor_type_ids": ["vehicle.tesla.model3" if car else "walker.pedestrian.0001" for car in is_car],
+        "actor_transforms": actor_transforms,
+        "actor_extents": actor_extents,
+        "actor_bbox_locations": actor_bbox_locations,
+        "actor_velocities": np.zeros((num_actors, 3, 3)),
+    }
+
+
+def frame_to_fixture(data, sensor_names=None):
+    """ 将 SynchronyModel.tick() 的结果（第一个agent）保存为 fixture，用于记录真实的帧 """
+    agent, agent_data = next(iter(data["agents_data"].items()))
+    snapshot = data["snapshot"]
+    actors = [actor for actor in data["actors"]
+              if actor.type_id.find("vehicle") != -1 or actor.type_id.find("walker") != -1]
+    sensors = []
+    for i, sensor_data in enumerate(agent_data["sensor_data"]):
+        sensors.append({
+            "name": sensor_names[i] if sensor_names else str(i),
+            "blueprint": "sensor.lidar.ray_cast" if i == 0 else "sensor.camera.rgb" if i < 7 else "sensor.camera.depth",
+            "transform": np.array(_transform_values(sensor_data.transform)),
+            "width": getattr(sensor_data, "width", 0),
+            "height": getattr(sensor_data, "height", 0),
+            "raw_data": bytes(sensor_data.raw_data),
+        })
+    actor_snapshots = [snapshot.find(actor.id) for actor in actors]
+    imu = agent_data["imu"]
+    return {
+        "timestamp": data["timestamp"],
+        "frame": agent_data["sensor_data"][0].frame,
+        "agent_id": agent.id,
+        "agent_type_id": agent.type_id,
+        "agent_transform": np.array(_transform_values(agent_data["pose"])),
+        "agent_imu": np.array([_vector_values(imu["acc"]), _vector_values(imu["vel"]), _vector_values(imu["rot"])]),
+        "sensors": sensors,
+        "actor_ids": np.array([actor.id for actor in actors]),
+        "actor_type_ids": [actor.type_id for actor in actors],
+        "actor_transforms": np.array([_transform_values(a.get_transform()) for a in actor_snapshots]).reshape(-1, 6),
+        "actor_extents": np.array([_vector_values(a.bounding_box.extent) for a in actors]).reshape(-1, 3),
+        "actor_bbox_locations": np.array([_vector_values(a.bounding_box.location) for a in actors]).reshape(-1, 3),
+        "actor_velocities": np.array([[_vector_values(a.get_velocity()), _vector_values(a.get_acceleration()),
+                                       _vector_values(a.get_angular_velocity())] for a in actor_snapshots]).reshape(-1, 3, 3),
+    }
+
+
+def save_fixture(fixture, path):
+    """ 保存为 npz，传感器的 raw_data 以 uint8 数组保存 """
+    meta = {key: value for key, value in fixture.items() if not isinstance(value, np.ndarray) and key != "sensors"}
+    meta["sensors"] = [{key: value for key, value in sensor.items() if key not in ("transform", "raw_data")}
+                       for sensor in fixture["sensors"]]
+    arrays = {key: value for key, value in fixture.items() if isinstance(value, np.ndarray)}
+    for i, sensor in enumerate(fixture["sensors"]):
+        arrays["sensor_transform_{}".format(i)] = sensor["transform"]
+        arrays["sensor_raw_data_{}".format(i)] = np.frombuffer(sensor["raw_data"], dtype=np.uint8)
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_fixture(path):
+    with np.load(path) as f:
+        fixture = json.loads(str(f["meta"]))
+        for key in f.files:
+            if not key.startswith("sensor_") and key != "meta":
+                fixture[key] = f[key]
+        for i, sensor in enumerate(fixture["sensors"]):
+            sensor["transform"] = f["sensor_transform_{}".format(i)]
+            sensor["raw_data"] = f["sensor_raw_data_{}".format(i)].tobytes()
+    return fixture
+
+
+def fixture_to_frame(fixture, calibration, frame=0, timestamp=None, num_agents=1, environment=None):
+    """
+    由 fixture 生成与 SynchronyModel.tick() 相同结构的数据（未经过 filter_by_distance），
+    num_agents > 1 时其余 agent 为同一位置、同一传感器数据的副本（AGENT_CONFIG.NUM_AGENTS）
+    :param environment: (environment_objects, environment_index) of the map, none by default
+    """
+    actors = []
+    for i, actor_id in enumerate(fixture["actor_ids"]):
+        velocity, acceleration, angular_velocity = [Vector3D(*v) for v in fixture["actor_velocities"][i]]
+        bbox = BoundingBox(Location(*fixture["actor_bbox_locations"][i]), Vector3D(*fixture["actor_extents"][i]))
+        actors.append(Actor(int(actor_id), fixture["actor_type_ids"][i], _transform(fixture["actor_transforms"][i]),
+                            bbox, velocity, acceleration, angular_velocity))
+    acc, vel, rot = [Vector3D(*v) for v in fixture["agent_imu"]]
+    sensor_data = [SensorData(frame, _transform(sensor["transform"]), sensor["raw_data"], sensor["width"], sensor["height"])
+                   for sensor in fixture["sensors"]]
+    timestamp = fixture["timestamp"] if timestamp is None else timestamp
+    agents_data = {}
+    for i in range(num_agents):
+        # ids above the ones of the recorded actors
+        agent = Actor(int(fixture["agent_id"]) + i * 1000000, fixture["agent_type_id"], _transform(fixture["agent_transform"]),
+                      BoundingBox(Location(), Vector3D(2.4, 1.0, 0.75)), vel, acc, rot)
+        agents_data[agent] = {
+            "pose": agent.get_transform(),
+            "imu": {"acc": acc, "vel": vel, "rot": rot},
+            "sensor_data": sensor_data,
+            "calibration": calibration,
+        }
+    # imported here, the repository modules need the fake carla module installed first
+    from actor_states import ActorStates
+    from spatial_index import environment_index
+    if environment is None:
+        environment = [], environment_index([])
+    snapshot = Snapshot(actors, timestamp)
+    return {
+        "environment_objects": environment[0],
+        "environment_index": environment[1],
+        "actors": actors,
+        "snapshot": snapshot,
+        "actor_states": ActorStates(actors, snapshot),
+        "timestamp": timestamp,
+        "agents_data": agents_data,
+    }
@@ -0,0 +1,30 @@
+"""
+Decides which world ticks are captured and when the sensors have to listen.
+
+Only every STEP-th tick is saved. With SENSOR_GATING "listen" the sensors are stopped after a capture and listen
+again SENSOR_GATING_LEAD ticks before the next one (the subscription of a stream needs a tick to be in place),
+so the server neither renders nor streams the ticks in between. With "none" the sensors always listen and
+the measurements of the skipped ticks are dropped by the FrameAssembler as soon as they arrive.
+"""
+
+GATINGS = ["none", "listen"]
+
+
+class CaptureScheduler:
+    def __init__(self, step, gating="none", lead=1):
+        assert gating in GATINGS, "unknown SENSOR_GATING {}".format(gating)
+        self.step = step
+        self.gating = gating
+        self.lead = lead
+
+    @classmethod
+    def from_cfg(cls, cfg):
+        return cls(cfg["SAVE_CONFIG"]["STEP"], cfg["CARLA_CONFIG"]["SENSOR_GATING"],
+                   cfg["CARLA_CONFIG"]["SENSOR_GATING_LEAD"])
+
+    def is_capture(self, step):
+        return step % self.step == 0
+
+    def listening(self, step):
+        """ 第 step 次 tick 时传感器是否需要监听：采集的 tick 及其之前的 lead 个 tick """
+        return self.gating == "none" or -step % self.step <= self.lead
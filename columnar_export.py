@@ -0,0 +1,219 @@
+"""
+Columnar export of the annotations, ego poses and can_bus rows.
+
+The nuscenes json tables have to be parsed completely even if a query only needs a few columns. Here the
+records are written as Parquet (or Arrow IPC) files with float32 columns for translation/size/rotation,
+partitioned by scene:
+
+    <OUTPUT_FOLDER>/columnar/sample_annotation/scene=scene-0/part-0.parquet
+    <OUTPUT_FOLDER>/columnar/ego_pose/scene=scene-0/part-0.parquet
+    <OUTPUT_FOLDER>/columnar/can_bus/scene=scene-0/part-0.parquet
+
+either by DataSave at the end of every scene (SAVE_CONFIG.COLUMNAR_EXPORT) or afterwards from the json
+tables and the can_bus files
+
+    python columnar_export.py data/nuscenes/training --format parquet
+
+and read back with `load`, e.g. the cars of a dataset:
+
+    cars = load(folder, "sample_annotation", ["sample_token", "translation"], ds.field("category_name") == "vehicle.car")
+
+Needs pyarrow.
+"""
+
+import os
+import glob
+import json
+import logging
+import argparse
+
+import numpy as np
+
+from export_utils_nuscenes import CAN_BUS_FILE, can_bus_id, scene_id_of
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FOLDER = "columnar"
+FORMATS = ("parquet", "arrow")
+VERSION = "mini"
+# can_bus 每行的数据：位置、旋转四元数、加速度、速度、角速度
+CAN_BUS_FIELDS = [("location", 3), ("rotation", 4), ("acc", 3), ("vel", 3), ("rot", 3)]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The columnar export needs pyarrow, install it with `pip install pyarrow`")
+
+
+def vector_array(values, size):
+    """ (N, size) 的数值转换为 float32 定长列表列 """
+    array = np.asarray(values, dtype=np.float32).reshape(-1, size)
+    return pa.FixedSizeListArray.from_arrays(pa.array(array.ravel()), size)
+
+
+def vectors(column, size):
+    """ 定长列表列转换回 (N, size) 的 numpy 数组 """
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks() if column.num_chunks else pa.array([], pa.list_(pa.float32(), size))
+    return column.flatten().to_numpy(zero_copy_only=False).reshape(-1, size)
+
+
+def annotation_table(records):
+    """ records 为 sample_annotation 的记录，另含 category_name """
+    return pa.table({
+        "token": pa.array([r["token"] for r in records], pa.string()),
+        "sample_token": pa.array([r["sample_token"] for r in records], pa.string()),
+        "instance_token": pa.array([r["instance_token"] for r in records], pa.string()),
+        "category_name": pa.array([r["category_name"] for r in records], pa.string()).dictionary_encode(),
+        "attribute_tokens": pa.array([r["attribute_tokens"] for r in records], pa.list_(pa.string())),
+        "visibility_token": pa.array([r["visibility_token"] for r in records], pa.string()),
+        "translation": vector_array([r["translation"] for r in records], 3),
+        "size": vector_array([r["size"] for r in records], 3),
+        "rotation": vector_array([r["rotation"] for r in records], 4),
+        "num_lidar_pts": pa.array([r["num_lidar_pts"] for r in records], pa.int32()),
+        "num_radar_pts": pa.array([r["num_radar_pts"] for r in records], pa.int32()),
+        "next": pa.array([r["next"] for r in records], pa.string()),
+        "prev": pa.array([r["prev"] for r in records], pa.string()),
+    })
+
+
+def ego_pose_table(records):
+    """ records 为 ego_pose 的记录，另含所属 sample 的 sample_token """
+    return pa.table({
+        "token": pa.array([r["token"] for r in records], pa.string()),
+        "sample_token": pa.array([r["sample_token"] for r in records], pa.string()),
+        "timestamp": pa.array([r["timestamp"] for r in records], pa.float64()),
+        "translation": vector_array([r["translation"] for r in records], 3),
+        "rotation": vector_array([r["rotation"] for r in records], 4),
+    })
+
+
+def can_bus_table(rows, timestamps):
+    """ rows 为 can_bus 文件中的数值行（16 列），timestamps 为对应的时间戳 """
+    rows = np.asarray(rows, dtype=np.float32).reshape(-1, sum(size for _, size in CAN_BUS_FIELDS))
+    columns = {"timestamp": pa.array(timestamps, pa.float64())}
+    start = 0
+    for name, size in CAN_BUS_FIELDS:
+        columns[name] = vector_array(rows[:, start:start + size], size)
+        start += size
+    return pa.table(columns)
+
+
+def write_partition(folder, table_name, scene_name, table, file_format="parquet"):
+    """ 写入 <folder>/<table_name>/scene=<scene_name>/part-0.<file_format>，已存在时覆盖 """
+    directory = os.path.join(folder, table_name, "scene={}".format(scene_name))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "part-0.{}".format(file_format))
+    tmp_path = path + ".tmp"
+    if file_format == "parquet":
+        pq.write_table(table, tmp_path, compression="zstd")
+    else:
+        feather.write_feather(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+
+def load(folder, table_name, columns=None, filter=None, file_format="parquet"):
+    """ 读取一个表的所有分片，scene 分区作为 scene 列，columns 和 filter 只读取需要的列和行 """
+    _require_pyarrow()
+    # only the finished files of this format, not the .tmp files of an interrupted write
+    files = sorted(glob.glob(os.path.join(folder, table_name, "scene=*", "*.{}".format(file_format))))
+    dataset = ds.dataset(files, format="parquet" if file_format == "parquet" else "ipc",
+                         partitioning=ds.partitioning(flavor="hive"), partition_base_dir=os.path.join(folder, table_name))
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+class ColumnarExporter:
+    """ DataSave 在每个场景结束时写出该场景的分片 """
+    def __init__(self, folder, file_format="parquet"):
+        _require_pyarrow()
+        assert file_format in FORMATS, "Unsupported columnar format {}".format(file_format)
+        self.folder = folder
+        self.file_format = file_format
+
+    def write_scene(self, scene_name, annos, ego_poses, can_bus_rows):
+        """
+        :param annos: NuscenesDescriptor of the scene, prev/next complete
+        :param ego_poses: ego_pose records with sample_token
+        :param can_bus_rows: (timestamp, can_bus values)
+        """
+        annotations = [dict(anno.to_json(), category_name=anno.category) for anno in annos]
+        write_partition(self.folder, "sample_annotation", scene_name, annotation_table(annotations), self.file_format)
+        write_partition(self.folder, "ego_pose", scene_name, ego_pose_table(ego_poses), self.file_format)
+        write_partition(self.folder, "can_bus", scene_name,
+                        can_bus_table([row for _, row in can_bus_rows], [t for t, _ in can_bus_rows]), self.file_format)
+
+
+def _read_table(table_root, table_name):
+    with open(os.path.join(table_root, "{}.json".format(table_name))) as f:
+        return json.load(f)
+
+
+def convert(output_folder, file_format="parquet"):
+    """ 由 <output_folder>/mini 的 json 表和 can_bus 文件生成 <output_folder>/columnar """
+    _require_pyarrow()
+    table_root = os.path.join(output_folder, VERSION)
+    folder = os.path.join(output_folder, FOLDER)
+    scenes = _read_table(table_root, "scene")
+    samples = _read_table(table_root, "sample")
+    scene_names = {scene["token"]: scene["name"] for scene in scenes}
+    sample_scene = {sample["token"]: scene_names[sample["scene_token"]] for sample in samples}
+
+    categories = {category["token"]: category["name"] for category in _read_table(table_root, "category")}
+    instance_category = {instance["token"]: categories[instance["category_token"]]
+                         for instance in _read_table(table_root, "instance")}
+    annotations = {name: [] for name in scene_names.values()}
+    for record in _read_table(table_root, "sample_annotation"):
+        record["category_name"] = instance_category[record["instance_token"]]
+        annotations[sample_scene[record["sample_token"]]].append(record)
+
+    # the ego pose of a sample is the one of its lidar sample_data
+    lidar_sensors = {sensor["token"] for sensor in _read_table(table_root, "sensor") if sensor["modality"] == "lidar"}
+    lidar_calibrations = {calibration["token"] for calibration in _read_table(table_root, "calibrated_sensor")
+                          if calibration["sensor_token"] in lidar_sensors}
+    pose_sample = {sample_data["ego_pose_token"]: sample_data["sample_token"]
+                   for sample_data in _read_table(table_root, "sample_data")
+                   if sample_data["calibrated_sensor_token"] in lidar_calibrations}
+    ego_poses = {name: [] for name in scene_names.values()}
+    for record in _read_table(table_root, "ego_pose"):
+        sample_token = pose_sample.get(record["token"])
+        if sample_token is not None:
+            ego_poses[sample_scene[sample_token]].append(dict(record, sample_token=sample_token))
+
+    timestamps = {name: [] for name in scene_names.values()}
+    for sample in samples:
+        timestamps[sample_scene[sample["token"]]].append(sample["timestamp"])
+
+    for scene in scenes:
+        name = scene["name"]
+        write_partition(folder, "sample_annotation", name, annotation_table(annotations[name]), file_format)
+        write_partition(folder, "ego_pose", name, ego_pose_table(ego_poses[name]), file_format)
+        can_bus_path = os.path.join(output_folder, "can_bus", CAN_BUS_FILE.format(can_bus_id(scene_id_of(name))))
+        rows, scene_timestamps = [], []
+        if os.path.exists(can_bus_path):
+            with open(can_bus_path) as f:
+                rows = [[float(value) for value in line.split(",")] for line in f if line.strip()]
+            # every agent writes one row per sample to the file of its scene. A run killed before save_scene leaves
+            # rows without samples in it, which an (A)ppend run then continues, the rows can not be matched then
+            if len(rows) == len(timestamps[name]):
+                scene_timestamps = sorted(timestamps[name])
+            else:
+                logging.error("%s: %d can_bus rows in %s for %d samples, the can_bus timestamps are left NaN",
+                              name, len(rows), can_bus_path, len(timestamps[name]))
+                scene_timestamps = [float("nan")] * len(rows)
+        write_partition(folder, "can_bus", name, can_bus_table(rows, scene_timestamps), file_format)
+    return folder
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_folder", help="e.g. data/nuscenes/training")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    args = parser.parse_args()
+    print(convert(args.output_folder, args.format))
@@ -20,21 +20,25 @@
 
 from typing import List
 from math import pi
-from uuid import uuid1
+
+import numpy as np
 
 class KittiDescriptor:
     """
-    Kitti格式的label类
+    Kitti格式的label类，数值在 __str__ 中才格式化为字符串
     """
-    def __init__(self, type=None, bbox=None, dimensions=None, location=None, rotation_y=None, extent=None):
+    __slots__ = ("type", "truncated", "occluded", "alpha", "bbox", "location", "rotation_y", "extent")
+
+    def __init__(self, type=None, bbox=None, location=None, rotation_y=None, extent=None):
         self.type = type
         self.truncated = 0
         self.occluded = 0
         self.alpha = -10
         self.bbox = bbox
-        self.dimensions = dimensions
+        # x y z in kitti camera coordinates
         self.location = location
         self.rotation_y = rotation_y
+        # half of height, width, length
         self.extent = extent
 
     def set_type(self, obj_type: str):
@@ -68,9 +72,13 @@ class KittiDescriptor:
         # z: up (direction of car roof)
         # However, Kitti expects height, width and length (z, y, x):
         height, width, length = bbox_extent.z, bbox_extent.x, bbox_extent.y
-        # Since Carla gives us bbox extent, which is a half-box, multiply all by two
         self.extent = (height, width, length)
-        self.dimensions = "{} {} {}".format(2*height, 2*width, 2*length)
+
+    @property
+    def dimensions(self):
+        # Since Carla gives us bbox extent, which is a half-box, multiply all by two
+        height, width, length = self.extent
+        return "{} {} {}".format(2*height, 2*width, 2*length)
 
     def set_3d_object_location(self, obj_location):
         """
@@ -105,7 +113,7 @@ class KittiDescriptor:
             # we need to subtract the bbox extent in the height direction when adding location of pedestrian.
             z -= self.extent[0]
 
-        self.location = " ".join(map(str, [y, -z, x]))
+        self.location = (y, -z, x)
 
     def set_rotation_y(self, rotation_y: float):
         assert - \
@@ -123,8 +131,8 @@ class KittiDescriptor:
 
         # kitti目标检测数据的标准格式
         return "{} {} {} {} {} {} {} {}".format(self.type, self.truncated, self.occluded,
-                                                         self.alpha, bbox_format, self.dimensions, self.location,
-                                                         self.rotation_y)
+                                                         self.alpha, bbox_format, self.dimensions,
+                                                         " ".join(map(str, self.location)), self.rotation_y)
 
 """
 #Values    Name      Description
@@ -137,6 +145,9 @@ class KittiDescriptor:
 """
 
 class CarlaDescriptor:
+    """ velocity, acceleration and angular_velocity are (x, y, z), formatted in __str__ """
+    __slots__ = ("type", "velocity", "acceleration", "angular_velocity")
+
     def __init__(self):
         self.type = None
         self.velocity = None
@@ -157,23 +168,28 @@ class CarlaDescriptor:
         self.angular_velocity = angular_velocity
 
     def __str__(self):
-        return "{} {} {} {}".format(self.type, self.velocity, self.acceleration, self.angular_velocity)
+        return "{} {} {} {}".format(self.type, *["{} {} {}".format(*vec) for vec in
+                                                 [self.velocity, self.acceleration, self.angular_velocity]])
 
 class NuscenesDescriptor:
     """
-    Nuscenes格式的label类
+    Nuscenes格式的label类，DataSave 保留一个场景的所有 annotation 直到 save_scene，
+    translation, size and rotation are kept in one float64 array and only become lists in to_json
     """
+    __slots__ = ("carla_id", "token", "category", "sample_token", "instance_token", "attribute_tokens",
+                 "visibility_token", "box", "num_lidar_pts", "next", "prev")
+
     def __init__(self):
         self.carla_id = 0
-        self.token = uuid1().hex
+        # set by DataSave.post_proc_sample_annotation from the scene, sample and carla id, see tokens.py
+        self.token = ""
         self.category = ""
         self.sample_token = ""
         self.instance_token = ""
-        self.attribute_tokens = []
+        self.attribute_tokens = ()
         self.visibility_token = ""
-        self.translation = []
-        self.size = []
-        self.rotation = []
+        # translation (3), size (3), rotation (4)
+        self.box = np.zeros(10)
         self.num_lidar_pts = 0
         self.next = ""
         self.prev = ""
@@ -181,6 +197,9 @@ class NuscenesDescriptor:
     def set_carla_id(self, carla_id: int):
         self.carla_id = carla_id
 
+    def set_token(self, token: str):
+        self.token = token
+
     def set_category(self, category: str):
         self.category = category
 
@@ -191,22 +210,34 @@ class NuscenesDescriptor:
         self.instance_token = instance_token
 
     def set_attribute_tokens(self, attribute_tokens: list):
-        self.attribute_tokens = attribute_tokens
+        self.attribute_tokens = tuple(attribute_tokens)
 
     def set_visibility_token(self, visibility_token: str):
         self.visibility_token = visibility_token
 
     def set_translation(self, translation: list):
         assert len(translation) == 3
-        self.translation = translation
+        self.box[:3] = translation
 
     def set_size(self, size: list):
         assert len(size) == 3
-        self.size = size
+        self.box[3:6] = size
 
     def set_rotation(self, rotation: list):
         assert len(rotation) == 4
-        self.rotation = rotation
+        self.box[6:] = rotation
+
+    @property
+    def translation(self):
+        return self.box[:3].tolist()
+
+    @property
+    def size(self):
+        return self.box[3:6].tolist()
+
+    @property
+    def rotation(self):
+        return self.box[6:].tolist()
 
     def set_num_lidar_pts(self, num_lidar_pts: int):
         self.num_lidar_pts = num_lidar_pts
@@ -218,15 +249,16 @@ class NuscenesDescriptor:
         self.prev = prev
 
     def to_json(self):
+        box = self.box.tolist()
         sample_annotation = {
             "token": self.token,
             "sample_token": self.sample_token,
             "instance_token": self.instance_token,
-            "attribute_tokens": self.attribute_tokens,
+            "attribute_tokens": list(self.attribute_tokens),
             "visibility_token": self.visibility_token,
-            "translation": self.translation,
-            "size": self.size,
-            "rotation": self.rotation,
+            "translation": box[:3],
+            "size": box[3:6],
+            "rotation": box[6:],
             "num_lidar_pts": self.num_lidar_pts,
             "num_radar_pts": 0, # reserve for further use
             "next": self.next,
@@ -1,7 +1,6 @@
 import sys
 
 import numpy as np
-from numpy.linalg import inv
 
 from config import cfg_from_yaml_file
 from data_descriptor import KittiDescriptor, CarlaDescriptor, NuscenesDescriptor
@@ -10,8 +9,10 @@ import math
 from visual_utils import draw_3d_bounding_box
 from export_utils_nuscenes import get_quaternion_from_euler
 from export_utils import lidar_to_array
+from metrics import metrics
+from projection_utils import world_to_sensor_matrices, transform_to_matrix, vertices_from_extents, \
+    transform_points, project_to_cameras
 import open3d as o3d
-from pyquaternion import Quaternion
 
 sys.path.append("/opt/carla-simulator/PythonAPI/carla/dist/carla-0.9.12-py3.7-linux-x86_64.egg")
 
@@ -24,22 +25,30 @@ MIN_VISIBLE_VERTICES_FOR_RENDER = cfg["FILTER_CONFIG"]["MIN_VISIBLE_VERTICES_FOR
 MAX_OUT_VERTICES_FOR_RENDER = cfg["FILTER_CONFIG"]["MAX_OUT_VERTICES_FOR_RENDER"]
 WINDOW_WIDTH = cfg["SENSOR_CONFIG"]["CAM_BACK"]["ATTRIBUTE"]["image_size_x"]
 WINDOW_HEIGHT = cfg["SENSOR_CONFIG"]["CAM_BACK"]["ATTRIBUTE"]["image_size_y"]
+# candidate (box, point) pairs of count_points_in_boxes tested at once, bounds the temporary copies of the points
+MAX_CANDIDATE_PAIRS = 1 << 13
 
+@metrics.timed("objects_filter")
 def objects_filter(data):
     environment_objects = data["environment_objects"]
     agents_data = data["agents_data"]
-    actors = data["actors"]
-    snapshot = data["snapshot"]
-    actors = [x for x in actors if x.type_id.find("vehicle") != -1 or x.type_id.find("pedestrian") != -1]
+    # the state of every actor of the tick, see actor_states.py
+    states = data["actor_states"]
     for agent, dataDict in agents_data.items():
-        intrinsic = dataDict["intrinsic"]
-        extrinsic = dataDict["extrinsic"]
+        # the vehicles and walkers near this agent and their rows in states, see filter_by_distance
+        actors = dataDict["actors"]
+        rows = dataDict["actor_rows"]
+        # only the agent pose is taken from this tick, the sensor poses follow from the rig calibration
+        pose = dataDict["pose"]
+        calibration = dataDict["calibration"]
+        intrinsic = calibration.intrinsic
+        world_to_lidar = calibration.world_to_sensors(pose, [0])[0]
         sensors_data = dataDict["sensor_data"]
         kitti_datapoints = []
         carla_datapoints = []
         nuscenes_datapoints = []
-        rgb_images = [to_rgb_array(img) for img in sensors_data[1:7]]
-        images = rgb_images.copy()
+        # read-only views of the carla buffers, which the writer threads encode at the same time
+        images = [to_rgb_array(img) for img in sensors_data[1:7]]
         # depth_images = [depth_to_array(depth) for depth in sensors_data[1:7]]
         lidar_points = sensors_data[0]
 
@@ -55,8 +64,18 @@ def objects_filter(data):
 
         data["agents_data"][agent]["visible_actors"] = []
 
-        for act in actors:
-            kitti_datapoint, carla_datapoint, nuscene_datapoint = lidar_visible(agent, act, snapshot, images, lidar_points, intrinsic, extrinsic)
+        num_lidar_pts = lidar_points_in_actors(pose, states, rows, lidar_points, world_to_lidar)
+        # the rig has depth cameras with FILTER_CONFIG.DEPTH_OCCLUSION of the cfg they were spawned from,
+        # they come after the six rgb cameras, see SynchronyModel.spawn_agent
+        depth = calibration.depth_cameras
+        if depth:
+            truncated, occluded = depth_occlusion(states, rows, [sensors_data[i] for i in depth],
+                                                  calibration.intrinsics[depth], calibration.world_to_sensors(pose, depth))
+        else:
+            truncated, occluded = np.zeros(len(actors)), np.zeros(len(actors), dtype=int)
+        for i, act in enumerate(actors):
+            kitti_datapoint, carla_datapoint, nuscene_datapoint = lidar_visible(pose, states, rows[i], images, num_lidar_pts[i], intrinsic, world_to_lidar,
+                                                                                truncated[i], occluded[i])
             if kitti_datapoint is not None:
                 data["agents_data"][agent]["visible_actors"].append(act)
                 kitti_datapoints.append(kitti_datapoint)
@@ -81,36 +100,26 @@ def visualize(lidar_array, bbox_3d):
     coor = o3d.geometry.TriangleMesh.create_coordinate_frame()
     o3d.visualization.draw_geometries([pcd, bbox_3d, coor])
 
-def lidar_visible(agent, actor, snapshot, rgb_image, lidar_points, intrinsic, extrinsic):
+def lidar_visible(pose, states, row, rgb_image, num_lidar_pts, intrinsic, world_to_lidar, truncated=0, occluded=0):
     '''
-    Use lidar to filter visible objects
+    Use lidar to filter visible objects, pose is the agent transform of the frame, row the row of the actor in the
+    ActorStates of the frame, num_lidar_pts is the number of lidar points inside the 3d box of the actor, see
+    lidar_points_in_actors. truncated and occluded come from depth_occlusion.
     '''
+    if num_lidar_pts < 10:
+        # lidar invisible
+        return None, None, None
+
+    id = int(states.ids[row])
+    x, y, z, pitch, yaw, roll = states.transforms[row].tolist()
+    obj_tp = states.types[row]
+    midpoint = np.dot(world_to_lidar, [x, y, z, 1.0])
+    rotation_y = degrees_to_radians(yaw - pose.rotation.yaw) % math.pi
+    ext = carla.Vector3D(*states.extents[row].tolist())
+    truncated = float(truncated)
+    occluded = int(occluded)
 
-    # obj_transform = obj.transform if isinstance(obj, carla.EnvironmentObject) else obj.get_transform()
-    id = actor.id
-    obj = snapshot.find(id)
-    obj_transform = obj.get_transform()
-    # obj_bbox = obj.bounding_box
-    # if isinstance(obj, carla.EnvironmentObject):
-    #     vertices_pos2d = bbox_2d_from_agent(intrinsic, extrinsic, obj_bbox, obj_transform, 0)
-    # else:
-    #     vertices_pos2d = bbox_2d_from_agent(intrinsic, extrinsic, obj_bbox, obj_transform, 1)
-
-    obj_tp = obj_type(actor)
-    midpoint = midpoint_from_agent_location(obj_transform.location, extrinsic)
-    # bbox_2d = calc_projected_2d_bbox(vertices_pos2d)
-    rotation_y = get_relative_rotation_y(agent.get_transform().rotation, obj_transform.rotation) % math.pi
-    ext = actor.bounding_box.extent
-    truncated = 0
-    occluded = 0
-
-    velocity = "0 0 0" if isinstance(obj, carla.EnvironmentObject) else\
-        "{} {} {}".format(obj.get_velocity().x, obj.get_velocity().y, obj.get_velocity().z)
-    acceleration = "0 0 0" if isinstance(obj, carla.EnvironmentObject) else \
-        "{} {} {}".format(obj.get_acceleration().x, obj.get_acceleration().y, obj.get_acceleration().z)
-    angular_velocity = "0 0 0" if isinstance(obj, carla.EnvironmentObject) else\
-        "{} {} {}".format(obj.get_angular_velocity().x, obj.get_angular_velocity().y, obj.get_angular_velocity().z)
-    # draw_3d_bounding_box(rgb_image, vertices_pos2d)
+    velocity, acceleration, angular_velocity = states.velocities[row].tolist()
 
     kitti_data = KittiDescriptor()
     kitti_data.set_truncated(truncated)
@@ -132,64 +141,135 @@ def lidar_visible(agent, actor, snapshot, rgb_image, lidar_points, intrinsic, ex
     nuscenes_data.set_attribute_tokens([])
     nuscenes_data.set_visibility_token("")
     size = [ext.x*2, ext.y*2, ext.z*2]
-    loc = obj_transform.location
-    loc = [-loc.x, loc.y, loc.z]
+    loc = [-x, y, z]
     if obj_tp == "Car":
         # TODO remove hard coded category
         nuscenes_data.set_category("vehicle.car")
         loc[2] += size[2]/2
-        midpoint[2] += size[2]/2
     else:
         nuscenes_data.set_category("human.pedestrian.adult")
-    rot = obj_transform.rotation
-    quat = get_quaternion_from_euler(rot.pitch, rot.yaw+180, rot.roll, to_rad=True)
+    quat = get_quaternion_from_euler(pitch, yaw+180, roll, to_rad=True)
     nuscenes_data.set_translation(loc)
     nuscenes_data.set_rotation(quat)
     nuscenes_data.set_size([size[1], size[0], size[2]])
-    center = midpoint[0:3]
-    quat_relative = get_quaternion_from_euler(0, rotation_y, 0)
-    R = Quaternion(quat_relative).rotation_matrix
-    extent = np.array(size)
-    bbox_3d = o3d.geometry.OrientedBoundingBox(center=center, R=R, extent=extent)
-
-    lidar_array = lidar_to_array(lidar_points)[:,:3]
-    num_lidar_pts = len(bbox_3d.get_point_indices_within_bounding_box(o3d.utility.Vector3dVector(lidar_array)))
-    if num_lidar_pts < 10:
-        # lidar invisible
-        return None, None, None
-    nuscenes_data.set_num_lidar_pts(num_lidar_pts)
+    nuscenes_data.set_num_lidar_pts(int(num_lidar_pts))
 
     return kitti_data, carla_data, nuscenes_data
 
-def is_visible_by_bbox(agent, obj, rgb_image, depth_images, intrinsic, extrinsic):
+def lidar_points_in_actors(pose, states, rows, lidar_points, world_to_lidar):
+    '''
+    Count the lidar points inside the 3d box of the actors at rows of states. The sweep is converted once and
+    all boxes are moved to the lidar frame as arrays, returns num_lidar_pts for each actor.
+    '''
+    lidar_array = lidar_to_array(lidar_points)[:, :3]
+    transforms = states.transforms[rows]
+
+    locations = np.ones((len(rows), 4))
+    locations[:, :3] = transforms[:, :3]
+    sizes = states.extents[rows] * 2
+    # the box rotation in lidar frame is the inverse of the relative yaw (see get_quaternion_from_euler)
+    yaws = -(degrees_to_radians(transforms[:, 4] - pose.rotation.yaw) % math.pi)
+    centers = np.dot(locations, world_to_lidar.T)[:, :3]
+    # the location of a vehicle is at the bottom of its box
+    is_car = states.is_car[rows]
+    centers[is_car, 2] += sizes[is_car, 2] / 2
+
+    return count_points_in_boxes(lidar_array, centers, yaws, sizes)
+
+
+def depth_occlusion(states, rows, depth_images, intrinsics, world_to_cameras):
+    '''
+    KITTI truncated/occluded of the actors at rows of states from the depth cameras, intrinsics (C,3,3) and world_to_cameras (C,4,4)
+    come from the rig calibration. Each depth image is converted once and all vertices of all actors are
+    tested against all cameras, the camera seeing most vertices is kept.
+    '''
+    if not len(rows):
+        return np.zeros(0), np.zeros(0, dtype=int)
+    depth_maps = np.stack([depth_to_array(depth) for depth in depth_images])
+    vertices = actor_box_vertices(states, rows)
+    pos2d, depth, in_canvas, _ = project_to_cameras(vertices, intrinsics, world_to_cameras,
+                                                    depth_maps.shape[2], depth_maps.shape[1])
+    num_visible_vertices, num_vertices_outside_camera = calculate_occlusion_stats(pos2d, depth, in_canvas, depth_maps)
+    best = np.argmax(num_visible_vertices, axis=0)
+    index = np.arange(len(rows))
+    return occlusion_from_stats(num_visible_vertices[best, index], num_vertices_outside_camera[best, index])
+
+
+def count_points_in_boxes(points, centers, yaws, sizes):
+    '''
+    Count the points inside each box, boundaries included (same as open3d OrientedBoundingBox).
+    points (N,3), centers (M,3), yaws (M,) rotation of each box around z, sizes (M,3) full box lengths.
+    Points are sorted along x once and each box only tests the points in the x-slab of its bounding
+    sphere, the candidate (box, point) pairs are tested vectorised for groups of boxes with at most
+    MAX_CANDIDATE_PAIRS pairs together.
+    '''
+    num_boxes = centers.shape[0]
+    if num_boxes == 0 or points.shape[0] == 0:
+        return np.zeros(num_boxes, dtype=np.int64)
+    order = np.argsort(points[:, 0], kind="stable")
+    xs = points[order, 0]
+    radius = np.linalg.norm(sizes, axis=1) / 2
+    lo = np.searchsorted(xs, centers[:, 0] - radius, side="left")
+    hi = np.searchsorted(xs, centers[:, 0] + radius, side="right")
+    ends = np.cumsum(hi - lo)
+    counts = np.empty(num_boxes, dtype=np.int64)
+    first = 0
+    while first < num_boxes:
+        done = ends[first - 1] if first > 0 else 0
+        last = max(int(np.searchsorted(ends, done + MAX_CANDIDATE_PAIRS, side="right")), first + 1)
+        group = slice(first, last)
+        counts[group] = count_slab_points(points, order, lo[group], hi[group], centers[group], yaws[group], sizes[group])
+        first = last
+    return counts
+
+
+def count_slab_points(points, order, lo, hi, centers, yaws, sizes):
+    ''' count_points_in_boxes for boxes whose candidates are order[lo:hi] '''
+    num_boxes = centers.shape[0]
+    lengths = hi - lo
+    box_ids = np.repeat(np.arange(num_boxes), lengths)
+    # index of every candidate in the sorted points: lo of its box plus its offset inside the slab
+    offsets = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+    candidates = order[np.arange(box_ids.shape[0]) + offsets]
+
+    d = points[candidates] - centers[box_ids]
+    cos = np.cos(yaws)[box_ids]
+    sin = np.sin(yaws)[box_ids]
+    half = sizes[box_ids] / 2
+    inside = (np.abs(cos * d[:, 0] + sin * d[:, 1]) <= half[:, 0]) & \
+             (np.abs(cos * d[:, 1] - sin * d[:, 0]) <= half[:, 1]) & \
+             (np.abs(d[:, 2]) <= half[:, 2])
+    return np.bincount(box_ids[inside], minlength=num_boxes)
+
+
+def is_visible_by_bbox(agent, obj, rgb_image, depth_image, intrinsic, extrinsic):
     obj_transform = obj.transform if isinstance(obj, carla.EnvironmentObject) else obj.get_transform()
     obj_bbox = obj.bounding_box
+    world_to_camera = world_to_sensor_matrices([extrinsic])
     if isinstance(obj, carla.EnvironmentObject):
-        vertices_pos2d = bbox_2d_from_agent(intrinsic, extrinsic, obj_bbox, obj_transform, 0)
+        bbox_to_world = bbox_to_world_matrix(obj_bbox, obj_transform, 0)
     else:
-        vertices_pos2d = bbox_2d_from_agent(intrinsic, extrinsic, obj_bbox, obj_transform, 1)
+        bbox_to_world = bbox_to_world_matrix(obj_bbox, obj_transform, 1)
+    ext = obj_bbox.extent
+    bbox = transform_points(bbox_to_world[None], vertices_from_extents([[ext.x, ext.y, ext.z]]))
+    pos2d, depth, in_canvas, bbox_2d = project_to_cameras(bbox, intrinsic, world_to_camera, WINDOW_WIDTH, WINDOW_HEIGHT)
 
-    num_visible_vertices, num_vertices_outside_camera = calculate_occlusion_stats(vertices_pos2d, depth_images)
+    num_visible_vertices, num_vertices_outside_camera = calculate_occlusion_stats(pos2d, depth, in_canvas, depth_image[None])
+    num_visible_vertices, num_vertices_outside_camera = num_visible_vertices[0, 0], num_vertices_outside_camera[0, 0]
     if num_visible_vertices >= MIN_VISIBLE_VERTICES_FOR_RENDER and num_vertices_outside_camera < MAX_OUT_VERTICES_FOR_RENDER:
         obj_tp = obj_type(obj)
-        midpoint = midpoint_from_agent_location(obj_transform.location, extrinsic)
-        bbox_2d = calc_projected_2d_bbox(vertices_pos2d)
+        midpoint = midpoint_from_agent_location(obj_transform.location, world_to_camera[0])
+        bbox_2d = [int(x) for x in bbox_2d[0, 0]]
         rotation_y = get_relative_rotation_y(agent.get_transform().rotation, obj_transform.rotation) % math.pi
         ext = obj.bounding_box.extent
-        truncated = num_vertices_outside_camera / 8
-        if num_visible_vertices >= 6:
-            occluded = 0
-        elif num_visible_vertices >= 4:
-            occluded = 1
+        truncated, occluded = occlusion_from_stats(num_visible_vertices, num_vertices_outside_camera)
+        truncated, occluded = float(truncated), int(occluded)
+
+        if isinstance(obj, carla.EnvironmentObject):
+            velocity = acceleration = angular_velocity = (0, 0, 0)
         else:
-            occluded = 2
-
-        velocity = "0 0 0" if isinstance(obj, carla.EnvironmentObject) else\
-            "{} {} {}".format(obj.get_velocity().x, obj.get_velocity().y, obj.get_velocity().z)
-        acceleration = "0 0 0" if isinstance(obj, carla.EnvironmentObject) else \
-            "{} {} {}".format(obj.get_acceleration().x, obj.get_acceleration().y, obj.get_acceleration().z)
-        angular_velocity = "0 0 0" if isinstance(obj, carla.EnvironmentObject) else\
-            "{} {} {}".format(obj.get_angular_velocity().x, obj.get_angular_velocity().y, obj.get_angular_velocity().z)
+            velocity, acceleration, angular_velocity = [(vec.x, vec.y, vec.z) for vec in
+                                                        [obj.get_velocity(), obj.get_acceleration(), obj.get_angular_velocity()]]
         # draw_3d_bounding_box(rgb_image, vertices_pos2d)
 
         kitti_data = KittiDescriptor()
@@ -228,130 +308,75 @@ def get_relative_rotation_y(agent_rotation, obj_rotation):
     return degrees_to_radians(rot_car - rot_agent)
 
 
-def bbox_2d_from_agent(intrinsic_mat, extrinsic, obj_bbox, obj_transform, obj_tp):
-    extrinsic_mat = np.mat(extrinsic.get_matrix())
-    bbox = vertices_from_extension(obj_bbox.extent)
+def bbox_2d_from_agent(intrinsic_mat, world_to_camera, obj_bbox, obj_transform, obj_tp):
+    """ 返回bbox八个顶点在图片中的坐标和深度 [(y_2d, x_2d, depth)]，批量计算见 projection_utils.project_to_cameras """
+    # 获取bbox在世界坐标系下的点的坐标
+    bbox_to_world = bbox_to_world_matrix(obj_bbox, obj_transform, obj_tp)
+    ext = obj_bbox.extent
+    bbox = transform_points(bbox_to_world[None], vertices_from_extents([[ext.x, ext.y, ext.z]]))
+    # 将世界坐标系下的bbox八个点转换到二维图片中
+    pos2d, depth, _, _ = project_to_cameras(bbox, intrinsic_mat, world_to_camera[None], WINDOW_WIDTH, WINDOW_HEIGHT)
+    return [(y_2d, x_2d, vertex_depth) for (x_2d, y_2d), vertex_depth in zip(pos2d[0, 0], depth[0, 0])]
+
+
+def bbox_to_world_matrix(obj_bbox, obj_transform, obj_tp):
+    """ bbox局部坐标系到世界坐标系的变换矩阵 (4,4)，obj_tp 为 0 时是 environment object（bbox位置为世界坐标） """
     if obj_tp == 1:
         bbox_transform = carla.Transform(obj_bbox.location, obj_bbox.rotation)
-        bbox = transform_points(bbox_transform, bbox)
     else:
         box_location = carla.Location(obj_bbox.location.x-obj_transform.location.x,
                                       obj_bbox.location.y-obj_transform.location.y,
                                       obj_bbox.location.z-obj_transform.location.z)
         box_rotation = obj_bbox.rotation
         bbox_transform = carla.Transform(box_location, box_rotation)
-        bbox = transform_points(bbox_transform, bbox)
-    # 获取bbox在世界坐标系下的点的坐标
-    bbox = transform_points(obj_transform, bbox)
-    # 将世界坐标系下的bbox八个点转换到二维图片中
-    vertices_pos2d = vertices_to_2d_coords(bbox, intrinsic_mat, extrinsic_mat)
-    return vertices_pos2d
-
-
-def vertices_from_extension(ext):
-    """ 以自身为原点的八个点的坐标 """
-    return np.array([
-        [ext.x, ext.y, ext.z],  # Top left front
-        [- ext.x, ext.y, ext.z],  # Top left back
-        [ext.x, - ext.y, ext.z],  # Top right front
-        [- ext.x, - ext.y, ext.z],  # Top right back
-        [ext.x, ext.y, - ext.z],  # Bottom left front
-        [- ext.x, ext.y, - ext.z],  # Bottom left back
-        [ext.x, - ext.y, - ext.z],  # Bottom right front
-        [- ext.x, - ext.y, - ext.z]  # Bottom right back
-    ])
-
-
-def transform_points(transform, points):
-    """ 作用：将三维点坐标转换到指定坐标系下 """
-    # 转置
-    points = points.transpose()
-    # [[X0..,Xn],[Y0..,Yn],[Z0..,Zn],[1,..1]]  (4,8)
-    points = np.append(points, np.ones((1, points.shape[1])), axis=0)
-    # transform.get_matrix() 获取当前坐标系向相对坐标系的旋转矩阵
-    points = np.mat(transform.get_matrix()) * points
-    # 返回前三行
-    return points[0:3].transpose()
-
-
-def vertices_to_2d_coords(bbox, intrinsic_mat, extrinsic_mat):
-    """将bbox在世界坐标系中的点投影到该相机获取二维图片的坐标和点的深度"""
-    vertices_pos2d = []
-    for vertex in bbox:
-        # 获取点在world坐标系中的向量
-        pos_vector = vertex_to_world_vector(vertex)
-        # 将点的world坐标转换到相机坐标系中
-        transformed_3d_pos = proj_to_camera(pos_vector, extrinsic_mat)
-        # 将点的相机坐标转换为二维图片的坐标
-        pos2d = proj_to_2d(transformed_3d_pos, intrinsic_mat)
-        # 点实际的深度
-        vertex_depth = pos2d[2]
-        # 点在图片中的坐标
-        x_2d, y_2d = pos2d[0], pos2d[1]
-        vertices_pos2d.append((y_2d, x_2d, vertex_depth))
-    return vertices_pos2d
-
-
-def vertex_to_world_vector(vertex):
-    """ 以carla世界向量（X，Y，Z，1）返回顶点的坐标 （4,1）"""
-    return np.array([
-        [vertex[0, 0]],  # [[X,
-        [vertex[0, 1]],  # Y,
-        [vertex[0, 2]],  # Z,
-        [1.0]  # 1.0]]
-    ])
-
-
-def calculate_occlusion_stats(vertices_pos2d, depth_images):
-    """ 作用：筛选bbox八个顶点中实际可见的点 """
-    num_visible_vertices = 0
-    num_vertices_outside_camera = 0
-
-    for y_2d, x_2d, vertex_depth in vertices_pos2d:
-        # 点在可见范围中，并且没有超出图片范围
-        if MAX_RENDER_DEPTH_IN_METERS > vertex_depth > 0 and point_in_canvas((y_2d, x_2d)):
-            is_occluded = point_is_occluded(
-                (y_2d, x_2d), vertex_depth, depth_image)
-            if not is_occluded:
-                num_visible_vertices += 1
-        else:
-            num_vertices_outside_camera += 1
-    return num_visible_vertices, num_vertices_outside_camera
-
-
-def point_in_canvas(pos):
-    if (pos[0] >= 0) and (pos[0] < WINDOW_HEIGHT) and (pos[1] >= 0) and (pos[1] < WINDOW_WIDTH):
-        return True
-    return False
-
-
-def point_is_occluded(point, vertex_depth, depth_image):
-    y, x = map(int, point)
-    from itertools import product
-    neigbours = product((1, -1), repeat=2)
-    is_occluded = []
-    for dy, dx in neigbours:
-        if point_in_canvas((dy + y, dx + x)):
-            # 判断点到图像的距离是否大于对应深度图像的深度值
-            if depth_image[y + dy, x + dx] < vertex_depth:
-                is_occluded.append(True)
-            else:
-                is_occluded.append(False)
-    # 当四个邻居点都大于深度图像值时，点被遮挡。返回true
-    return all(is_occluded)
-
-
-def midpoint_from_agent_location(location, extrinsic):
-    """ 将agent在世界坐标系中的中心点转换到相机坐标系下 """
-    extrinsic_mat = np.mat(extrinsic.get_matrix())
-    midpoint_vector = np.array([
-        [location.x],  # [[X,
-        [location.y],  # Y,
-        [location.z],  # Z,
-        [1.0]  # 1.0]]
-    ])
-    transformed_3d_midpoint = proj_to_camera(midpoint_vector, extrinsic_mat)
-    return transformed_3d_midpoint
+    return np.dot(transform_to_matrix(obj_transform), transform_to_matrix(bbox_transform))
+
+
+def actor_box_vertices(states, rows):
+    """ states 中 rows 行的actor的bbox八个顶点在世界坐标系下的坐标 (N,8,3) """
+    return transform_points(states.bbox_to_world[rows], vertices_from_extents(states.extents[rows]))
+
+
+def calculate_occlusion_stats(pos2d, depth, in_canvas, depth_maps):
+    """
+    作用：批量筛选所有相机中所有bbox顶点实际可见的点
+    pos2d (C,N,8,2), depth (C,N,8), in_canvas (C,N,8) are the outputs of project_to_cameras,
+    depth_maps (C,H,W) the depth_to_array images of the same cameras.
+    :return: num_visible_vertices, num_vertices_outside_camera (C,N)
+    """
+    # 点在可见范围中，并且没有超出图片范围
+    in_range = in_canvas & (depth < MAX_RENDER_DEPTH_IN_METERS)
+    visible = in_range & ~vertices_occluded(pos2d, depth, depth_maps)
+    return visible.sum(axis=-1), (~in_range).sum(axis=-1)
+
+
+def vertices_occluded(pos2d, depth, depth_maps):
+    """ 当四个对角邻居点的深度图像值都小于点的深度时，点被遮挡（图片外的邻居不参与判断） """
+    height, width = depth_maps.shape[1:]
+    cams = np.arange(depth_maps.shape[0]).reshape((-1,) + (1,) * (depth.ndim - 1))
+    # truncate like int(), clipping first keeps far away vertices from overflowing
+    x = np.nan_to_num(np.clip(pos2d[..., 0], -2, width + 1)).astype(np.int64)
+    y = np.nan_to_num(np.clip(pos2d[..., 1], -2, height + 1)).astype(np.int64)
+    is_occluded = np.ones(depth.shape, dtype=bool)
+    for dy, dx in ((1, 1), (1, -1), (-1, 1), (-1, -1)):
+        ny, nx = y + dy, x + dx
+        neighbour_in_canvas = (ny >= 0) & (ny < height) & (nx >= 0) & (nx < width)
+        neighbour_depth = depth_maps[cams, np.clip(ny, 0, height - 1), np.clip(nx, 0, width - 1)]
+        is_occluded &= ~neighbour_in_canvas | (neighbour_depth < depth)
+    return is_occluded
+
+
+def occlusion_from_stats(num_visible_vertices, num_vertices_outside_camera):
+    """ 由可见顶点数和图片外顶点数得到KITTI的 truncated 和 occluded """
+    truncated = num_vertices_outside_camera / 8
+    occluded = np.where(num_visible_vertices >= 6, 0, np.where(num_visible_vertices >= 4, 1, 2))
+    return truncated, occluded
+
+
+def midpoint_from_agent_location(location, world_to_sensor):
+    """ 将agent在世界坐标系中的中心点转换到传感器坐标系下，world_to_sensor 见 world_to_sensor_matrices """
+    midpoint_vector = np.array([location.x, location.y, location.z, 1.0])
+    return np.dot(world_to_sensor, midpoint_vector)
 
 
 def camera_intrinsic(width, height, fov):
@@ -363,36 +388,33 @@ def camera_intrinsic(width, height, fov):
     return k
 
 
-def proj_to_camera(pos_vector, extrinsic_mat):
-    """ 作用：将点的world坐标转换到相机坐标系中 """
-    # inv求逆矩阵
-    transformed_3d_pos = np.dot(inv(extrinsic_mat), pos_vector)
-    return transformed_3d_pos
-
-
-def proj_to_2d(camera_pos_vector, intrinsic_mat):
-    """将相机坐标系下的点的3d坐标投影到图片上"""
-    cords_x_y_z = camera_pos_vector[:3, :]
-    cords_y_minus_z_x = np.concatenate([cords_x_y_z[1, :], -cords_x_y_z[2, :], cords_x_y_z[0, :]])
-    pos2d = np.dot(intrinsic_mat, cords_y_minus_z_x)
-    # normalize the 2D points
-    pos2d = np.array([
-        pos2d[0] / pos2d[2],
-        pos2d[1] / pos2d[2],
-        pos2d[2]
-    ])
-    return pos2d
-
-
 def filter_by_distance(data_dict, dis):
+    """
+    每个 agent 保留距离小于 dis 的 environment objects 和 actors（不含 agent 自身），写入 agents_data 中该 agent 的
+    environment_objects、actors 及其在 actor_states 中的行 actor_rows，data_dict 中的为所有 agent 的并集。
+    The static objects are looked up in the grid of environment_index (see spatial_index.py), the actors of the
+    tick are tested against all agents at once.
+    """
     environment_objects = data_dict["environment_objects"]
-    actors = data_dict["actors"]
-    for agent,_ in data_dict["agents_data"].items():
-        data_dict["environment_objects"] = [obj for obj in environment_objects if
-                                            distance_between_locations(obj.transform.location, agent.get_location())
-                                            <dis]
-        data_dict["actors"] = [act for act in actors if
-                                            distance_between_locations(act.get_location(), agent.get_location())<dis]
+    states = data_dict["actor_states"]
+    agents_data = data_dict["agents_data"]
+    centers = np.array([[agent_data["pose"].location.x, agent_data["pose"].location.y]
+                        for agent_data in agents_data.values()]).reshape(-1, 2)
+    agent_ids = np.array([agent.id for agent in agents_data], dtype=np.int64)
+    object_indices = data_dict["environment_index"].query(centers, dis)
+    # (A,N) distance of every actor to every agent
+    dx = states.transforms[None, :, 0] - centers[:, 0, None]
+    dy = states.transforms[None, :, 1] - centers[:, 1, None]
+    near = (np.sqrt(dx * dx + dy * dy) < dis) & (states.ids[None] != agent_ids[:, None])
+    near_objects, near_actors = {}, {}
+    for i, agent_data in enumerate(agents_data.values()):
+        agent_data["environment_objects"] = [environment_objects[j] for j in object_indices[i]]
+        agent_data["actor_rows"] = np.flatnonzero(near[i])
+        agent_data["actors"] = [states.actors[row] for row in agent_data["actor_rows"]]
+        near_objects.update((obj.id, obj) for obj in agent_data["environment_objects"])
+        near_actors.update((act.id, act) for act in agent_data["actors"])
+    data_dict["environment_objects"] = list(near_objects.values())
+    data_dict["actors"] = list(near_actors.values())
 
 
 def distance_between_locations(location1, location2):
@@ -401,8 +423,8 @@ def distance_between_locations(location1, location2):
 def calc_projected_2d_bbox(vertices_pos2d):
     """ 根据八个顶点的图片坐标，计算二维bbox的左上和右下的坐标值 """
     legal_pos2d = list(filter(lambda x: x is not None, vertices_pos2d))
-    y_coords, x_coords = [int(x[0][0]) for x in legal_pos2d], [
-        int(x[1][0]) for x in legal_pos2d]
+    y_coords, x_coords = [int(x[0]) for x in legal_pos2d], [
+        int(x[1]) for x in legal_pos2d]
     min_x, max_x = min(x_coords), max(x_coords)
     min_y, max_y = min(y_coords), max(y_coords)
     return [min_x, min_y, max_x, max_y]
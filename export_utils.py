@@ -4,6 +4,7 @@ This file contains all the methods responsible for saving the generated data in
 """
 
 from fileinput import filename
+import io
 import numpy as np
 from PIL import Image
 import os
@@ -11,6 +12,10 @@ import logging
 import math
 import carla
 
+from image_converter import buffer_view
+
+CAMS = ['CAM_BACK', 'CAM_BACK_RIGHT', 'CAM_FRONT_RIGHT', 'CAM_FRONT', 'CAM_FRONT_LEFT', 'CAM_BACK_LEFT']
+
 def save_ref_files(OUTPUT_FOLDER, id):
     """ Appends the id of the given record to the files """
     for name in ['train.txt', 'val.txt', 'trainval.txt']:
@@ -20,29 +25,68 @@ def save_ref_files(OUTPUT_FOLDER, id):
         logging.info("Wrote reference files to %s", path)
 
 
-def save_image_data(path, images, id):
-    cams = ['CAM_BACK', 'CAM_BACK_RIGHT', 'CAM_FRONT_RIGHT', 'CAM_FRONT', 'CAM_FRONT_LEFT', 'CAM_BACK_LEFT']
-    for cam, image in zip(cams, images):
-        filename = path.format(cam, id)
+# 图片编码格式（文件扩展名，同时写入 sample_data 的 fileformat）-> PIL 的格式名
+IMAGE_CODECS = {"png": "PNG", "jpg": "JPEG", "webp": "WEBP"}
+
+def image_codec(save_config):
+    """ 由 SAVE_CONFIG 得到图片格式和 PIL 的编码参数 """
+    image_format = save_config["IMAGE_FORMAT"]
+    if image_format == "png":
+        params = {"compress_level": save_config["PNG_COMPRESS_LEVEL"]}
+    elif image_format in IMAGE_CODECS:
+        params = {"quality": save_config["IMAGE_QUALITY"]}
+    else:
+        raise ValueError("Unsupported IMAGE_FORMAT {}, expected one of {}".format(image_format, list(IMAGE_CODECS)))
+    return image_format, params
+
+def save_image_data(path, images, id, image_format="png", params=None):
+    for cam, image in zip(CAMS, images):
+        save_camera_image(path.format(cam, id), image, image_format, params)
+
+def save_camera_image(filename, image, image_format="png", params=None):
+    """ Encodes the BGRA buffer of a carla image without copying it to numpy first.
+        PIL releases the GIL while encoding, so the cameras are encoded in parallel by the writer threads.
+    """
+    logging.info("Wrote image data to %s", filename)
+    camera_to_pil(image).save(filename, IMAGE_CODECS[image_format], **(params or {}))
+
+def camera_to_pil(image):
+    return Image.frombuffer("RGB", (image.width, image.height), image.raw_data, "raw", "BGRX", 0, 1)
+
+def encode_camera_image(image, image_format="png", params=None, filename=None):
+    """ 编码为图片文件的内容（用于 shard 输出），给定 filename 时同时写入文件 """
+    buffer = io.BytesIO()
+    camera_to_pil(image).save(buffer, IMAGE_CODECS[image_format], **(params or {}))
+    data = buffer.getvalue()
+    if filename is not None:
+        with open(filename, "wb") as f:
+            f.write(data)
         logging.info("Wrote image data to %s", filename)
-        image.save_to_disk(filename)
+    return data
 
 def save_bbox_image_data(filename, image):
     im = Image.fromarray(image)
     im.save(filename)
 
 def lidar_to_array(point_cloud):
-    point_cloud = np.copy(np.frombuffer(point_cloud.raw_data, dtype=np.dtype('f4')))
-    point_cloud = np.reshape(point_cloud, (int(point_cloud.shape[0] / 4), 4))
-    point_cloud = point_cloud[:, :-1]
-
-    # TODO use variable intensity
-    # TODO refactor to nuscenes export_utils
-    lidar_array = [[point[0], point[1], point[2], 1.0]
-                    for point in point_cloud]
-    lidar_array = np.array(lidar_array).astype(np.float32)
+    """ 将carla的raw lidar数据转换为 (N,4) 的 float32 数组 (x, y, z, intensity)，仍在carla坐标系下
+        The array is a read-only view of point_cloud.raw_data, no copy is made.
+    """
+    return buffer_view(point_cloud.raw_data, np.dtype('f4'), (-1, 4))
 
-    return lidar_array
+def lidar_to_nuscenes_array(lidar_array):
+    """ Converts an (N,4) carla lidar array to the (N,5) float32 layout of the nuscenes .bin files
+        (x, y, z, intensity, ring index). Flipping y to get a right-handed frame and then rotating by
+        -90 degrees around z reduces to swapping the x and y columns, so the result is filled column by column.
+    """
+    nuscenes_array = np.empty((lidar_array.shape[0], 5), dtype=np.float32)
+    nuscenes_array[:, 0] = lidar_array[:, 1]
+    nuscenes_array[:, 1] = lidar_array[:, 0]
+    nuscenes_array[:, 2] = lidar_array[:, 2]
+    nuscenes_array[:, 3] = lidar_array[:, 3]
+    # TODO ring index is not provided by carla
+    nuscenes_array[:, 4] = 0
+    return nuscenes_array
 
 def save_lidar_data(filename, point_cloud, format="bin"):
     """ Saves lidar data to given filename, according to the lidar data format.
@@ -69,32 +113,27 @@ def save_lidar_data(filename, point_cloud, format="bin"):
     logging.info("Wrote lidar data to %s", filename)
 
     if format == "bin":
-        point_cloud = np.copy(np.frombuffer(point_cloud.raw_data, dtype=np.dtype('f4')))
-        point_cloud = np.reshape(point_cloud, (int(point_cloud.shape[0] / 4), 4))
-        point_cloud = point_cloud[:, :-1]
-
-        # TODO use variable intensity
-        rot_matrix = np.mat([
-            [0,1,0],
-            [-1,0,0],
-            [0,0,1]
-        ])
-
-        lidar_array = [[-point[0], point[1], point[2]] for point in point_cloud]
-        lidar_array = np.array(lidar_array).astype(np.float32)
-        # transform to right-handed coords
-        lidar_array = np.array(np.dot(rot_matrix, lidar_array.T).T)
-        lidar_array = [[point[0], point[1], point[2], 1.0, 0] for point in lidar_array]
-        lidar_array = np.array(lidar_array).astype(np.float32)
-        logging.debug("Lidar min/max of x: {} {}".format(
-                      lidar_array[:, 0].min(), lidar_array[:, 0].max()))
-        logging.debug("Lidar min/max of y: {} {}".format(
-                      lidar_array[:, 1].min(), lidar_array[:, 0].max()))
-        logging.debug("Lidar min/max of z: {} {}".format(
-                      lidar_array[:, 2].min(), lidar_array[:, 0].max()))
+        lidar_array = lidar_to_nuscenes_array(lidar_to_array(point_cloud))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Lidar min/max of x: {} {}".format(
+                          lidar_array[:, 0].min(), lidar_array[:, 0].max()))
+            logging.debug("Lidar min/max of y: {} {}".format(
+                          lidar_array[:, 1].min(), lidar_array[:, 1].max()))
+            logging.debug("Lidar min/max of z: {} {}".format(
+                          lidar_array[:, 2].min(), lidar_array[:, 2].max()))
         lidar_array.tofile(filename)
 
 
+def encode_lidar_data(point_cloud, filename=None):
+    """ 与 save_lidar_data 相同的 .bin 内容，给定 filename 时同时写入文件 """
+    data = lidar_to_nuscenes_array(lidar_to_array(point_cloud)).tobytes()
+    if filename is not None:
+        with open(filename, "wb") as f:
+            f.write(data)
+        logging.info("Wrote lidar data to %s", filename)
+    return data
+
+
 def save_label_data(filename, datapoints):
     with open(filename, 'w') as f:
         out_str = "\n".join([str(point) for point in datapoints if point])
@@ -7,6 +7,17 @@ import numpy as np
 import math
 import json
 
+SCENE_NAME = "scene-{}"
+CAN_BUS_FILE = "scene_{:06}.txt"
+
+def scene_id_of(scene_name):
+    """ SCENE_NAME 格式的场景名对应的 scene_id """
+    return int(scene_name[len(SCENE_NAME.format("")):])
+
+def can_bus_id(scene_id):
+    """ scene_id 在 init_scene 中先递增，scene-N 的 can_bus 数据保存在 can_bus/scene_{N+1}.txt（CAN_BUS_FILE） """
+    return scene_id + 1
+
 def append_json(filename, dict):
     with open(filename, "r") as f:
         content = json.load(f)
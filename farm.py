@@ -0,0 +1,235 @@
+"""
+Data farm: one generator process per CARLA server, merged into a single dataset.
+
+Every endpoint `host:port:tm_port` of FARM_CONFIG.ENDPOINTS (or --endpoints) gets a worker process that runs
+generator.run against that server. The SCENE_NUM scenes are split between the workers, each worker records
+a disjoint range of scene ids (scene-N) and frame ids under `<ROOT_PATH>/workers/worker-NN/` and has its own
+token namespace (see tokens.py). When all workers are done their outputs are merged into `<ROOT_PATH>/training`
+as if one process had recorded every scene, and the worker folders are removed.
+
+    python farm.py --endpoints gpu0:2000:8000 gpu0:2002:8002 gpu1:2000:8000
+"""
+
+import os
+import json
+import time
+import copy
+import random
+import shutil
+import argparse
+import traceback
+import concurrent.futures
+
+import generator
+from config import cfg_from_yaml_file
+from table_writer import TableWriter
+from shard_writer import INDEX_FILE, SHARD_NAME
+import tokens
+
+PHASE = "training"
+VERSION = "mini"
+WORKERS_FOLDER = "workers"
+# 采集过程中增长的表，按 worker 顺序拼接
+GROWING_TABLES = ["ego_pose", "scene", "sample", "sample_data", "sample_annotation", "instance"]
+STATIC_TABLES = ["sensor", "calibrated_sensor", "category"]
+DATA_FOLDERS = ["image", "velodyne", "can_bus"]
+REF_FILES = ["train.txt", "val.txt", "trainval.txt"]
+
+
+def parse_endpoint(endpoint):
+    """ "host:port:tm_port" -> (host, port, tm_port) """
+    host, port, tm_port = endpoint.rsplit(":", 2)
+    return host, int(port), int(tm_port)
+
+
+def worker_configs(cfg, endpoints, seed=None):
+    """ 每个 endpoint 一个配置：CARLA 服务器、不重叠的场景和帧编号、输出目录和 token namespace """
+    num_scenes = cfg["SAVE_CONFIG"]["SCENE_NUM"]
+    assert num_scenes >= len(endpoints), "{} scenes for {} workers".format(num_scenes, len(endpoints))
+    assert len(endpoints) <= 256, "at most 256 workers"
+    # SAVE_CONFIG.TOKEN_SEED or a random seed per farm run, the low byte of the namespace is the worker index
+    if seed is None:
+        seed = cfg["SAVE_CONFIG"]["TOKEN_SEED"]
+    if seed is None:
+        seed = random.getrandbits(40)
+    worker_cfgs = []
+    # SCENE_NUM scenes per agent, every scene period of a worker records NUM_AGENTS scenes
+    num_agents = cfg["AGENT_CONFIG"]["NUM_AGENTS"]
+    first_period = 0
+    for i, endpoint in enumerate(endpoints):
+        worker_cfg = copy.deepcopy(cfg)
+        host, port, tm_port = parse_endpoint(endpoint)
+        worker_cfg["CARLA_CONFIG"].update(HOST=host, PORT=port, TM_PORT=tm_port)
+        scenes = num_scenes // len(endpoints) + (i < num_scenes % len(endpoints))
+        save_cfg = worker_cfg["SAVE_CONFIG"]
+        save_cfg["ROOT_PATH"] = os.path.join(cfg["SAVE_CONFIG"]["ROOT_PATH"], WORKERS_FOLDER, "worker-{:02}".format(i))
+        save_cfg["SCENE_NUM"] = scenes
+        save_cfg["FIRST_SCENE_ID"] = cfg["SAVE_CONFIG"]["FIRST_SCENE_ID"] + first_period * num_agents
+        save_cfg["FIRST_FRAME_ID"] = cfg["SAVE_CONFIG"]["FIRST_FRAME_ID"] + \
+            first_period * num_agents * cfg["SAVE_CONFIG"]["SAMPLE_PER_SCENE"]
+        worker_cfg["FARM_CONFIG"]["TOKEN_NAMESPACE"] = tokens.worker_namespace(seed, i)
+        metrics_path, ext = os.path.splitext(cfg["METRICS_CONFIG"]["PATH"])
+        worker_cfg["METRICS_CONFIG"]["PATH"] = "{}-worker-{:02}{}".format(metrics_path, i, ext)
+        worker_cfgs.append(worker_cfg)
+        first_period += scenes
+    return worker_cfgs
+
+
+def run_worker(cfg, model_factory=None):
+    """ 在 worker 进程中运行，返回 (样本数, 耗时) """
+    start = time.perf_counter()
+    model = model_factory(cfg) if model_factory is not None else None
+    num_samples = generator.run(cfg, model)
+    return num_samples, time.perf_counter() - start
+
+
+def _move(src, dst):
+    if os.path.exists(dst):
+        raise FileExistsError("{} already exists in the merged dataset".format(dst))
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(src, dst)
+
+
+def _read_table(table_root, table_name):
+    with open(os.path.join(table_root, "{}.json".format(table_name))) as f:
+        return json.load(f)
+
+
+def merge(worker_folders, output_folder):
+    """
+    合并各 worker 的 training 目录（按场景顺序）到 output_folder，数据文件被移动到 output_folder
+    :return: number of samples of the merged dataset
+    """
+    table_root = os.path.join(output_folder, VERSION)
+    if os.path.exists(os.path.join(table_root, "sample.json")):
+        raise FileExistsError("{} already contains a dataset".format(table_root))
+    os.makedirs(table_root, exist_ok=True)
+
+    # sensors and calibrations of the first worker, the others are mapped by channel
+    first_root = os.path.join(worker_folders[0], VERSION)
+    for table_name in STATIC_TABLES:
+        shutil.copyfile(os.path.join(first_root, "{}.json".format(table_name)),
+                        os.path.join(table_root, "{}.json".format(table_name)))
+    calib_by_channel = {sensor["channel"]: sensor["calib_token"] for sensor in _read_table(first_root, "sensor")}
+
+    tables = TableWriter(table_root, GROWING_TABLES)
+    num_samples = 0
+    num_shards = 0
+    try:
+        for folder in worker_folders:
+            worker_root = os.path.join(folder, VERSION)
+            calib_map = {sensor["calib_token"]: calib_by_channel[sensor["channel"]]
+                         for sensor in _read_table(worker_root, "sensor")}
+            for table_name in GROWING_TABLES:
+                records = _read_table(worker_root, table_name)
+                if table_name == "sample_data":
+                    for record in records:
+                        record["calibrated_sensor_token"] = calib_map[record["calibrated_sensor_token"]]
+                elif table_name == "sample":
+                    num_samples += len(records)
+                tables.extend(table_name, records)
+
+            # frame and scene ids of the workers do not overlap, the files keep their names
+            for data_folder in DATA_FOLDERS:
+                for parent, _, names in os.walk(os.path.join(folder, data_folder)):
+                    for name in names:
+                        src = os.path.join(parent, name)
+                        _move(src, os.path.join(output_folder, os.path.relpath(src, folder)))
+            for name in REF_FILES:
+                if os.path.exists(os.path.join(folder, name)):
+                    with open(os.path.join(folder, name)) as src, open(os.path.join(output_folder, name), "a") as dst:
+                        shutil.copyfileobj(src, dst)
+            num_shards = _merge_shards(os.path.join(folder, "shards"), os.path.join(output_folder, "shards"), num_shards)
+            columnar = os.path.join(folder, "columnar")
+            if os.path.isdir(columnar):
+                for table_name in os.listdir(columnar):
+                    for partition in os.listdir(os.path.join(columnar, table_name)):
+                        _move(os.path.join(columnar, table_name, partition),
+                              os.path.join(output_folder, "columnar", table_name, partition))
+    finally:
+        tables.close()
+    return num_samples
+
+
+def _merge_shards(src_folder, dst_folder, num_shards):
+    """ shard 重新编号后移动，index 中的 shard 名称同步修改 """
+    if not os.path.isdir(src_folder):
+        return num_shards
+    os.makedirs(dst_folder, exist_ok=True)
+    renamed = {}
+    for name in sorted(os.listdir(src_folder)):
+        if name.startswith("shard-") and name.endswith(".tar"):
+            renamed[name] = SHARD_NAME.format(num_shards)
+            _move(os.path.join(src_folder, name), os.path.join(dst_folder, renamed[name]))
+            num_shards += 1
+    with open(os.path.join(src_folder, INDEX_FILE)) as src, open(os.path.join(dst_folder, INDEX_FILE), "a") as dst:
+        for line in src:
+            entry = json.loads(line)
+            entry["shard"] = renamed[entry["shard"]]
+            dst.write(json.dumps(entry) + "\n")
+    return num_shards
+
+
+def run_farm(cfg, endpoints, model_factory=None, keep_workers=False):
+    """
+    :param model_factory: cfg -> SynchronyModel-like object, e.g. a fake server; None connects to the endpoints
+    :return: report with the samples and samples/s of every worker and of the whole farm
+    """
+    workers_root = os.path.join(cfg["SAVE_CONFIG"]["ROOT_PATH"], WORKERS_FOLDER)
+    if os.path.exists(workers_root):
+        raise FileExistsError("{} is left from a previous farm run, merge or remove it first".format(workers_root))
+    worker_cfgs = worker_configs(cfg, endpoints)
+    start = time.perf_counter()
+    results = [None] * len(worker_cfgs)
+    failures = []
+    with concurrent.futures.ProcessPoolExecutor(len(worker_cfgs)) as pool:
+        futures = {pool.submit(run_worker, worker_cfg, model_factory): i for i, worker_cfg in enumerate(worker_cfgs)}
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception:
+                failures.append("worker-{:02} ({}): {}".format(i, endpoints[i], traceback.format_exc()))
+    collect_s = time.perf_counter() - start
+    if failures:
+        # the outputs of the workers are kept for inspection
+        raise RuntimeError("farm workers failed:\n" + "\n".join(failures))
+
+    num_samples = merge([os.path.join(worker_cfg["SAVE_CONFIG"]["ROOT_PATH"], PHASE) for worker_cfg in worker_cfgs],
+                        os.path.join(cfg["SAVE_CONFIG"]["ROOT_PATH"], PHASE))
+    if not keep_workers:
+        shutil.rmtree(workers_root)
+    elapsed = time.perf_counter() - start
+    return {
+        "workers": [{"endpoint": endpoint, "scenes": worker_cfg["SAVE_CONFIG"]["SCENE_NUM"] * worker_cfg["AGENT_CONFIG"]["NUM_AGENTS"],
+                     "samples": samples,
+                     "samples_per_s": samples / seconds}
+                    for endpoint, worker_cfg, (samples, seconds) in zip(endpoints, worker_cfgs, results)],
+        "samples": num_samples,
+        "collect_s": collect_s,
+        "merge_s": elapsed - collect_s,
+        "samples_per_s": num_samples / elapsed,
+    }
+
+
+def print_report(report):
+    print("{:<28} {:>7} {:>8} {:>10}".format("endpoint", "scenes", "samples", "samples/s"))
+    for worker in report["workers"]:
+        print("{:<28} {:>7} {:>8} {:>10.2f}".format(worker["endpoint"], worker["scenes"], worker["samples"],
+                                                     worker["samples_per_s"]))
+    print("{} samples, collect {:.1f} s, merge {:.1f} s, {:.2f} samples/s".format(
+        report["samples"], report["collect_s"], report["merge_s"], report["samples_per_s"]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="configs_bev.yaml")
+    parser.add_argument("--endpoints", nargs="+", help="host:port:tm_port, overrides FARM_CONFIG.ENDPOINTS")
+    parser.add_argument("--keep-workers", action="store_true", help="keep the worker folders after merging")
+    args = parser.parse_args()
+    cfg = cfg_from_yaml_file(args.config)
+    print_report(run_farm(cfg, args.endpoints or cfg["FARM_CONFIG"]["ENDPOINTS"], keep_workers=args.keep_workers))
+
+
+if __name__ == '__main__':
+    main()
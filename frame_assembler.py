@@ -0,0 +1,88 @@
+"""
+Collects the sensor measurements of a frame as they arrive.
+
+Every sensor writes into the assembler from its CARLA callback, keyed by the frame id, instead of into its
+own queue that tick() has to drain. wait(frame) returns as soon as the last sensor of that frame arrived,
+raises TimeoutError naming the missing sensors, and frees everything older than the requested frame.
+At most max_pending frames are kept, so the ticks that are not captured can not pile up measurements.
+"""
+
+import time
+import logging
+import threading
+
+
+class FrameAssembler:
+    def __init__(self, sensor_names, max_pending=4):
+        """
+        :param sensor_names: one name per slot, used for the diagnostics
+        :param max_pending: frames kept before the oldest incomplete one is dropped
+        """
+        self.sensor_names = list(sensor_names)
+        self.max_pending = max_pending
+        self.frames = {}
+        self.counts = {}
+        self.requested = -1
+        self.dropped_stale = 0
+        self.dropped_frames = 0
+        self.cond = threading.Condition()
+
+    def callback(self, slot):
+        """ 传给 sensor.listen 的回调 """
+        return lambda data: self.put(slot, data)
+
+    def put(self, slot, data):
+        frame = data.frame
+        with self.cond:
+            measurements = self.frames.get(frame)
+            if frame < self.requested or measurements is None and len(self.frames) >= self.max_pending and \
+                    frame < min(self.frames):
+                # a late measurement of a frame that was already returned, given up or would be dropped at once
+                self.dropped_stale += 1
+                return
+            if measurements is None:
+                measurements = self.frames[frame] = [None] * len(self.sensor_names)
+                self.counts[frame] = 0
+                if len(self.frames) > self.max_pending:
+                    self._drop(min(self.frames))
+            if measurements[slot] is None:
+                self.counts[frame] += 1
+            measurements[slot] = data
+            if self.counts[frame] == len(measurements) and frame == self.requested:
+                self.cond.notify_all()
+
+    def _drop(self, frame):
+        del self.frames[frame]
+        del self.counts[frame]
+        self.dropped_frames += 1
+
+    def wait(self, frame, timeout):
+        """ 等待 frame 的所有传感器数据，按 slot 顺序返回 """
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.requested = frame
+            for old in [f for f in self.frames if f < frame]:
+                self._drop(old)
+            while self.counts.get(frame) != len(self.sensor_names):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(self._diagnostics(frame, timeout))
+                self.cond.wait(remaining)
+            self.counts.pop(frame)
+            return self.frames.pop(frame)
+
+    def skip(self, frame):
+        """ frame 不采集：已收到的数据被释放，之后到达的直接丢弃 """
+        with self.cond:
+            self.requested = frame + 1
+            for old in [f for f in self.frames if f <= frame]:
+                self._drop(old)
+
+    def _diagnostics(self, frame, timeout):
+        measurements = self.frames.get(frame) or [None] * len(self.sensor_names)
+        missing = [name for name, data in zip(self.sensor_names, measurements) if data is None]
+        message = "frame {}: no data from {} after {:.1f} s (pending frames {}, dropped {} frames and {} late " \
+                  "measurements)".format(frame, ", ".join(missing), timeout, sorted(self.frames), self.dropped_frames,
+                                         self.dropped_stale)
+        logging.error(message)
+        return message
@@ -1,12 +1,18 @@
 from DataSave import DataSave
 from SynchronyModel import SynchronyModel
+from capture_scheduler import CaptureScheduler
 from config import cfg_from_yaml_file
 from data_utils import objects_filter
+from metrics import metrics
+import tokens
 
-def main():
-    cfg = cfg_from_yaml_file("configs_bev.yaml")
-    model = SynchronyModel(cfg)
+def run(cfg, model=None):
+    """ 采集 SCENE_NUM 个场景，model 默认为连接 CARLA_CONFIG 中服务器的 SynchronyModel，返回采集的样本数 """
+    tokens.configure(cfg)
+    model = model if model is not None else SynchronyModel(cfg)
     dtsave = DataSave(cfg)
+    metrics.configure(cfg["METRICS_CONFIG"])
+    num_samples = 0
     try:
         model.set_synchrony()
         model.spawn_actors()
@@ -16,26 +22,39 @@ def main():
         dtsave.init_scene()
 
         step = 0
-        STEP = cfg["SAVE_CONFIG"]["STEP"]
+        scheduler = CaptureScheduler.from_cfg(cfg)
         SAMPLE_PER_SCENE = cfg["SAVE_CONFIG"]["SAMPLE_PER_SCENE"]
-        SCENE_NUM = cfg["SAVE_CONFIG"]["SCENE_NUM"]
+        # every agent records SCENE_NUM scenes
+        LAST_SCENE_ID = cfg["SAVE_CONFIG"]["FIRST_SCENE_ID"] + cfg["SAVE_CONFIG"]["SCENE_NUM"] * cfg["AGENT_CONFIG"]["NUM_AGENTS"]
         while True:
-            if step % STEP == 0:
+            model.set_listening(scheduler.listening(step))
+            if scheduler.is_capture(step):
                 data = model.tick()
                 data = objects_filter(data)
                 dtsave.timestamp = data["timestamp"]
                 dtsave.save_training_files(data)
                 dtsave.save_sample()
+                num_samples += len(data["agents_data"])
                 if dtsave.sample_id % SAMPLE_PER_SCENE == 0 and dtsave.sample_id > 0:
                     dtsave.save_scene()
-                    if dtsave.scene_id == SCENE_NUM:
+                    if dtsave.scene_id == LAST_SCENE_ID:
                         break
                     dtsave.init_scene()
             else:
-                model.world.tick()
+                model.skip_tick()
             step += 1
+            metrics.maybe_export()
     finally:
-        model.setting_recover()
+        try:
+            # drain the pending writes before the sensors are destroyed
+            dtsave.close()
+        finally:
+            model.setting_recover()
+            metrics.close()
+    return num_samples
+
+def main():
+    run(cfg_from_yaml_file("configs_bev.yaml"))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
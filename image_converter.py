@@ -1,30 +1,37 @@
 import numpy as np
 
 
+def buffer_view(raw_data, dtype, shape):
+    """
+    作用： 将carla数据的 raw_data 包装为只读的 numpy 数组，不复制数据
+    The measurement owns the buffer and the writer threads read it concurrently, so the view is read-only.
+    """
+    array = np.frombuffer(raw_data, dtype=dtype).reshape(shape)
+    array.flags.writeable = False
+    return array
+
+
 def depth_to_array(image):
     """
     作用： 将carla获取的raw depth_image转换成深度图
+    depth = (R + G * 256 + B * 256 * 256) / (256 ** 3 - 1) km, computed in one float32 image from the BGRA view
     """
-    array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-    array = np.reshape(array, (image.height, image.width, 4))  # RGBA format
-    array = array[:, :, :3]  # Take only RGB
-    array = array[:, :, ::-1]  # BGR
-    array = array.astype(np.float32)  # 2ms
-    gray_depth = ((array[:, :, 0] + array[:, :, 1] * 256.0 + array[:, :, 2] * 256.0 * 256.0) / (
-            (256.0 * 256.0 * 256.0) - 1))  # 2.5ms
-    gray_depth = 1000 * gray_depth
+    array = to_bgra_array(image)
+    gray_depth = array[:, :, 2].astype(np.float32)
+    gray_depth += np.multiply(array[:, :, 1], 256.0, dtype=np.float32)
+    gray_depth += np.multiply(array[:, :, 0], 256.0 * 256.0, dtype=np.float32)
+    gray_depth /= np.float32((256.0 * 256.0 * 256.0) - 1)
+    gray_depth *= np.float32(1000)
     return gray_depth
 
 
 def to_bgra_array(image):
-    """Convert a CARLA raw image to a BGRA numpy array."""
-    array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-    array = np.reshape(array, (image.height, image.width, 4))
-    return array
+    """Convert a CARLA raw image to a read-only BGRA numpy view."""
+    return buffer_view(image.raw_data, np.dtype("uint8"), (image.height, image.width, 4))
 
 
 def to_rgb_array(image):
-    """Convert a CARLA raw image to a RGB numpy array."""
+    """Convert a CARLA raw image to a RGB numpy view, the channels are reversed without a copy."""
     array = to_bgra_array(image)
     array = array[:, :, :3]
     array = array[:, :, ::-1]
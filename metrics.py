@@ -0,0 +1,153 @@
+"""
+Per-stage timing of the collection loop.
+
+Stages are timed with `metrics.timed(name)` (decorator) or `metrics.timer(name)` (context manager)
+and aggregated into cumulative histograms, which are written every METRICS_CONFIG.INTERVAL seconds,
+either appended as one JSON line per export or as a Prometheus text file that is replaced atomically.
+While disabled both only check a flag, so the instrumentation can stay in the code.
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+import functools
+import contextlib
+
+# 直方图的桶上界（秒），最后一个桶为 +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_DISABLED = contextlib.nullcontext()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """ 由桶估计分位数，桶内线性插值 """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": self.counts,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.format = "jsonl"
+        self.interval = 10
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.last_export = time.monotonic()
+
+    def configure(self, config):
+        """ config 为 METRICS_CONFIG，ENABLE 为 False 时不做任何统计 """
+        self.enabled = bool(config["ENABLE"])
+        self.path = config["PATH"]
+        self.format = config["FORMAT"]
+        self.interval = config["INTERVAL"]
+        self.histograms = {}
+        self.last_export = time.monotonic()
+        if self.enabled and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name):
+        if not self.enabled:
+            return _DISABLED
+        return self._timer(name)
+
+    @contextlib.contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def maybe_export(self):
+        """ 在采集循环中调用，距上次导出超过 INTERVAL 秒时写出 """
+        if self.enabled and time.monotonic() - self.last_export >= self.interval:
+            self.export()
+
+    def export(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            stages = {name: histogram.to_json() for name, histogram in sorted(self.histograms.items())}
+        self.last_export = time.monotonic()
+        if self.format == "prometheus":
+            self._write_prometheus(stages)
+        else:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "buckets": BUCKETS, "stages": stages}) + "\n")
+
+    def _write_prometheus(self, stages):
+        lines = ["# TYPE carla2dataset_stage_seconds histogram"]
+        for name, stage in stages.items():
+            cumulative = 0
+            for upper, n in zip(BUCKETS + ("+Inf",), stage["buckets"]):
+                cumulative += n
+                lines.append('carla2dataset_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(name, upper, cumulative))
+            lines.append('carla2dataset_stage_seconds_sum{{stage="{}"}} {}'.format(name, stage["sum"]))
+            lines.append('carla2dataset_stage_seconds_count{{stage="{}"}} {}'.format(name, stage["count"]))
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self.export()
+        self.enabled = False
+
+
+metrics = Metrics()
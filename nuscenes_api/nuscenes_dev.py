@@ -5,6 +5,7 @@ import json
 import math
 import os
 import os.path as osp
+import shutil
 import sys
 import time
 from datetime import datetime
@@ -36,6 +37,243 @@ if not PYTHON_VERSION == 3:
     raise ValueError("nuScenes dev-kit only supports Python version 3.")
 
 
+def _build_field_index(table: Iterable[dict], field: str):
+    """ Value -> tokens of the records with that value, None if the values can not be used as dict keys. """
+    index = dict()
+    try:
+        for member in table:
+            index.setdefault(member[field], []).append(member['token'])
+    except TypeError:
+        return None
+    return index
+
+
+class ColumnarTable:
+    """
+    A table that is read on first access and kept column by column instead of as a list of dicts.
+    Strings are fixed width byte arrays, numbers and fixed length number lists are numpy arrays and
+    everything else is stored as json text. The columns are cached as .npy files under
+    <table_root>/.columnar/<table_name>/ and memory-mapped on the next load, the cache is rebuilt
+    when the json file changes.
+    Records are created on access, so changes to a returned record are not kept.
+    """
+
+    CACHE_FOLDER = '.columnar'
+
+    def __init__(self, table_root: str, table_name: str, on_load=None):
+        """
+        :param table_root: Folder of the json tables.
+        :param table_name: Table name.
+        :param on_load: Called with the table once its columns are loaded, used to add decorations.
+        """
+        self.table_root = table_root
+        self.table_name = table_name
+        self._on_load = on_load
+        self._columns = None
+        self._groups = {}
+        self._hashes = None
+        self._order = None
+
+    def _load(self) -> dict:
+        if self._columns is None:
+            self._columns = self.__load_columns__()
+            if self._on_load is not None:
+                self._on_load(self)
+        return self._columns
+
+    def __load_columns__(self) -> dict:
+        json_path = osp.join(self.table_root, '{}.json'.format(self.table_name))
+        cache_path = osp.join(self.table_root, self.CACHE_FOLDER, self.table_name)
+        stat = os.stat(json_path)
+        source = [stat.st_mtime_ns, stat.st_size]
+        meta_path = osp.join(cache_path, 'meta.json')
+        if osp.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['source'] == source:
+                # plain ndarray views of the maps, indexing np.memmap itself is much slower
+                return {name: (kind, np.load(osp.join(cache_path, '{}.npy'.format(i)), mmap_mode='r').view(np.ndarray))
+                        for i, (name, kind) in enumerate(meta['fields'])}
+
+        with open(json_path) as f:
+            records = json.load(f)
+        fields = {}
+        for record in records:
+            for name in record:
+                fields.setdefault(name, None)
+        columns = {name: self.__build_column__([record.get(name, ColumnarTable) for record in records])
+                   for name in fields}
+        del records
+
+        try:
+            tmp_path = cache_path + '.tmp'
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            for i, (kind, column) in enumerate(columns.values()):
+                np.save(osp.join(tmp_path, '{}.npy'.format(i)), column)
+            with open(osp.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump({'source': source, 'fields': [[name, kind] for name, (kind, _) in columns.items()]}, f)
+            shutil.rmtree(cache_path, ignore_errors=True)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            # e.g. a read-only dataset, the columns are still used from memory
+            print('Could not cache table {}: {}'.format(self.table_name, e))
+        return columns
+
+    @staticmethod
+    def __build_column__(values: list) -> Tuple[str, np.ndarray]:
+        """ Chooses the storage of a column, the class itself marks a missing field. """
+        types = set(type(value) for value in values)
+        try:
+            if types == {str}:
+                return 'str', np.array([value.encode() for value in values], dtype=bytes)
+            if types == {bool}:
+                return 'num', np.array(values, dtype=bool)
+            if types == {int}:
+                return 'num', np.array(values, dtype=np.int64)
+            if types <= {int, float} and types:
+                return 'num', np.array(values, dtype=np.float64)
+            if types == {list} and len(set(len(value) for value in values)) == 1:
+                item_types = set(type(item) for value in values for item in value)
+                if item_types == {int}:
+                    return 'vec', np.array(values, dtype=np.int64)
+                if item_types <= {int, float} and item_types:
+                    return 'vec', np.array(values, dtype=np.float64)
+        except OverflowError:
+            pass
+        return 'json', np.array([b'' if value is ColumnarTable else json.dumps(value).encode() for value in values],
+                                dtype=bytes)
+
+    def add_column(self, name: str, values: np.ndarray) -> None:
+        """ Adds a str column (byte array), e.g. a decoration computed from other tables. """
+        self._load()[name] = ('str', values)
+
+    def add_group(self, name: str, owner_tokens: np.ndarray, values: np.ndarray, keys: np.ndarray = None) -> None:
+        """
+        Adds a field listing the values of another table grouped by the record they point to, in the order
+        of that table. With keys the field is a dict, later values overwrite earlier ones like dict assignment.
+        """
+        rows = self.indices(owner_tokens)
+        order = np.argsort(rows, kind='stable')
+        offsets = np.searchsorted(rows[order], np.arange(len(self) + 1))
+        self._groups[name] = (offsets, values[order], None if keys is None else keys[order])
+
+    def column(self, name: str) -> np.ndarray:
+        """ The raw column, str columns are byte arrays. """
+        return self._load()[name][1]
+
+    def __len__(self) -> int:
+        return len(self.column('token'))
+
+    def __iter__(self):
+        for ind in range(len(self)):
+            yield self[ind]
+
+    def __getitem__(self, ind: int) -> dict:
+        record = dict()
+        for name, (kind, column) in self._load().items():
+            value = column[ind]
+            if kind == 'str':
+                record[name] = value.decode()
+            elif kind == 'num':
+                record[name] = value.item()
+            elif kind == 'vec':
+                record[name] = value.tolist()
+            elif value:
+                record[name] = json.loads(value)
+        for name, (offsets, values, keys) in self._groups.items():
+            start, end = offsets[ind], offsets[ind + 1]
+            if keys is None:
+                record[name] = [value.decode() for value in values[start:end]]
+            else:
+                record[name] = {key.decode(): value.decode() for key, value in zip(keys[start:end], values[start:end])}
+        return record
+
+    @staticmethod
+    def __hash_tokens__(tokens: np.ndarray) -> np.ndarray:
+        """ 64 bit hash of each token of a byte array, FNV style over 8 byte words. """
+        width = tokens.dtype.itemsize
+        words = np.ascontiguousarray(tokens, dtype='S{}'.format(width + (-width) % 8)).view(np.uint64)
+        words = words.reshape(len(tokens), -1)
+        hashes = np.full(len(tokens), 0xcbf29ce484222325, dtype=np.uint64)
+        for i in range(words.shape[1]):
+            hashes = (hashes ^ words[:, i]) * np.uint64(0x100000001b3)
+        return hashes
+
+    @staticmethod
+    def __hash_token__(key: bytes, width: int) -> int:
+        """ Same as __hash_tokens__ for a single token, without creating arrays. """
+        key = key.ljust(width + (-width) % 8, b'\0')
+        hashed = 0xcbf29ce484222325
+        for i in range(0, len(key), 8):
+            hashed = ((hashed ^ int.from_bytes(key[i:i + 8], sys.byteorder)) * 0x100000001b3) & 0xffffffffffffffff
+        return hashed
+
+    def _token_index(self):
+        if self._hashes is None:
+            hashes = self.__hash_tokens__(self.column('token'))
+            self._order = np.argsort(hashes, kind='stable')
+            self._hashes = hashes[self._order]
+        return self._hashes, self._order
+
+    def index(self, token: str) -> int:
+        """ Row of a token, raises KeyError like the token2ind dict. """
+        tokens = self.column('token')
+        key = token.encode()
+        if len(key) <= tokens.dtype.itemsize:
+            hashes, order = self._token_index()
+            hashed = np.uint64(self.__hash_token__(key, tokens.dtype.itemsize))
+            for ind in order[hashes.searchsorted(hashed, 'left'):hashes.searchsorted(hashed, 'right')]:
+                if tokens[ind] == key:
+                    return int(ind)
+        raise KeyError(token)
+
+    def indices(self, tokens: np.ndarray) -> np.ndarray:
+        """ Rows of many tokens given as a byte array, raises KeyError if one is missing. """
+        own_tokens = self.column('token')
+        hashes, order = self._token_index()
+        tokens = np.asarray(tokens)
+        if tokens.dtype.itemsize > own_tokens.dtype.itemsize:
+            rows = np.array([self.index(token.decode()) for token in tokens], dtype=np.int64)
+            return rows
+        query = tokens.astype(own_tokens.dtype)
+        pos = np.minimum(np.searchsorted(hashes, self.__hash_tokens__(query)), len(order) - 1)
+        rows = order[pos] if len(order) else np.zeros(len(query), dtype=np.int64)
+        # hash collisions (or missing tokens) are resolved one by one
+        for i in np.flatnonzero(own_tokens[rows] != query) if len(order) else range(len(query)):
+            rows[i] = self.index(query[i].decode())
+        return rows
+
+    def field_index(self, field: str):
+        """
+        Value -> tokens of the records with that value, in table order. str and number columns are grouped as
+        arrays. Returns None if the values can not be used as dict keys (e.g. lists).
+        """
+        kind, column = self._load().get(field, (None, None))
+        tokens = self.column('token')
+        if kind not in ('str', 'num'):
+            return _build_field_index(self, field)
+        values, inverse = np.unique(column, return_inverse=True)
+        order = np.argsort(inverse.reshape(-1), kind='stable')
+        offsets = np.searchsorted(inverse.reshape(-1)[order], np.arange(len(values) + 1))
+        tokens = [token.decode() for token in tokens[order]]
+        values = [value.decode() for value in values] if kind == 'str' else values.tolist()
+        return {value: tokens[offsets[i]:offsets[i + 1]] for i, value in enumerate(values)}
+
+    def field2token(self, field: str, query) -> List[str]:
+        """ Same as NuScenes.field2token, str and number columns are compared as arrays. """
+        columns = self._load()
+        tokens = self.column('token')
+        kind, column = columns.get(field, (None, None))
+        if kind == 'str':
+            mask = column == query.encode() if isinstance(query, str) else np.zeros(len(tokens), dtype=bool)
+        elif kind == 'num' and isinstance(query, (bool, int, float)):
+            mask = column == query
+        else:
+            mask = np.array([record[field] == query for record in self], dtype=bool)
+        return [token.decode() for token in tokens[mask]]
+
+
 class NuScenes:
     """
     Database class for nuScenes to help query and retrieve information from the database.
@@ -45,17 +283,23 @@ class NuScenes:
                  version: str = 'v1.0-mini',
                  dataroot: str = '/data/sets/nuscenes',
                  verbose: bool = True,
-                 map_resolution: float = 0.1):
+                 map_resolution: float = 0.1,
+                 lazy: bool = False):
         """
         Loads database and creates reverse indexes and shortcuts.
         :param version: Version to load (e.g. "v1.0", ...).
         :param dataroot: Path to the tables and data.
         :param verbose: Whether to print status messages during load.
         :param map_resolution: Resolution of maps (meters).
+        :param lazy: Load each table on first access as a ColumnarTable, the reverse indexes and shortcuts are
+            added when a table is loaded. Records are then created on access and changes to them are not kept.
         """
         self.version = version
         self.dataroot = dataroot
         self.verbose = verbose
+        self.lazy = lazy
+        # (table_name, field) -> (table, value -> tokens), see field2token
+        self._field_indexes = dict()
         self.table_names = ['category', 'instance', 'sensor', 'calibrated_sensor',
                             'ego_pose', 'scene', 'sample', 'sample_data', 'sample_annotation']
 
@@ -116,12 +360,16 @@ class NuScenes:
         #     map_record['mask'] = MapMask(osp.join(self.dataroot, map_record['filename']), resolution=map_resolution)
 
         if verbose:
-            for table in self.table_names:
-                print("{} {},".format(len(getattr(self, table)), table))
+            if self.lazy:
+                print("Tables are loaded on first access.")
+            else:
+                for table in self.table_names:
+                    print("{} {},".format(len(getattr(self, table)), table))
             print("Done loading in {:.3f} seconds.\n======".format(time.time() - start_time))
 
         # Make reverse indexes for common lookups.
-        self.__make_reverse_index__(verbose)
+        if not self.lazy:
+            self.__make_reverse_index__(verbose)
 
         # Initialize NuScenesExplorer class.
         self.explorer = NuScenesExplorer(self)
@@ -133,6 +381,8 @@ class NuScenes:
 
     def __load_table__(self, table_name) -> dict:
         """ Loads a table. """
+        if self.lazy:
+            return ColumnarTable(self.table_root, table_name, on_load=self.__decorate_table__)
         with open(osp.join(self.table_root, '{}.json'.format(table_name))) as f:
             table = json.load(f)
         return table
@@ -204,6 +454,24 @@ class NuScenes:
         if verbose:
             print("Done reverse indexing in {:.1f} seconds.\n======".format(time.time() - start_time))
 
+    def __decorate_table__(self, table: ColumnarTable) -> None:
+        """ Adds the shortcuts of __make_reverse_index__ to a lazily loaded table. """
+        if table.table_name == 'sample_annotation':
+            instance_rows = self.instance.indices(table.column('instance_token'))
+            category_rows = self.category.indices(self.instance.column('category_token')[instance_rows])
+            table.add_column('category_name', self.category.column('name')[category_rows])
+        elif table.table_name == 'sample_data':
+            cs_rows = self.calibrated_sensor.indices(table.column('calibrated_sensor_token'))
+            sensor_rows = self.sensor.indices(self.calibrated_sensor.column('sensor_token')[cs_rows])
+            table.add_column('sensor_modality', self.sensor.column('modality')[sensor_rows])
+            table.add_column('channel', self.sensor.column('channel')[sensor_rows])
+        elif table.table_name == 'sample':
+            key_frame = np.asarray(self.sample_data.column('is_key_frame'), dtype=bool)
+            table.add_group('data', self.sample_data.column('sample_token')[key_frame],
+                            self.sample_data.column('token')[key_frame], keys=self.sample_data.column('channel')[key_frame])
+            table.add_group('anns', self.sample_annotation.column('sample_token'),
+                            self.sample_annotation.column('token'))
+
     def get(self, table_name: str, token: str) -> dict:
         """
         Returns a record from table in constant runtime.
@@ -222,23 +490,71 @@ class NuScenes:
         :param token: Token of the record.
         :return: The index of the record in table, table is an array.
         """
+        if self.lazy:
+            return getattr(self, table_name).index(token)
         return self._token2ind[table_name][token]
 
+    def field_index(self, table_name: str, field: str):
+        """
+        Returns the secondary index of a field, a dict from value to the tokens of the matching records.
+        It is built on the first query of the field and rebuilt when the table is reloaded (assigned again).
+        Call clear_field_indexes after changing records in place.
+        :param table_name: Table name.
+        :param field: Field name.
+        :return: The index, or None if the values of the field can not be used as dict keys (e.g. lists).
+        """
+        table = getattr(self, table_name)
+        cached = self._field_indexes.get((table_name, field))
+        if cached is None or cached[0] is not table:
+            index = table.field_index(field) if isinstance(table, ColumnarTable) else _build_field_index(table, field)
+            cached = (table, index)
+            self._field_indexes[(table_name, field)] = cached
+        return cached[1]
+
+    def clear_field_indexes(self, table_name: str = None) -> None:
+        """
+        Drops the secondary indexes of a table, or of all tables.
+        :param table_name: Table name, None for all tables.
+        """
+        for key in list(self._field_indexes):
+            if table_name is None or key[0] == table_name:
+                del self._field_indexes[key]
+
     def field2token(self, table_name: str, field: str, query) -> List[str]:
         """
         This function queries all records for a certain field value, and returns the tokens for the matching records.
-        Warning: this runs in linear time.
+        The first query of a field builds its index (see field_index), later queries run in constant time.
+        Fields whose values can not be used as dict keys are still searched in linear time.
         :param table_name: Table name.
         :param field: Field name. See README.md for details.
         :param query: Query to match against. Needs to type match the content of the query field.
         :return: List of tokens for the matching records.
         """
+        index = self.field_index(table_name, field)
+        if index is not None:
+            try:
+                return list(index.get(query, []))
+            except TypeError:
+                # unhashable query, e.g. a list compared to a str field
+                pass
+        if self.lazy:
+            return getattr(self, table_name).field2token(field, query)
         matches = []
         for member in getattr(self, table_name):
             if member[field] == query:
                 matches.append(member['token'])
         return matches
 
+    def field2tokens(self, table_name: str, field: str, queries: Iterable) -> List[List[str]]:
+        """
+        Bulk version of field2token.
+        :param table_name: Table name.
+        :param field: Field name.
+        :param queries: Values to match against.
+        :return: For each query the list of tokens of the matching records.
+        """
+        return [self.field2token(table_name, field, query) for query in queries]
+
     def get_sample_data_path(self, sample_data_token: str) -> str:
         """ Returns the path to a sample_data. """
 
@@ -0,0 +1,76 @@
+"""
+Array based projection kernels. All objects and all cameras of a frame are projected in one call,
+each camera extrinsic is inverted once per frame.
+
+Shapes used below: N objects, C cameras, 8 box vertices.
+"""
+
+import numpy as np
+
+# 以自身为原点的八个点的符号，vertices_from_extents 按此顺序生成 bbox 的顶点
+VERTEX_SIGNS = np.array([
+    [1, 1, 1],  # Top left front
+    [-1, 1, 1],  # Top left back
+    [1, -1, 1],  # Top right front
+    [-1, -1, 1],  # Top right back
+    [1, 1, -1],  # Bottom left front
+    [-1, 1, -1],  # Bottom left back
+    [1, -1, -1],  # Bottom right front
+    [-1, -1, -1]  # Bottom right back
+], dtype=np.float64)
+
+
+def transform_to_matrix(transform):
+    """ carla.Transform -> (4,4) ndarray """
+    return np.array(transform.get_matrix(), dtype=np.float64)
+
+
+def rigid_inverse(matrices):
+    """ 刚体变换 (...,4,4) 的逆：R^T 和 -R^T t，不需要通用的矩阵求逆 """
+    inverse = np.zeros_like(matrices)
+    rotation_t = np.swapaxes(matrices[..., :3, :3], -1, -2)
+    inverse[..., :3, :3] = rotation_t
+    inverse[..., :3, 3] = -np.einsum('...ij,...j->...i', rotation_t, matrices[..., :3, 3])
+    inverse[..., 3, 3] = 1
+    return inverse
+
+
+def world_to_sensor_matrices(transforms):
+    """ 传感器 world->sensor 的变换矩阵 (C,4,4)，每个传感器只求一次逆 """
+    return np.linalg.inv(np.array([t.get_matrix() for t in transforms], dtype=np.float64))
+
+
+def vertices_from_extents(extents):
+    """ (N,3) bbox extents -> (N,8,3) box vertices around the box origin """
+    return np.asarray(extents, dtype=np.float64)[:, None, :] * VERTEX_SIGNS[None]
+
+
+def transform_points(matrices, points):
+    """ 将每个物体的点 (N,K,3) 用各自的变换矩阵 (N,4,4) 转换到目标坐标系下 """
+    return np.einsum('nij,nkj->nki', matrices[:, :3, :3], points) + matrices[:, None, :3, 3]
+
+
+def project_to_cameras(points, intrinsics, world_to_cameras, width, height):
+    """
+    将世界坐标系下的点投影到所有相机
+    :param points: (N,K,3) points in world coordinates, e.g. the box vertices of N objects
+    :param intrinsics: (3,3) shared or (C,3,3) per camera intrinsic matrices
+    :param world_to_cameras: (C,4,4) world to camera matrices, see world_to_sensor_matrices
+    :return: pos2d (C,N,K,2) image coordinates (x, y), depth (C,N,K),
+             in_canvas (C,N,K) points in front of the camera and inside the image,
+             bbox_2d (C,N,4) [min_x, min_y, max_x, max_y] of the truncated coordinates as calc_projected_2d_bbox
+    """
+    cam = np.einsum('cij,nkj->cnki', world_to_cameras[:, :3, :3], points) + world_to_cameras[:, None, None, :3, 3]
+    # carla camera axes (x forward, y right, z up) to image axes (y, -z, x)
+    cords_y_minus_z_x = np.stack([cam[..., 1], -cam[..., 2], cam[..., 0]], axis=-1)
+    intrinsics = np.broadcast_to(intrinsics, (world_to_cameras.shape[0], 3, 3))
+    proj = np.einsum('cij,cnkj->cnki', intrinsics, cords_y_minus_z_x)
+    depth = proj[..., 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pos2d = proj[..., :2] / depth[..., None]
+    x_2d, y_2d = pos2d[..., 0], pos2d[..., 1]
+    in_canvas = (depth > 0) & (y_2d >= 0) & (y_2d < height) & (x_2d >= 0) & (x_2d < width)
+    with np.errstate(invalid='ignore'):
+        pos2d_int = np.trunc(pos2d)
+    bbox_2d = np.concatenate([pos2d_int.min(axis=2), pos2d_int.max(axis=2)], axis=-1)
+    return pos2d, depth, in_canvas, bbox_2d
@@ -0,0 +1,66 @@
+"""
+Calibration of the sensor rig of an agent, computed once from SENSOR_CONFIG.
+
+The sensors are attached to the agent with the transforms of the config, so every sensor pose of a tick is the
+agent pose times a constant sensor-to-ego matrix. SynchronyModel builds the calibration when the agents are
+spawned and passes it with every tick, objects_filter and the projections only need the agent pose of the tick,
+and DataSave exports the same intrinsics and transforms as the calibrated_sensor table.
+"""
+
+import numpy as np
+
+from config import config_to_trans
+from data_utils import camera_intrinsic
+from projection_utils import transform_to_matrix, rigid_inverse
+
+DEPTH_BLUEPRINT = "sensor.camera.depth"
+
+
+class SensorCalibration:
+    def __init__(self, name, blueprint, config):
+        self.name = name
+        self.blueprint = blueprint
+        self.modality = blueprint.split(".")[1]
+        attribute = config["ATTRIBUTE"]
+        if self.modality == "camera":
+            self.width = attribute["image_size_x"]
+            self.height = attribute["image_size_y"]
+            self.intrinsic = camera_intrinsic(self.width, self.height, attribute["fov"])
+        else:
+            self.width = self.height = None
+            self.intrinsic = None
+        # location and quaternion of the calibrated_sensor table
+        self.translation = config["TRANSFORM"]["location"]
+        self.rotation = config["TRANSFORM"]["quat"]
+        self.sensor_to_ego = transform_to_matrix(config_to_trans(config["TRANSFORM"]))
+        self.ego_to_sensor = rigid_inverse(self.sensor_to_ego)
+
+
+class RigCalibration:
+    def __init__(self, sensors):
+        """ :param sensors: SensorCalibration in the order the sensors are spawned """
+        self.sensors = sensors
+        # the sensors of SENSOR_CONFIG, without the depth cameras used for the occlusion
+        self.recorded = [sensor for sensor in sensors if sensor.blueprint != DEPTH_BLUEPRINT]
+        self.depth_cameras = [i for i, sensor in enumerate(sensors) if sensor.blueprint == DEPTH_BLUEPRINT]
+        self.sensor_to_ego = np.stack([sensor.sensor_to_ego for sensor in sensors])
+        self.ego_to_sensor = np.stack([sensor.ego_to_sensor for sensor in sensors])
+        # (C,3,3), zeros for the lidar
+        self.intrinsics = np.stack([sensor.intrinsic if sensor.intrinsic is not None else np.zeros((3, 3))
+                                    for sensor in sensors])
+        # the intrinsic of the first camera, all cameras of the rig have the same one
+        self.intrinsic = next(sensor.intrinsic for sensor in sensors if sensor.intrinsic is not None)
+
+    @classmethod
+    def from_cfg(cls, cfg):
+        """ SynchronyModel.spawn_agent 的传感器顺序：SENSOR_CONFIG，DEPTH_OCCLUSION 时再加每个 rgb 相机对应的深度相机 """
+        sensors = [SensorCalibration(name, config["BLUEPRINT"], config) for name, config in cfg["SENSOR_CONFIG"].items()]
+        if cfg["FILTER_CONFIG"]["DEPTH_OCCLUSION"]:
+            sensors += [SensorCalibration(name + "_DEPTH", DEPTH_BLUEPRINT, config)
+                        for name, config in cfg["SENSOR_CONFIG"].items() if config["BLUEPRINT"] == "sensor.camera.rgb"]
+        return cls(sensors)
+
+    def world_to_sensors(self, pose, indices):
+        """ (len(indices),4,4) world->sensor 矩阵，pose 为 agent 在这一帧的 carla.Transform """
+        return np.matmul(self.ego_to_sensor[indices], rigid_inverse(transform_to_matrix(pose)))
+
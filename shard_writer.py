@@ -0,0 +1,163 @@
+"""
+Sharded tar output (WebDataset layout) for training.
+
+Every sample is written as consecutive tar members named `<key>.<name>`, e.g.
+`000012.CAM_FRONT.png`, `000012.LIDAR_TOP.bin`, `000012.annotations.json`, into
+`shard-000000.tar`, `shard-000001.tar`, ... A new shard is started once the current
+one reaches the configured size. `index.jsonl` has one line per sample with the shard
+and the offset/size of each member, so a sample can also be read without scanning. The
+index line is flushed after the members of the sample, so it never refers to unwritten data.
+
+    for sample in ShardReader("data/nuscenes/training/shards"):
+        image = decode_member("CAM_FRONT.png", sample["CAM_FRONT.png"])
+"""
+
+import io
+import os
+import json
+import time
+import tarfile
+
+import numpy as np
+from PIL import Image
+
+INDEX_FILE = "index.jsonl"
+SHARD_NAME = "shard-{:06}.tar"
+
+
+def shard_names(folder):
+    """ folder 中的 shard 文件名（按编号排序） """
+    return sorted(name for name in os.listdir(folder) if name.startswith("shard-") and name.endswith(".tar"))
+
+
+def count_samples(folder):
+    """ index.jsonl 中的样本数，folder 或索引不存在时为 0 """
+    index_path = os.path.join(folder, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return 0
+    with open(index_path) as f:
+        return sum(1 for _ in f)
+
+
+class ShardWriter:
+    def __init__(self, folder, max_shard_bytes, append=True):
+        """
+        :param append: continue after the shards of a previous run ((A)ppend), otherwise they are removed
+                       together with their index ((O)verwrite, the frame ids start again)
+        """
+        self.folder = folder
+        self.max_shard_bytes = max_shard_bytes
+        os.makedirs(folder, exist_ok=True)
+        shards = shard_names(folder)
+        if not append:
+            for name in shards:
+                os.remove(os.path.join(folder, name))
+            shards = []
+        self.shard_id = len(shards)
+        self.tar = None
+        self.num_samples = count_samples(folder) if append else 0
+        self.index = open(os.path.join(folder, INDEX_FILE), "a" if append else "w")
+
+    def _open_shard(self):
+        self.shard_name = SHARD_NAME.format(self.shard_id)
+        self.tar = tarfile.open(os.path.join(self.folder, self.shard_name), "w", format=tarfile.USTAR_FORMAT)
+        self.shard_id += 1
+
+    def write_sample(self, key, members):
+        """
+        :param key: sample key, must not contain a dot
+        :param members: {name: bytes}, written in this order
+        """
+        if self.tar is None:
+            self._open_shard()
+        entry = {"key": key, "shard": self.shard_name, "members": {}}
+        mtime = time.time()
+        for name, data in members.items():
+            info = tarfile.TarInfo("{}.{}".format(key, name))
+            info.size = len(data)
+            info.mtime = mtime
+            self.tar.addfile(info, io.BytesIO(data))
+            # addfile does not fill in offset_data, the data is padded to whole blocks before tar.offset
+            padded = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            entry["members"][name] = [self.tar.offset - padded, info.size]
+        # the members reach the file before their index line
+        self.tar.fileobj.flush()
+        self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+        self.num_samples += 1
+        if self.tar.offset >= self.max_shard_bytes:
+            self._close_shard()
+
+    def _close_shard(self):
+        self.tar.close()
+        self.tar = None
+
+    def close(self):
+        if self.tar is not None:
+            self._close_shard()
+        self.index.close()
+
+
+class ShardReader:
+    """ 顺序读取所有 shard 中的样本，每个样本为 {"__key__": key, "__shard__": shard, name: bytes} """
+    def __init__(self, folder):
+        self.folder = folder
+        self.shards = shard_names(folder)
+        self.entries = None
+
+    def __iter__(self):
+        for shard in self.shards:
+            sample = None
+            # members are read in order, the file is only read forward
+            with tarfile.open(os.path.join(self.folder, shard), "r:") as tar:
+                for info in tar:
+                    key, name = info.name.split(".", 1)
+                    if sample is None or sample["__key__"] != key:
+                        if sample is not None:
+                            yield sample
+                        sample = {"__key__": key, "__shard__": shard}
+                    sample[name] = tar.extractfile(info).read()
+            if sample is not None:
+                yield sample
+
+    def _load_index(self):
+        if self.entries is None:
+            self.entries = {}
+            with open(os.path.join(self.folder, INDEX_FILE)) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries[entry["key"]] = entry
+        return self.entries
+
+    def keys(self):
+        return list(self._load_index())
+
+    def get(self, key, names=None):
+        """ 通过索引直接读取一个样本（可只读取部分成员） """
+        entry = self._load_index()[key]
+        sample = {"__key__": key, "__shard__": entry["shard"]}
+        with open(os.path.join(self.folder, entry["shard"]), "rb") as f:
+            for name, (offset, size) in entry["members"].items():
+                if names is None or name in names:
+                    f.seek(offset)
+                    sample[name] = f.read(size)
+        return sample
+
+    def read_file(self, filename):
+        """ 读取 nuscenes 表中 sample_data 的 filename（image/CAM_FRONT/000012.png、velodyne/000012.bin） """
+        folder, basename = filename.split("/")[-2:]
+        key, ext = basename.split(".", 1)
+        name = "LIDAR_TOP.bin" if folder == "velodyne" else "{}.{}".format(folder, ext)
+        return self.get(key, [name])[name]
+
+
+def decode_member(name, data):
+    """ 图片解码为 RGB 数组，激光雷达为 (N,5) float32，json 为 python 对象 """
+    ext = name.rsplit(".", 1)[-1]
+    if ext in ("png", "jpg", "webp"):
+        return np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+    if ext == "bin":
+        return np.frombuffer(data, dtype=np.float32).reshape(-1, 5)
+    if ext == "json":
+        return json.loads(data)
+    return data
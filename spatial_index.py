@@ -0,0 +1,58 @@
+"""
+Uniform grid over the x-y locations of static objects for radius queries.
+
+get_environment_objects returns thousands of static objects of the map. SynchronyModel reads them and builds
+the grid once, filter_by_distance then only tests the objects in the cells around each agent instead of the
+whole list every tick. The points are sorted by cell, so the cells of a grid row are one contiguous range.
+"""
+
+import numpy as np
+
+
+class GridIndex:
+    def __init__(self, points, cell_size=50.0):
+        """
+        :param points: (N,2) x y of the indexed objects
+        :param cell_size: edge of a grid cell in meters, a query scans the cells within its radius
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+        cells = np.floor(self.points / self.cell_size).astype(np.int64)
+        self.origin = cells.min(axis=0) if len(cells) else np.zeros(2, dtype=np.int64)
+        self.shape = cells.max(axis=0) - self.origin + 1 if len(cells) else np.zeros(2, dtype=np.int64)
+        keys = self._keys(cells - self.origin)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def _keys(self, cells):
+        return cells[..., 0] * self.shape[1] + cells[..., 1]
+
+    def query(self, centers, radius):
+        """
+        每个 center 的 x-y 距离小于 radius 的点的下标（升序）
+        :param centers: (A,2) x y of the query centers, e.g. the agent locations
+        :return: list of A index arrays
+        """
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        if not len(self.points):
+            return [np.zeros(0, dtype=np.int64) for _ in centers]
+        lo = np.floor((centers - radius) / self.cell_size).astype(np.int64) - self.origin
+        hi = np.floor((centers + radius) / self.cell_size).astype(np.int64) - self.origin
+        lo, hi = np.maximum(lo, 0), np.minimum(hi, self.shape - 1)
+        result = []
+        for center, (x0, y0), (x1, y1) in zip(centers, lo, hi):
+            if x0 > x1 or y0 > y1:
+                result.append(np.zeros(0, dtype=np.int64))
+                continue
+            rows = np.arange(x0, x1 + 1)
+            starts = np.searchsorted(self.keys, self._keys(np.column_stack([rows, np.full_like(rows, y0)])), side="left")
+            ends = np.searchsorted(self.keys, self._keys(np.column_stack([rows, np.full_like(rows, y1)])), side="right")
+            candidates = np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
+            d = self.points[candidates] - center
+            result.append(np.sort(candidates[np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]) < radius]))
+        return result
+
+
+def environment_index(environment_objects, cell_size=50.0):
+    """ GridIndex over the transform locations of carla.EnvironmentObject """
+    return GridIndex([[obj.transform.location.x, obj.transform.location.y] for obj in environment_objects], cell_size)
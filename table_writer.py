@@ -0,0 +1,133 @@
+"""
+Append-only writer for the nuScenes json tables.
+
+During collection every record is appended as one line to a JSON Lines log
+(`<table_root>/.log/<table>.jsonl`), so the per-sample cost does not depend on the
+size of the dataset. The nuScenes array files (`<table>.json`) are materialised from
+the logs when the writer is closed. Materialisation writes to a temporary file and
+renames it over the target, and the log is only removed afterwards, so an interrupted
+run can always be finalised again with
+
+    python table_writer.py data/nuscenes/training/mini
+
+A new TableWriter does the same with the logs it finds before it starts, so restarting the
+collection after a crash keeps the recorded tables.
+"""
+
+import os
+import sys
+import json
+import logging
+
+LOG_FOLDER = ".log"
+
+
+def _log_path(table_root, table_name):
+    return os.path.join(table_root, LOG_FOLDER, "{}.jsonl".format(table_name))
+
+
+def _table_path(table_root, table_name):
+    return os.path.join(table_root, "{}.json".format(table_name))
+
+
+def materialize_table(table_root, table_name):
+    """ 将 JSON Lines 日志转换为 nuScenes 的 json 数组文件（与 json.dump(indent=2) 的输出一致）"""
+    log_path = _log_path(table_root, table_name)
+    table_path = _table_path(table_root, table_name)
+    tmp_path = table_path + ".tmp"
+    count = 0
+    with open(tmp_path, "w") as out:
+        out.write("[")
+        if os.path.exists(log_path):
+            with open(log_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a torn last line left by a crash
+                        logging.warning("Skipping truncated record in %s", log_path)
+                        continue
+                    out.write(",\n  " if count else "\n  ")
+                    out.write(json.dumps(record, indent=2).replace("\n", "\n  "))
+                    count += 1
+        out.write("\n]" if count else "]")
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, table_path)
+    logging.info("Wrote %d records to %s", count, table_path)
+    return count
+
+
+def materialize_tables(table_root):
+    """ 恢复中断的采集：将目录下残留的所有日志转换为 json 数组文件 """
+    log_folder = os.path.join(table_root, LOG_FOLDER)
+    if not os.path.isdir(log_folder):
+        return
+    for name in sorted(os.listdir(log_folder)):
+        if name.endswith(".jsonl"):
+            table_name = name[:-len(".jsonl")]
+            materialize_table(table_root, table_name)
+            os.remove(_log_path(table_root, table_name))
+
+
+class TableWriter:
+    def __init__(self, table_root, table_names, append=True):
+        """
+        :param append: continue the existing tables ((A)ppend), otherwise they are replaced by the records of
+                       this writer when it is closed ((O)verwrite)
+        """
+        self.table_root = table_root
+        self.table_names = list(table_names)
+        self.files = {}
+        os.makedirs(os.path.join(table_root, LOG_FOLDER), exist_ok=True)
+        # the logs of an interrupted run are finalised before anything is written
+        materialize_tables(table_root)
+        for table_name in self.table_names:
+            table_path = _table_path(table_root, table_name)
+            if append and os.path.exists(table_path):
+                self._continue_table(table_name)
+            self.files[table_name] = open(_log_path(table_root, table_name), "a")
+            if not os.path.exists(table_path):
+                # keep an empty but valid table on disk until the first materialisation
+                materialize_table(table_root, table_name)
+
+    def _continue_table(self, table_name):
+        """ 已有表的记录写入新的日志，日志始终包含整个表（写完后才替换，中断时不会得到不完整的日志） """
+        log_path = _log_path(self.table_root, table_name)
+        with open(_table_path(self.table_root, table_name)) as f:
+            records = json.load(f)
+        with open(log_path + ".tmp", "w") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(log_path + ".tmp", log_path)
+
+    def append(self, table_name, record):
+        self.files[table_name].write(json.dumps(record) + "\n")
+
+    def extend(self, table_name, records):
+        self.files[table_name].write("".join(json.dumps(record) + "\n" for record in records))
+
+    def flush(self):
+        """ 将日志落盘，作为场景结束时的检查点 """
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        """ 由日志生成最终的 json 数组文件并删除日志 """
+        if not self.files:
+            return
+        self.flush()
+        for table_name, f in self.files.items():
+            f.close()
+            materialize_table(self.table_root, table_name)
+            os.remove(_log_path(self.table_root, table_name))
+        self.files = {}
+
+
+if __name__ == '__main__':
+    materialize_tables(sys.argv[1])
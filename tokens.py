@@ -0,0 +1,84 @@
+"""
+Tokens of the nuscenes records.
+
+A token is 32 lowercase hex characters (128 bits) like the uuid hex tokens of nuScenes, laid out as
+
+    namespace (48 bits) | kind (8 bits) | scene (24 bits) | sample (20 bits) | item (28 bits)
+
+The namespace is SAVE_CONFIG.TOKEN_SEED << 8 | worker index, every farm worker has its own one (see farm.py),
+so the tokens of the workers can not collide when their outputs are merged. Without a seed it is drawn at
+random once per run. The records of the dataset get record_token(kind, scene, sample, item) from their ids, so
+a run with the same seed and scene ids regenerates the same tokens. new_token and new_tokens count up in the
+kind COUNTER for tokens without such ids.
+"""
+
+import random
+import threading
+
+# kinds of records
+COUNTER, SCENE, SAMPLE, EGO_POSE, SAMPLE_DATA, ANNOTATION, INSTANCE, SENSOR, CALIBRATED_SENSOR = range(9)
+
+_namespace = None
+_prefixes = None
+_next = 0
+_lock = threading.Lock()
+
+
+def set_namespace(namespace):
+    """ namespace 为 48 位整数（None 为随机），作为之后所有 token 的前 12 位 """
+    global _namespace, _prefixes
+    if namespace is None:
+        namespace = random.getrandbits(48)
+    assert 0 <= namespace < 2 ** 48
+    _namespace = namespace
+    _prefixes = ["{:012x}{:02x}".format(namespace, kind) for kind in range(256)]
+
+
+def configure(cfg):
+    """ farm worker 使用 FARM_CONFIG.TOKEN_NAMESPACE，单独运行时为 TOKEN_SEED 的第 0 个 worker """
+    namespace = cfg["FARM_CONFIG"].get("TOKEN_NAMESPACE")
+    if namespace is None and cfg["SAVE_CONFIG"]["TOKEN_SEED"] is not None:
+        namespace = worker_namespace(cfg["SAVE_CONFIG"]["TOKEN_SEED"], 0)
+    set_namespace(namespace)
+
+
+def worker_namespace(seed, worker):
+    """ 40 位的 seed 和 worker 编号（0-255）组成 namespace """
+    assert 0 <= worker < 256
+    return (seed & (2 ** 40 - 1)) << 8 | worker
+
+
+def get_namespace():
+    if _namespace is None:
+        set_namespace(None)
+    return _namespace
+
+
+def record_token(kind, scene=0, sample=0, item=0):
+    """ 由记录的编号生成的 token，scene < 2^24, sample < 2^20, item < 2^28（如 carla actor id） """
+    assert 0 <= scene < 1 << 24 and 0 <= sample < 1 << 20 and 0 <= item < 1 << 28, (scene, sample, item)
+    if _prefixes is None:
+        get_namespace()
+    return "{}{:06x}{:05x}{:07x}".format(_prefixes[kind], scene, sample, item)
+
+
+def new_tokens(num):
+    """ num 个连续编号的 token """
+    global _next
+    if _prefixes is None:
+        get_namespace()
+    with _lock:
+        start = _next
+        _next += num
+    prefix = _prefixes[COUNTER]
+    return [prefix + "{:018x}".format(i) for i in range(start, start + num)]
+
+
+def new_token():
+    global _next
+    if _prefixes is None:
+        get_namespace()
+    with _lock:
+        i = _next
+        _next += 1
+    return _prefixes[COUNTER] + "{:018x}".format(i)